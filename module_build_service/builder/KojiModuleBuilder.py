@@ -1163,6 +1163,23 @@ class KojiModuleBuilder(GenericBuilder):
 
         return weights
 
+    @classmethod
+    def get_free_build_capacity(cls):
+        """
+        Returns the free capacity of the enabled and ready Koji builders. The
+        capacity is expressed in the same units as the Koji task weights.
+
+        :rtype: float or None
+        :return: the free capacity or None when it cannot be determined.
+        """
+        koji_session = get_session(conf, login=False)
+        try:
+            hosts = koji_session.listHosts(enabled=True, ready=True)
+        except Exception:
+            log.exception("Failed to get the list of Koji builders.")
+            return None
+        return float(sum(max(host["capacity"] - host["task_load"], 0) for host in hosts))
+
     @classmethod
     def get_built_rpms_in_module_build(cls, mmd):
         """
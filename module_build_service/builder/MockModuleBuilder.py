@@ -1,17 +1,22 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import hashlib
+import json
 import logging
 import os
 import pipes
 import re
+import shutil
 import subprocess
 import threading
+import time
 
 import dnf
 import koji
 import kobo.rpmlib
 import platform
+import requests
 
 from module_build_service.builder import GenericBuilder
 from module_build_service.builder.KojiModuleBuilder import KojiModuleBuilder
@@ -241,6 +246,72 @@ def import_builds_from_local_dnf_repos(platform_id=None):
     import_fake_base_module("%s:1:000000" % platform_id)
 
 
+class MockRootCache(object):
+    """
+    Manages the directories of the mock root caches, which keep the initialized
+    chroots. Every directory belongs to a single mock config and content of its
+    repositories, so the chroots are reused between the batches and between
+    the local builds of the same module, but never when the packages installed
+    by the chroot setup could differ. The least recently used root caches are
+    removed when their total size exceeds ``mock_root_cache_max_size``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def get_dir(self, config, key):
+        """
+        Return the directory of the root cache and evict the old root caches.
+
+        :param config: the MBS config object.
+        :param str key: the digest of the mock config and of the content of its repositories.
+        :return: the path to the directory of the root cache.
+        :rtype: str
+        """
+        path = os.path.join(config.mock_root_cache_dir, key)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            # Mark the root cache as recently used.
+            os.utime(path, None)
+            self._evict(config, path)
+        return path
+
+    @staticmethod
+    def _get_size(path):
+        size = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    size += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return size
+
+    def _evict(self, config, path_in_use):
+        max_size = config.mock_root_cache_max_size * 1024 * 1024
+        root_caches = []
+        total_size = 0
+        for name in os.listdir(config.mock_root_cache_dir):
+            path = os.path.join(config.mock_root_cache_dir, name)
+            if not os.path.isdir(path) or path == path_in_use:
+                continue
+            size = self._get_size(path)
+            root_caches.append((os.path.getmtime(path), path, size))
+            total_size += size
+        total_size += self._get_size(path_in_use)
+
+        for _, path, size in sorted(root_caches):
+            if total_size <= max_size:
+                break
+            log.info("Removing the least recently used mock root cache %s", path)
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+
+mock_root_cache = MockRootCache()
+
+
 class MockModuleBuilder(GenericBuilder):
     backend = "mock"
     # Global build_id/task_id we increment when new build is executed.
@@ -348,16 +419,98 @@ class MockModuleBuilder(GenericBuilder):
         # just against this architecture.
         return [detect_arch()]
 
+    # Name of the file in the resultsdir with the data kept between the runs of _createrepo.
+    _createrepo_cache_name = ".createrepo-cache.json"
+
+    def _load_createrepo_cache(self):
+        """
+        Loads the data kept in the resultsdir by the previous run of :meth:`_createrepo`.
+
+        :return: dict with the NEVRAs of the RPMs under the "nevras" key and the state
+            of the repository under the "repo" key.
+        """
+        cache = {"nevras": {}, "repo": None}
+        if not self.config.mock_incremental_createrepo:
+            return cache
+        try:
+            with open(os.path.join(self.resultsdir, self._createrepo_cache_name)) as f:
+                cache.update(json.load(f))
+        except (IOError, ValueError):
+            pass
+        return cache
+
+    def _save_createrepo_cache(self, cache):
+        if not self.config.mock_incremental_createrepo:
+            return
+        with open(os.path.join(self.resultsdir, self._createrepo_cache_name), "w") as f:
+            json.dump(cache, f)
+
+    def _get_rpm_nevras(self, rpm_files, rpm_stats, cache):
+        """
+        Returns the NEVRAs of the RPM files in the resultsdir.
+
+        Only the RPMs which are not in the cache or which have changed since they
+        were cached are queried by `rpm -qp`, and the cache is updated with them.
+
+        :param list rpm_files: the names of the RPM files in the resultsdir.
+        :param dict rpm_stats: mapping of the RPM file names to their [size, mtime]
+            or to None if they cannot be cached.
+        :param dict cache: the NEVRAs cached by the RPM file names.
+        :return: the list of "name epoch version release arch" strings in the order
+            of `rpm_files`.
+        """
+        rpms_to_query = [
+            rpm_file for rpm_file in rpm_files
+            if rpm_stats[rpm_file] is None
+            or cache.get(rpm_file, [None, None])[:2] != rpm_stats[rpm_file]
+        ]
+        queried = {}
+        if rpms_to_query:
+            output = subprocess.check_output(
+                [
+                    "rpm",
+                    "--queryformat",
+                    "%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\n",
+                    "-qp",
+                ]
+                + rpms_to_query,
+                cwd=self.resultsdir,
+                universal_newlines=True,
+            )
+            nevras = output.strip().split("\n")
+            if len(nevras) != len(rpms_to_query):
+                raise RuntimeError("rpm -qp returned an unexpected number of lines")
+            queried = dict(zip(rpms_to_query, nevras))
+
+        # Keep just the RPMs which are still in the resultsdir.
+        for rpm_file in set(cache) - set(rpm_files):
+            del cache[rpm_file]
+        for rpm_file, nevra in queried.items():
+            if rpm_stats[rpm_file] is not None:
+                cache[rpm_file] = rpm_stats[rpm_file] + [nevra]
+
+        return [
+            queried[rpm_file] if rpm_file in queried else cache[rpm_file][2]
+            for rpm_file in rpm_files
+        ]
+
     def _createrepo(self, include_module_yaml=False):
         """
         Creates the repository using "createrepo_c" command in the resultsdir.
+
+        When ``mock_incremental_createrepo`` is enabled, the NEVRAs of the RPMs and
+        the list of RPMs in the repository are kept in the resultsdir, so only the
+        new RPMs are queried and the existing repository is only updated. When the
+        RPMs in the repository have not changed, the repository is not generated
+        again at all and only modules.yaml is injected there if asked.
         """
         log.debug("Creating repository in %s" % self.resultsdir)
         path = self.resultsdir
         repodata_path = os.path.join(path, "repodata")
+        incremental = self.config.mock_incremental_createrepo
 
         # Remove old repodata files
-        if os.path.exists(repodata_path):
+        if not incremental and os.path.exists(repodata_path):
             for name in os.listdir(repodata_path):
                 os.remove(os.path.join(repodata_path, name))
 
@@ -372,22 +525,18 @@ class MockModuleBuilder(GenericBuilder):
         artifacts = set()
 
         rpm_files = [f for f in os.listdir(self.resultsdir) if f.endswith(".rpm")]
+        rpm_stats = {}
+        for rpm_file in rpm_files:
+            try:
+                st = os.stat(os.path.join(self.resultsdir, rpm_file))
+                rpm_stats[rpm_file] = [st.st_size, st.st_mtime]
+            except OSError:
+                rpm_stats[rpm_file] = None
 
+        cache = self._load_createrepo_cache()
+        repo_state = {"pkglist": [], "modules": include_module_yaml}
         if rpm_files:
-            output = subprocess.check_output(
-                [
-                    "rpm",
-                    "--queryformat",
-                    "%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\n",
-                    "-qp",
-                ]
-                + rpm_files,
-                cwd=self.resultsdir,
-                universal_newlines=True,
-            )
-            nevras = output.strip().split("\n")
-            if len(nevras) != len(rpm_files):
-                raise RuntimeError("rpm -qp returned an unexpected number of lines")
+            nevras = self._get_rpm_nevras(rpm_files, rpm_stats, cache["nevras"])
 
             for rpm_file, nevra in zip(rpm_files, nevras):
                 name, epoch, version, release, arch = nevra.split()
@@ -399,6 +548,7 @@ class MockModuleBuilder(GenericBuilder):
 
                 pkglist_f.write(rpm_file + "\n")
                 artifacts.add("{}-{}:{}-{}.{}".format(name, epoch, version, release, arch))
+                repo_state["pkglist"].append([rpm_file, rpm_stats[rpm_file]])
 
         pkglist_f.close()
         # There is no way to replace the RPM artifacts, so remove any extra RPM artifacts
@@ -408,7 +558,25 @@ class MockModuleBuilder(GenericBuilder):
             m1_mmd.add_rpm_artifact(artifact_to_add)
 
         # Generate repo.
-        execute_cmd(["/usr/bin/createrepo_c", "--pkglist", pkglist, path])
+        repo_state["pkglist"].sort()
+        old_repo_state = cache["repo"]
+        repomd_exists = os.path.exists(os.path.join(repodata_path, "repomd.xml"))
+        if (
+            incremental
+            and repomd_exists
+            and old_repo_state
+            and old_repo_state["pkglist"] == repo_state["pkglist"]
+            and all(stats is not None for _, stats in repo_state["pkglist"])
+            # The modules.yaml injected before must not stay in the repository.
+            and (include_module_yaml or not old_repo_state["modules"])
+        ):
+            log.debug("The RPMs in %s have not changed, not regenerating the repository", path)
+        else:
+            cmd = ["/usr/bin/createrepo_c", "--pkglist", pkglist]
+            if incremental and repomd_exists:
+                # Reuse the metadata of the RPMs which have not changed.
+                cmd.append("--update")
+            execute_cmd(cmd + [path])
 
         # ...and inject modules.yaml there if asked.
         if include_module_yaml:
@@ -417,6 +585,9 @@ class MockModuleBuilder(GenericBuilder):
                 f.write(mmd_to_str(m1_mmd))
             execute_cmd(["/usr/bin/modifyrepo_c", "--mdtype=modules", mmd_path, repodata_path])
 
+        cache["repo"] = repo_state
+        self._save_createrepo_cache(cache)
+
     def _add_repo(self, name, baseurl, extra=""):
         """
         Adds repository to Mock config file. Call _write_mock_config() to
@@ -493,6 +664,78 @@ class MockModuleBuilder(GenericBuilder):
             with open(outfile, "w") as f:
                 f.write(config)
 
+    def _get_repos_digest(self):
+        """
+        Returns the digest of the content of the repositories in the mock config
+        or None if the content of some repository cannot be found out.
+        """
+        digest = hashlib.sha256()
+        for baseurl in re.findall(r"^baseurl\s*=\s*(\S+)", self.yum_conf, re.MULTILINE):
+            baseurl = baseurl.rstrip("/")
+            if baseurl == "file://" + self.resultsdir and self.config.mock_incremental_createrepo:
+                # The local repository of this module build changes after every batch,
+                # but only the packages installed by the chroot setup matter here.
+                nevras = self._load_createrepo_cache()["nevras"]
+                installed = sorted(
+                    entry[2] for entry in nevras.values() if entry[2].split()[0] in self.groups)
+                digest.update(json.dumps(installed).encode("utf-8"))
+                continue
+
+            repomd_url = baseurl + "/repodata/repomd.xml"
+            try:
+                if baseurl.startswith("file://"):
+                    with open(repomd_url[len("file://"):], "rb") as f:
+                        digest.update(f.read())
+                else:
+                    rv = requests.get(repomd_url, timeout=60)
+                    rv.raise_for_status()
+                    digest.update(rv.content)
+            except (IOError, OSError, requests.exceptions.RequestException) as e:
+                log.info("Cannot get the content of the repository %s: %s", baseurl, e)
+                return None
+        return digest.hexdigest()
+
+    def _enable_root_cache(self, mock_config):
+        """
+        Enables the root cache in the thread-related mock config, so mock reuses the
+        chroot initialized before with the same config and content of the repositories.
+        See :class:`MockRootCache`.
+
+        :param str mock_config: the path to the thread-related mock config.
+        """
+        if not self.config.mock_root_cache_dir:
+            return
+
+        with open(mock_config) as f:
+            config = f.read()
+        if re.search(r"^config_opts\['use_bootstrap(_container)?'\]\s*=\s*True", config,
+                     re.MULTILINE):
+            # The bootstrap chroot would share the root cache with the chroot.
+            log.info("Not using the mock root cache, the bootstrap chroot is enabled")
+            return
+
+        repos_digest = self._get_repos_digest()
+        if repos_digest is None:
+            log.info("Not using the mock root cache, the content of the repositories is unknown")
+            return
+
+        # The name of the root differs between the threads and the module builds,
+        # but the content of the chroot does not depend on it.
+        config = re.sub(r"^config_opts\['root'\].*$", "", config, flags=re.MULTILINE)
+        key = hashlib.sha256((config + repos_digest).encode("utf-8")).hexdigest()
+        root_cache_dir = mock_root_cache.get_dir(self.config, key)
+        log.debug("Using the mock root cache %s", root_cache_dir)
+
+        with open(mock_config, "a") as f:
+            f.write(
+                "\nconfig_opts['plugin_conf']['root_cache_enable'] = True\n"
+                "config_opts['plugin_conf']['root_cache_opts']['dir'] = {!r}\n"
+                # The config is written again before every build, but the root cache
+                # already belongs to its content.
+                "config_opts['plugin_conf']['root_cache_opts']['age_check'] = False\n"
+                .format(root_cache_dir + "/")
+            )
+
     def buildroot_connect(self, groups):
         self._load_mock_config()
         self.groups = list(set().union(groups["build"], self.groups))
@@ -643,6 +886,7 @@ class MockModuleBuilder(GenericBuilder):
 
         srpm = artifact_name
         resultsdir = builder.resultsdir
+        start_time = time.time()
         try:
             # Initialize mock.
             execute_cmd(
@@ -679,10 +923,16 @@ class MockModuleBuilder(GenericBuilder):
         mock_stdout_log.close()
         mock_stderr_log.close()
 
+        duration = time.time() - start_time
+        log.info("Building of artifact %s in Mock took %.1f seconds", artifact_name, duration)
+        with open(os.path.join(resultsdir, "time.log"), "w") as f:
+            f.write("%.1f\n" % duration)
+
         self._save_log(resultsdir, "state.log", artifact_name)
         self._save_log(resultsdir, "root.log", artifact_name)
         self._save_log(resultsdir, "build.log", artifact_name)
         self._save_log(resultsdir, "status.log", artifact_name)
+        self._save_log(resultsdir, "time.log", artifact_name)
 
         # Copy files from thread-related resultsdire to the main resultsdir.
         for name in os.listdir(resultsdir):
@@ -713,6 +963,7 @@ class MockModuleBuilder(GenericBuilder):
         self._write_mock_config()
         mock_config = os.path.join(
             self.configdir, "mock-%s.cfg" % str(threading.current_thread().name))
+        self._enable_root_cache(mock_config)
 
         # Get the build-id in thread-safe manner.
         build_id = None
@@ -757,6 +1008,34 @@ class MockModuleBuilder(GenericBuilder):
         if succeeded:
             self._createrepo(include_module_yaml=True)
 
+        build_times = self._get_build_times()
+        if build_times:
+            log.info(
+                "The component builds took %.1f seconds in total, the longest ones: %s",
+                sum(build_times.values()),
+                ", ".join(
+                    "%s (%.1f s)" % (name, build_times[name])
+                    for name in sorted(build_times, key=build_times.get, reverse=True)[:5]
+                ),
+            )
+
+    def _get_build_times(self):
+        """
+        Returns the times the component builds took, as reported by :meth:`build_srpm`.
+
+        :return: dict with the artifact names as keys and the numbers of seconds as values.
+        """
+        build_times = {}
+        for name in os.listdir(self.resultsdir):
+            if not name.endswith("-time.log"):
+                continue
+            try:
+                with open(os.path.join(self.resultsdir, name)) as f:
+                    build_times[name[:-len("-time.log")]] = float(f.read())
+            except (IOError, ValueError):
+                pass
+        return build_times
+
     @classmethod
     def get_built_rpms_in_module_build(cls, mmd):
         """
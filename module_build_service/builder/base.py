@@ -395,6 +395,17 @@ class GenericBuilder(six.with_metaclass(ABCMeta)):
         """
         return cls.compute_weights_from_build_time(components)
 
+    @classmethod
+    def get_free_build_capacity(cls):
+        """
+        Placeholder function for the builders to report the free capacity of
+        the build system, in the same units as the component build weights.
+        If this function is not overridden, then None is returned.
+
+        :return: None, meaning the capacity is unknown.
+        """
+        return None
+
     @classmethod
     def compute_weights_from_build_time(cls, components, arches=None):
         """
@@ -2,12 +2,14 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 import errno
+import fcntl
 import hashlib
 import logging
 import inspect
 from multiprocessing.dummy import Pool as ThreadPool
 import os
 import shutil
+import struct
 import subprocess
 
 import munch
@@ -71,12 +73,152 @@ def get_koji_config(mbs_config):
     return koji_config
 
 
+def get_rpm_sigmd5(path):
+    """
+    Returns the MD5 checksum of the header and the payload of the RPM. This is
+    the checksum stored in the signature header of the RPM, which Koji reports
+    as the payloadhash of the RPM.
+
+    :param str path: the path to the RPM file.
+    :return: the hex digest of the checksum.
+    :rtype: str
+    :raises ValueError: if the file is not an RPM file.
+    """
+    # The lead of the RPM file has a fixed size.
+    lead_size = 96
+    with open(path, "rb") as f:
+        f.seek(lead_size)
+        # The signature header starts with 3 bytes of magic, 1 byte of version and
+        # 4 reserved bytes, followed by the number of index entries and the size of data.
+        intro = f.read(16)
+        if len(intro) != 16 or intro[:3] != b"\x8e\xad\xe8":
+            raise ValueError("%s is not an RPM file" % path)
+        nindex, hsize = struct.unpack("!II", intro[8:])
+        signature_size = 16 + 16 * nindex + hsize
+        # The signature header is padded to a multiple of 8 bytes.
+        f.seek(lead_size + signature_size + (8 - signature_size % 8) % 8)
+        md5 = hashlib.md5()
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _rpm_matches(path, sigmd5, size):
+    """Returns True if the RPM file has the expected payloadhash and size."""
+    if os.path.getsize(path) != size:
+        return False
+    try:
+        return get_rpm_sigmd5(path) == sigmd5
+    except ValueError:
+        return False
+
+
+def _get_rpm_cache_path(config, sigmd5):
+    """Returns the path to the RPM with the payloadhash in ``config.rpm_cache_dir``."""
+    return os.path.join(config.rpm_cache_dir, sigmd5[:2], sigmd5 + ".rpm")
+
+
+def _download_rpm_to_cache(config, url, sigmd5, size):
+    """
+    Downloads the RPM to the content-addressed cache in ``config.rpm_cache_dir``,
+    unless it is already there.
+
+    The RPM is downloaded to a partial file first, so an interrupted download
+    is resumed next time, and the RPM is moved to the cache only when its size
+    and checksum match. The partial file is locked while downloading, so the same
+    RPM is not downloaded by more processes or threads at once.
+
+    :param config: the MBS config object.
+    :param str url: the URL of the RPM.
+    :param str sigmd5: the payloadhash of the RPM reported by Koji.
+    :param int size: the size of the RPM reported by Koji.
+    :return: the path to the RPM in the cache.
+    :rtype: str
+    :raises RuntimeError: if the downloaded RPM does not match the size or checksum.
+    """
+    cached_fn = _get_rpm_cache_path(config, sigmd5)
+    cache_dir = os.path.dirname(cached_fn)
+    if os.path.exists(cached_fn):
+        return cached_fn
+
+    try:
+        os.makedirs(cache_dir)
+    except OSError as exception:
+        if exception.errno != errno.EEXIST:
+            raise
+
+    part_fn = cached_fn + ".part"
+    with open(part_fn, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(cached_fn):
+                # Downloaded by someone else in the meantime.
+                if os.path.exists(part_fn) and os.path.getsize(part_fn) == 0:
+                    os.remove(part_fn)
+                return cached_fn
+
+            # Resume the interrupted download first, then try it once more from the scratch.
+            for attempt in range(2):
+                offset = os.fstat(f.fileno()).st_size
+                if offset >= size:
+                    f.seek(0)
+                    f.truncate()
+                    offset = 0
+                if offset:
+                    log.info("Resuming the download of {0} from {1} bytes...".format(url, offset))
+                    rv = requests.get(
+                        url, stream=True, timeout=60, headers={"Range": "bytes=%d-" % offset})
+                else:
+                    log.info("Downloading {0}...".format(url))
+                    rv = requests.get(url, stream=True, timeout=60)
+                rv.raise_for_status()
+                if offset and rv.status_code != 206:
+                    # The server does not support ranges, so the whole RPM is downloaded again.
+                    f.seek(0)
+                    f.truncate()
+                for chunk in rv.iter_content(chunk_size=config.rpm_download_chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                f.flush()
+
+                if _rpm_matches(part_fn, sigmd5, size):
+                    os.rename(part_fn, cached_fn)
+                    return cached_fn
+
+                log.warning("The RPM downloaded from {0} does not match its checksum".format(url))
+                f.seek(0)
+                f.truncate()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    raise RuntimeError(
+        "The RPM downloaded from {0} does not match its size or checksum".format(url))
+
+
+def _link_or_copy(src, dst):
+    """
+    Hard links the `src` file to `dst`, or copies it if it cannot be hard linked,
+    for example because it is on another filesystem. The copy is a reflink on
+    the filesystems which support it.
+    """
+    try:
+        os.link(src, dst)
+    except OSError as exception:
+        if exception.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        execute_cmd(["cp", "--reflink=auto", src, dst])
+
+
 def create_local_repo_from_koji_tag(config, tag, repo_dir, archs=None):
     """
     Downloads the packages build for one of `archs` (defaults to ['x86_64',
     'noarch']) in Koji tag `tag` to `repo_dir` and creates repository in that
     directory. Needs config.koji_profile and config.koji_config to be set.
 
+    The packages are downloaded to the cache in ``config.rpm_cache_dir`` once
+    and linked from there to the `repo_dir` of every tag they are tagged in.
+    The repository is created again only when its packages change.
+
     If the there are no builds associated with the tag, False is returned.
     """
 
@@ -124,13 +266,19 @@ def create_local_repo_from_koji_tag(config, tag, repo_dir, archs=None):
         fname = pathinfo.rpm(rpm)
         relpath = os.path.basename(fname)
         local_fn = os.path.join(repo_dir, relpath)
-        # Download only when the RPM is not downloaded or the size does not match.
-        if not os.path.exists(local_fn) or os.path.getsize(local_fn) != rpm["size"]:
-            if os.path.exists(local_fn):
-                os.remove(local_fn)
-            repo_changed = True
-            url = pathinfo.build(build_info) + "/" + fname
-            download_args.append((url, local_fn))
+        # Download only when the RPM is not in the repository or its size does not match.
+        # The RPMs copied from the cache on another filesystem are not linked to it, so
+        # only their size is compared not to read the whole repository again every time.
+        if os.path.exists(local_fn):
+            cached_fn = _get_rpm_cache_path(config, rpm["payloadhash"])
+            if os.path.exists(cached_fn) and os.path.samefile(local_fn, cached_fn):
+                continue
+            if os.path.getsize(local_fn) == rpm["size"]:
+                continue
+            os.remove(local_fn)
+        repo_changed = True
+        url = pathinfo.build(build_info) + "/" + fname
+        download_args.append((url, rpm, local_fn))
 
     log.info("Downloading %d packages from Koji tag %s to %s" % (len(download_args), tag, repo_dir))
 
@@ -141,32 +289,25 @@ def create_local_repo_from_koji_tag(config, tag, repo_dir, archs=None):
         if exception.errno != errno.EEXIST:
             raise
 
-    def _download_file(url_and_dest):
+    def _download_file(download_arg):
         """
-        Download a file in a memory efficient manner
-        :param url_and_dest: a tuple containing the URL and the destination to download to
+        Download the RPM to the cache and link it to the repository
+        :param download_arg: a tuple containing the URL, the Koji RPM info and the destination
         :return: None
         """
-        log.info("Downloading {0}...".format(url_and_dest[0]))
-        if len(url_and_dest) != 2:
-            raise ValueError("url_and_dest must have two values")
-
-        rv = requests.get(url_and_dest[0], stream=True, timeout=60)
-        with open(url_and_dest[1], "wb") as f:
-            for chunk in rv.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-
-    # Download the RPMs four at a time.
-    pool = ThreadPool(4)
+        url, rpm, local_fn = download_arg
+        cached_fn = _download_rpm_to_cache(config, url, rpm["payloadhash"], rpm["size"])
+        _link_or_copy(cached_fn, local_fn)
+
+    pool = ThreadPool(config.num_threads_for_rpm_downloads)
     try:
         pool.map(_download_file, download_args)
     finally:
         pool.close()
 
     # If we downloaded something, run the createrepo_c.
-    if repo_changed:
-        repodata_path = os.path.join(repo_dir, "repodata")
+    repodata_path = os.path.join(repo_dir, "repodata")
+    if repo_changed or not os.path.exists(repodata_path):
         if os.path.exists(repodata_path):
             shutil.rmtree(repodata_path)
 
@@ -199,7 +340,7 @@ def get_rpm_release(db_session, module_build):
     mse_build_ids.sort()
     index = mse_build_ids[0]
     try:
-        buildrequires = module_build.mmd().get_xmd()["mbs"]["buildrequires"]
+        buildrequires = module_build.mmd(read_only=True).get_xmd()["mbs"]["buildrequires"]
     except (ValueError, KeyError):
         log.warning(
             "Module build {0} does not have buildrequires in its xmd".format(module_build.id))
@@ -230,7 +371,7 @@ def get_rpm_release(db_session, module_build):
                 continue
 
             try:
-                marking = module_obj.mmd().get_xmd()["mbs"]["disttag_marking"]
+                marking = module_obj.mmd(read_only=True).get_xmd()["mbs"]["disttag_marking"]
             # We must check for a KeyError because a Variant object doesn't support the `get`
             # method
             except KeyError:
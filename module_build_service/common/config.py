@@ -55,6 +55,20 @@ class TestConfiguration(BaseConfiguration):
 
     KOJI_CONFIG = "./conf/koji.conf"
     KOJI_PROFILE = "staging"
+    # Tests mock koji.ClientSession, so the sessions must not be reused between them
+    KOJI_SESSION_POOL_SIZE = 0
+    # Tests change the database directly, so the responses must not be cached
+    RESPONSE_CACHE_SIZE = 0
+    # Tests mock the responses of the remote MBS, so they must not be cached
+    MBS_RESOLVER_CACHE_SIZE = 0
+    # Every thread would get its own in-memory SQLite database
+    NUM_THREADS_FOR_REQUIRES_RESOLUTION = 1
+    # Tests create different modules with the same NSVCs
+    MMD_RESOLVER_CACHE_SIZE = 0
+    # Tests use the same repositories with different commits
+    SCM_REF_CACHE_SIZE = 0
+    # The mirrors would be kept between the tests, the SCM tests use their own directory
+    SCM_CACHE_DIR = ""
     SERVER_NAME = "localhost"
 
     KOJI_REPOSITORY_URL = "https://kojipkgs.stg.fedoraproject.org/repos"
@@ -79,6 +93,8 @@ class ProdConfiguration(BaseConfiguration):
 
 class LocalBuildConfiguration(BaseConfiguration):
     CACHE_DIR = "~/modulebuild/cache"
+    SCM_CACHE_DIR = "~/modulebuild/cache/scm"
+    RPM_CACHE_DIR = "~/modulebuild/cache/rpms"
     LOG_LEVEL = "debug"
     MESSAGING = "in_memory"
 
@@ -176,6 +192,45 @@ class Config(object):
             "default": os.path.join(tempfile.gettempdir(), "mbs"),
             "desc": "Cache directory"
         },
+        "rpm_cache_dir": {
+            "type": Path,
+            "default": os.path.join(tempfile.gettempdir(), "mbs", "rpms"),
+            "desc": "Directory with the RPMs downloaded from Koji tags for the local builds, "
+                    "stored by their checksums. They are hard linked or copied from there "
+                    "to the local repositories of the Koji tags.",
+        },
+        "rpm_download_chunk_size": {
+            "type": int,
+            "default": 1024 * 1024,
+            "desc": "Size of the chunks the RPMs are downloaded from Koji in, in bytes.",
+        },
+        "mmd_cache_size": {
+            "type": int,
+            "default": 512,
+            "desc": "The maximum number of parsed modulemd objects of module builds kept in the "
+                    "in-memory cache. Set to 0 to disable the cache.",
+        },
+        "mmd_resolver_cache_size": {
+            "type": int,
+            "default": 10000,
+            "desc": "The maximum number of modules kept in the in-memory cache of the data used "
+                    "to add them to the dependency solver during the module stream expansion. "
+                    "Set to 0 to disable the cache.",
+        },
+        "mmd_resolver_cache_ttl": {
+            "type": int,
+            "default": 3600,
+            "desc": "Number of seconds the data used to add the modules to the dependency "
+                    "solver are cached for.",
+        },
+        "mmd_resolver_max_combinations": {
+            "type": int,
+            "default": 100000,
+            "desc": "The maximum number of combinations of the buildrequired module builds "
+                    "checked when resolving the buildrequires of a module during the module "
+                    "stream expansion. The module builds needing more are rejected. Set to 0 "
+                    "for no limit.",
+        },
         "mbs_url": {
             "type": str,
             "default": "https://mbs.fedoraproject.org/module-build-service/1/module-builds/",
@@ -197,6 +252,19 @@ class Config(object):
             "desc": "Koji config file."
         },
         "koji_profile": {"type": str, "default": "koji", "desc": "Koji config profile."},
+        "koji_session_pool_size": {
+            "type": int,
+            "default": 20,
+            "desc": "The maximum number of Koji sessions kept for reuse. Every thread of every "
+                    "process uses its own sessions. Set to 0 to create a new session on every "
+                    "call.",
+        },
+        "koji_session_check_interval": {
+            "type": int,
+            "default": 300,
+            "desc": "The number of seconds after which a pooled Koji session is checked to still "
+                    "be usable before it is reused.",
+        },
         "arches": {"type": list, "default": ["x86_64"], "desc": "Koji architectures."},
         "allow_arch_override": {
             "type": bool,
@@ -349,6 +417,27 @@ class Config(object):
             "default": "~/modulebuild/builds",
             "desc": "Directory for Mock build results.",
         },
+        "mock_incremental_createrepo": {
+            "type": bool,
+            "default": True,
+            "desc": "Keep the NEVRAs of the built RPMs and update the local repository of "
+                    "the module build incrementally instead of generating it from scratch "
+                    "after every batch.",
+        },
+        "mock_root_cache_dir": {
+            "type": Path,
+            "default": "~/modulebuild/cache/mock-root-cache",
+            "desc": "Directory with the mock root caches of the chroots initialized for the "
+                    "local builds, reused while the mock config and the content of its "
+                    "repositories do not change. Set to an empty string to initialize "
+                    "the chroots from scratch.",
+        },
+        "mock_root_cache_max_size": {
+            "type": int,
+            "default": 10240,
+            "desc": "Maximum total size of the mock root caches, in MiB. The least recently "
+                    "used root caches are removed above it.",
+        },
         "mock_purge_useless_logs": {
             "type": bool,
             "default": True,
@@ -379,6 +468,59 @@ class Config(object):
             "default": 5,
             "desc": "Number of concurrent component builds.",
         },
+        "routing_index_size": {
+            "type": int,
+            "default": 10000,
+            "desc": "Maximum number of Koji task ids, NVRs and Koji tags of each kind kept in "
+                    "the in-process index used to find the module build a message belongs to. "
+                    "Set to 0 to disable the index.",
+        },
+        "routing_index_ttl": {
+            "type": int,
+            "default": 300,
+            "desc": "Number of seconds the Koji tag of a module build in the build state is "
+                    "kept in the in-process routing index.",
+        },
+        "mbs_resolver_cache_size": {
+            "type": int,
+            "default": 1000,
+            "desc": "Maximum number of query results and of module builds in the ready state "
+                    "kept in the in-process cache of the MBS resolver. Set to 0 to disable "
+                    "the cache.",
+        },
+        "mbs_resolver_cache_ttl": {
+            "type": int,
+            "default": 60,
+            "desc": "Number of seconds the query results of the MBS resolver are cached for. "
+                    "The module builds in the ready state are cached without expiration.",
+        },
+        "response_cache_size": {
+            "type": int,
+            "default": 1000,
+            "desc": "Maximum number of responses of the read-only API endpoints kept in the "
+                    "in-process cache of the frontend. Set to 0 to disable the cache.",
+        },
+        "response_cache_ttl": {
+            "type": int,
+            "default": 10,
+            "desc": "Number of seconds the responses of the module build list queries are "
+                    "cached for. The changes of module builds done by the frontend itself "
+                    "invalidate the cached responses immediately. Set to 0 to not cache them.",
+        },
+        "num_concurrent_builds_weight": {
+            "type": int,
+            "default": 0,
+            "desc": "Maximum total weight of concurrent component builds. The weight budget is "
+                    "shared fairly between the module builds with components waiting to be "
+                    "built. Set to 0 to limit only the number of concurrent component builds.",
+        },
+        "koji_load_aware_scheduling": {
+            "type": bool,
+            "default": False,
+            "desc": "When num_concurrent_builds_weight is set, limit the weight of newly "
+                    "submitted component builds also by the free capacity of the enabled and "
+                    "ready Koji builders.",
+        },
         "net_timeout": {
             "type": int,
             "default": 120,
@@ -399,6 +541,31 @@ class Config(object):
             "default": 15,
             "desc": "Network retry interval for SCM operations, in seconds.",
         },
+        "scm_cache_dir": {
+            "type": Path,
+            "default": os.path.join(tempfile.gettempdir(), "mbs", "scm"),
+            "desc": "Directory with the bare mirrors of the SCM repositories used to find the "
+                    "full commit hashes. The mirrors are updated by git fetch when needed. "
+                    "Set to an empty string to clone the repository every time instead.",
+        },
+        "scm_max_workers_per_host": {
+            "type": int,
+            "default": 10,
+            "desc": "Maximum number of concurrent lookups of the commit hashes of components "
+                    "in a single SCM host, shared by all the module builds submitted "
+                    "in the process.",
+        },
+        "scm_ref_cache_size": {
+            "type": int,
+            "default": 10000,
+            "desc": "Maximum number of commit hashes of the branch heads kept in the in-process "
+                    "cache of the SCM. Set to 0 to disable the cache.",
+        },
+        "scm_ref_cache_ttl": {
+            "type": int,
+            "default": 60,
+            "desc": "Number of seconds the commit hashes of the branch heads are cached for.",
+        },
         "no_auth": {"type": bool, "default": False, "desc": "Disable client authentication."},
         "admin_groups": {
             "type": set,
@@ -680,6 +847,24 @@ class Config(object):
             "desc": "The number of threads when submitting component builds to an external build "
                     "system.",
         },
+        "num_threads_for_rpm_downloads": {
+            "type": int,
+            "default": 4,
+            "desc": "The number of threads downloading the RPMs from a Koji tag for the "
+                    "local builds.",
+        },
+        "num_concurrent_local_builds": {
+            "type": int,
+            "default": 0,
+            "desc": "The number of components of a batch built by mock at once in the local "
+                    "builds. Set to 0 to use the number of CPUs.",
+        },
+        "num_threads_for_requires_resolution": {
+            "type": int,
+            "default": 10,
+            "desc": "The number of threads used to resolve the module builds required by the "
+                    "submitted module build during the module stream expansion.",
+        },
         "default_modules_scm_url": {
             "type": str,
             "default": "https://pagure.io/releng/fedora-module-defaults.git",
@@ -887,6 +1072,76 @@ class Config(object):
             raise ValueError("NUM_CONCURRENT_BUILDS must be >= 0")
         self._num_concurrent_builds = i
 
+    def _setifok_routing_index_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("ROUTING_INDEX_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("ROUTING_INDEX_SIZE must be >= 0")
+        self._routing_index_size = i
+
+    def _setifok_routing_index_ttl(self, i):
+        if not isinstance(i, int):
+            raise TypeError("ROUTING_INDEX_TTL needs to be an int")
+        if i < 0:
+            raise ValueError("ROUTING_INDEX_TTL must be >= 0")
+        self._routing_index_ttl = i
+
+    def _setifok_mbs_resolver_cache_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("MBS_RESOLVER_CACHE_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("MBS_RESOLVER_CACHE_SIZE must be >= 0")
+        self._mbs_resolver_cache_size = i
+
+    def _setifok_response_cache_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("RESPONSE_CACHE_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("RESPONSE_CACHE_SIZE must be >= 0")
+        self._response_cache_size = i
+
+    def _setifok_response_cache_ttl(self, i):
+        if not isinstance(i, int):
+            raise TypeError("RESPONSE_CACHE_TTL needs to be an int")
+        if i < 0:
+            raise ValueError("RESPONSE_CACHE_TTL must be >= 0")
+        self._response_cache_ttl = i
+
+    def _setifok_scm_max_workers_per_host(self, i):
+        if not isinstance(i, int):
+            raise TypeError("SCM_MAX_WORKERS_PER_HOST needs to be an int")
+        if i < 1:
+            raise ValueError("SCM_MAX_WORKERS_PER_HOST must be >= 1")
+        self._scm_max_workers_per_host = i
+
+    def _setifok_scm_ref_cache_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("SCM_REF_CACHE_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("SCM_REF_CACHE_SIZE must be >= 0")
+        self._scm_ref_cache_size = i
+
+    def _setifok_scm_ref_cache_ttl(self, i):
+        if not isinstance(i, int):
+            raise TypeError("SCM_REF_CACHE_TTL needs to be an int")
+        if i < 0:
+            raise ValueError("SCM_REF_CACHE_TTL must be >= 0")
+        self._scm_ref_cache_ttl = i
+
+    def _setifok_num_concurrent_builds_weight(self, i):
+        if not isinstance(i, int):
+            raise TypeError("NUM_CONCURRENT_BUILDS_WEIGHT needs to be an int")
+        if i < 0:
+            raise ValueError("NUM_CONCURRENT_BUILDS_WEIGHT must be >= 0")
+        self._num_concurrent_builds_weight = i
+
+    def _setifok_koji_session_pool_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("KOJI_SESSION_POOL_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("KOJI_SESSION_POOL_SIZE must be >= 0")
+        self._koji_session_pool_size = i
+
     def _setifok_auth_method(self, s):
         s = str(s)
         if s.lower() not in ("oidc", "kerberos"):
@@ -992,6 +1247,27 @@ class Config(object):
 
         self._product_pages_module_streams = d
 
+    def _setifok_mmd_resolver_cache_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("MMD_RESOLVER_CACHE_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("MMD_RESOLVER_CACHE_SIZE must be >= 0")
+        self._mmd_resolver_cache_size = i
+
+    def _setifok_mmd_resolver_max_combinations(self, i):
+        if not isinstance(i, int):
+            raise TypeError("MMD_RESOLVER_MAX_COMBINATIONS needs to be an int")
+        if i < 0:
+            raise ValueError("MMD_RESOLVER_MAX_COMBINATIONS must be >= 0")
+        self._mmd_resolver_max_combinations = i
+
+    def _setifok_mmd_cache_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("MMD_CACHE_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("MMD_CACHE_SIZE must be >= 0")
+        self._mmd_cache_size = i
+
     def _setifok_num_threads_for_build_submissions(self, i):
         if not isinstance(i, int):
             raise TypeError("NUM_THREADS_FOR_BUILD_SUBMISSIONS needs to be an int")
@@ -999,5 +1275,40 @@ class Config(object):
             raise ValueError("NUM_THREADS_FOR_BUILD_SUBMISSIONS must be >= 1")
         self._num_threads_for_build_submissions = i
 
+    def _setifok_mock_root_cache_max_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("MOCK_ROOT_CACHE_MAX_SIZE needs to be an int")
+        if i < 0:
+            raise ValueError("MOCK_ROOT_CACHE_MAX_SIZE must be >= 0")
+        self._mock_root_cache_max_size = i
+
+    def _setifok_num_concurrent_local_builds(self, i):
+        if not isinstance(i, int):
+            raise TypeError("NUM_CONCURRENT_LOCAL_BUILDS needs to be an int")
+        if i < 0:
+            raise ValueError("NUM_CONCURRENT_LOCAL_BUILDS must be >= 0")
+        self._num_concurrent_local_builds = i
+
+    def _setifok_num_threads_for_rpm_downloads(self, i):
+        if not isinstance(i, int):
+            raise TypeError("NUM_THREADS_FOR_RPM_DOWNLOADS needs to be an int")
+        if i < 1:
+            raise ValueError("NUM_THREADS_FOR_RPM_DOWNLOADS must be >= 1")
+        self._num_threads_for_rpm_downloads = i
+
+    def _setifok_rpm_download_chunk_size(self, i):
+        if not isinstance(i, int):
+            raise TypeError("RPM_DOWNLOAD_CHUNK_SIZE needs to be an int")
+        if i < 1:
+            raise ValueError("RPM_DOWNLOAD_CHUNK_SIZE must be >= 1")
+        self._rpm_download_chunk_size = i
+
+    def _setifok_num_threads_for_requires_resolution(self, i):
+        if not isinstance(i, int):
+            raise TypeError("NUM_THREADS_FOR_REQUIRES_RESOLUTION needs to be an int")
+        if i < 1:
+            raise ValueError("NUM_THREADS_FOR_REQUIRES_RESOLUTION must be >= 1")
+        self._num_threads_for_requires_resolution = i
+
 
 conf, config_section = init_config()
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+from collections import OrderedDict
 import os
+import threading
+import time
 
 import koji
 import munch
@@ -110,8 +113,8 @@ def koji_retrying_multicall_map(*args, **kwargs):
 
 
 @retry(wait_on=(xmlrpclib.ProtocolError, koji.GenericError))
-def get_session(config, login=True):
-    """Create and return a koji.ClientSession object
+def _create_session(config, login=True):
+    """Create and return a new koji.ClientSession object
 
     :param config: the config object returned from :meth:`init_config`.
     :type config: :class:`Config`
@@ -160,3 +163,110 @@ def get_session(config, login=True):
         raise ValueError("Unrecognized koji authtype %r" % authtype)
 
     return koji_session
+
+
+class KojiSessionPool(object):
+    """
+    Keeps Koji sessions for reuse, so every call of :func:`get_session` does
+    not need to connect and authenticate again.
+
+    A session is never shared between threads or processes. Every thread of
+    every process gets its own session per Koji profile and login type.
+    When a pooled session is reused after more than
+    ``koji_session_check_interval`` seconds, it is checked to still be usable
+    and, for logged in sessions, that the login has not expired. Unusable
+    sessions are replaced by new ones. The least recently used sessions are
+    dropped when there are more than ``koji_session_pool_size`` of them.
+    """
+
+    def __init__(self):
+        # {(pid, thread_id, profile, koji_config, login): (session, last_checked)}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, config, login=True):
+        """
+        Return a pooled Koji session or a new one if there is no usable session in the pool.
+
+        :param config: the config object returned from :meth:`init_config`.
+        :type config: :class:`Config`
+        :param bool login: whether the session must be logged in.
+        :return: the Koji session object.
+        :rtype: :class:`koji.ClientSession`
+        """
+        max_size = config.koji_session_pool_size
+        if max_size <= 0:
+            return _create_session(config, login)
+
+        key = (
+            os.getpid(),
+            threading.current_thread().ident,
+            config.koji_profile,
+            config.koji_config,
+            login,
+        )
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+
+        now = time.time()
+        if entry and entry[0].multicall:
+            # Some multicall was not finished, so the session contains unexpected queued calls.
+            log.warning("The pooled Koji session is in the multicall mode, creating a new one.")
+        elif entry:
+            session, last_checked = entry
+            if now - last_checked < config.koji_session_check_interval:
+                self._put(key, session, last_checked, max_size)
+                return session
+            if self._is_usable(session, login):
+                self._put(key, session, now, max_size)
+                return session
+            log.info("The pooled Koji session is not usable anymore, creating a new one.")
+
+        session = _create_session(config, login)
+        self._put(key, session, now, max_size)
+        return session
+
+    def clear(self):
+        """Drop all the pooled sessions."""
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _put(self, key, session, last_checked, max_size):
+        with self._lock:
+            self._sessions[key] = (session, last_checked)
+            while len(self._sessions) > max_size:
+                self._sessions.popitem(last=False)
+
+    @staticmethod
+    def _is_usable(session, login):
+        try:
+            if login:
+                # None is returned when the session is not logged in anymore
+                return session.getLoggedInUser() is not None
+            session.getAPIVersion()
+            return True
+        except Exception:
+            log.exception("The health check of the pooled Koji session failed.")
+            return False
+
+
+koji_session_pool = KojiSessionPool()
+
+
+def get_session(config, login=True):
+    """Return a koji.ClientSession object
+
+    The session is taken from the pool of sessions of the current thread if
+    possible. See :class:`KojiSessionPool`.
+
+    :param config: the config object returned from :meth:`init_config`.
+    :type config: :class:`Config`
+    :param bool login: whether to log into the session. To login if True
+        is passed, otherwise not to log into session.
+    :return: the Koji session object.
+    :rtype: :class:`koji.ClientSession`
+    """
+    return koji_session_pool.get(config, login)
@@ -154,6 +154,9 @@ class MBSLogger:
     def setLevel(self, level):
         self.level = level
 
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
     def debug(self, *args, **kwargs):
         return self._log_call("debug", args, kwargs)
 
@@ -5,10 +5,12 @@
 
 from __future__ import absolute_import
 from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 from datetime import datetime
 import hashlib
 import json
 import re
+import threading
 
 import kobo.rpmlib
 import koji
@@ -16,6 +18,7 @@ import sqlalchemy
 from sqlalchemy import func, and_
 from sqlalchemy.orm import lazyload
 from sqlalchemy.orm import validates, load_only
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.schema import Index
 
 
@@ -24,7 +27,8 @@ from module_build_service.common import conf, log
 from module_build_service.common.errors import UnprocessableEntity
 from module_build_service.common.messaging import module_build_state_change_out_queue
 from module_build_service.common.messaging import notify_on_module_state_change
-from module_build_service.common.utils import load_mmd
+from module_build_service.common.response_cache import response_cache
+from module_build_service.common.utils import load_mmd, mmd_cache
 from module_build_service.scheduler import events
 
 DEFAULT_MODULE_CONTEXT = "00000000"
@@ -190,26 +194,51 @@ class ModuleBuild(MBSBase):
         "only-changed": "All changed components will be rebuilt",
     }
 
+    def _get_batch_index(self):
+        """
+        Returns the components of this module grouped by their batch.
+
+        The index is built once and reused until the component builds are
+        reloaded, a component is added to or removed from this module or
+        a batch of any component changes.
+
+        :return: tuple of {batch: [components]} and {id(component): position},
+            the position being the order of component in ``component_builds``.
+        """
+        component_builds = self.component_builds
+        index = getattr(self, "_batch_index", None)
+        if (
+            index is not None
+            and index[0] is component_builds
+            and index[1] is _batch_index_generation
+        ):
+            return index[2], index[3]
+
+        batches = {}
+        positions = {}
+        for position, component in enumerate(component_builds):
+            batches.setdefault(component.batch, []).append(component)
+            positions[id(component)] = position
+        self._batch_index = (component_builds, _batch_index_generation, batches, positions)
+        return batches, positions
+
     def current_batch(self, state=None):
         """ Returns all components of this module in the current batch. """
 
         if not self.batch:
             raise ValueError("No batch is in progress: %r" % self.batch)
 
+        batches, _ = self._get_batch_index()
+        components = batches.get(self.batch, [])
         if state is not None:
-            return [
-                component for component in self.component_builds
-                if component.batch == self.batch and component.state == state
-            ]
+            return [component for component in components if component.state == state]
         else:
-            return [
-                component for component in self.component_builds
-                if component.batch == self.batch
-            ]
+            return list(components)
 
     def last_batch_id(self):
         """ Returns the id of the last batch """
-        return max([build.batch for build in self.component_builds])
+        batches, _ = self._get_batch_index()
+        return max(batches)
 
     def up_to_current_batch(self, state=None):
         """
@@ -220,15 +249,17 @@ class ModuleBuild(MBSBase):
         if not self.batch:
             raise ValueError("No batch is in progress: %r" % self.batch)
 
-        if state is not None:
-            return [
-                component for component in self.component_builds
-                if component.batch <= self.batch and component.state == state
-            ]
-        else:
-            return [
-                component for component in self.component_builds if component.batch <= self.batch
-            ]
+        batches, positions = self._get_batch_index()
+        components = []
+        for batch, batch_components in batches.items():
+            if batch <= self.batch:
+                components.extend(
+                    component for component in batch_components
+                    if state is None or component.state == state
+                )
+        # Keep the order of component_builds.
+        components.sort(key=lambda component: positions[id(component)])
+        return components
 
     @staticmethod
     def get_by_id(db_session, module_build_id):
@@ -463,12 +494,27 @@ class ModuleBuild(MBSBase):
         """Get build by its koji_tag"""
         return db_session.query(ModuleBuild).filter_by(koji_tag=tag).first()
 
-    def mmd(self):
+    def mmd(self, read_only=False):
+        """
+        Returns the parsed modulemd of this module build.
+
+        The parsed modulemd is cached per module build and modulemd content.
+        By default, a copy of the cached object is returned, so the caller is
+        free to modify it.
+
+        :kwarg bool read_only: when True, the shared cached object is returned
+            instead of a copy. The caller must not modify it.
+        :rtype: Modulemd.ModuleStream
+        :raises ValueError: when the modulemd is invalid.
+        """
         try:
-            return load_mmd(self.modulemd)
+            if self.id is None:
+                return load_mmd(self.modulemd)
+            mmd = mmd_cache.get(self.id, self.modulemd)
         except UnprocessableEntity:
             log.exception("An error occurred while trying to parse the modulemd")
             raise ValueError("Invalid modulemd")
+        return mmd if read_only else mmd.copy()
 
     @property
     def previous_non_failed_state(self):
@@ -752,10 +798,11 @@ class ModuleBuild(MBSBase):
             cls.koji_tag == tag,
             cls.state == BUILD_STATES["build"]
         )
-        count = query.count()
-        if count > 1:
-            raise RuntimeError("%r module builds in flight for %r" % (count, tag))
-        return query.first()
+        # Fetch two rows at most to find out whether the tag is unique in one query.
+        module_builds = query.limit(2).all()
+        if len(module_builds) > 1:
+            raise RuntimeError("%r module builds in flight for %r" % (query.count(), tag))
+        return module_builds[0] if module_builds else None
 
     def short_json(self, show_stream_version=False, show_scratch=True):
         rv = {
@@ -774,7 +821,11 @@ class ModuleBuild(MBSBase):
         return rv
 
     def json(self, db_session, show_tasks=True):
-        mmd = self.mmd()
+        tasks = self.tasks(db_session) if show_tasks else None
+        return self._json(self.siblings(db_session), tasks)
+
+    def _json(self, siblings, tasks=None):
+        mmd = self.mmd(read_only=True)
         xmd = mmd.get_xmd()
         buildrequires = xmd.get("mbs", {}).get("buildrequires", {})
         rv = self.short_json()
@@ -785,15 +836,15 @@ class ModuleBuild(MBSBase):
             "rebuild_strategy": self.rebuild_strategy,
             "scmurl": self.scmurl,
             "srpms": json.loads(self.srpms or "[]"),
-            "siblings": self.siblings(db_session),
+            "siblings": siblings,
             "state_reason": self.state_reason,
             "time_completed": _utc_datetime_to_iso(self.time_completed),
             "time_modified": _utc_datetime_to_iso(self.time_modified),
             "time_submitted": _utc_datetime_to_iso(self.time_submitted),
             "buildrequires": buildrequires,
         })
-        if show_tasks:
-            rv["tasks"] = self.tasks(db_session)
+        if tasks is not None:
+            rv["tasks"] = tasks
         return rv
 
     def extended_json(self, db_session, show_state_url=False, api_version=1):
@@ -804,7 +855,16 @@ class ModuleBuild(MBSBase):
         SQLAlchemy sessions.
         :kwarg api_version: the API version to use when building the state URL
         """
-        rv = self.json(db_session, show_tasks=True)
+        return self._extended_json(
+            self.siblings(db_session),
+            self.tasks(db_session),
+            self.state_trace(db_session, self.id),
+            show_state_url,
+            api_version,
+        )
+
+    def _extended_json(self, siblings, tasks, state_trace, show_state_url=False, api_version=1):
+        rv = self._json(siblings, tasks)
         state_url = None
         if show_state_url:
             state_url = get_url_for("module_build", api_version=api_version, id=self.id)
@@ -822,7 +882,7 @@ class ModuleBuild(MBSBase):
                     "state_name": INVERSE_BUILD_STATES[record.state],
                     "reason": record.state_reason,
                 }
-                for record in self.state_trace(db_session, self.id)
+                for record in state_trace
             ],
             "state_url": state_url,
             "stream_version": self.stream_version,
@@ -832,16 +892,166 @@ class ModuleBuild(MBSBase):
 
         return rv
 
+    @classmethod
+    def bulk_json(cls, db_session, builds, extended=False, show_state_url=False, api_version=1):
+        """
+        Serialize multiple module builds at once. The output is the same as
+        calling :meth:`json` or :meth:`extended_json` on each build, but the
+        related rows are loaded for all the builds together using a fixed
+        number of queries instead of several queries per build.
+
+        :param db_session: SQLAlchemy session object.
+        :param list builds: the :class:`ModuleBuild` objects to serialize.
+        :kwarg bool extended: use the :meth:`extended_json` format.
+        :kwarg bool show_state_url: passed to :meth:`extended_json`.
+        :kwarg int api_version: passed to :meth:`extended_json`.
+        :return: list of dicts in the same order as ``builds``.
+        :rtype: list[dict]
+        """
+        if not builds:
+            return []
+
+        build_ids = [build.id for build in builds]
+
+        # Component builds are used for both "component_builds" and "tasks"
+        components = {build_id: [] for build_id in build_ids}
+        for component in (
+            db_session.query(ComponentBuild)
+            .filter(ComponentBuild.module_id.in_(build_ids))
+            .options(lazyload("module_build"))
+            .order_by(ComponentBuild.id)
+        ):
+            components[component.module_id].append(component)
+
+        tasks = {}
+        for build in builds:
+            _set_unloaded_relationship(build, "component_builds", components[build.id])
+            build_tasks = {}
+            for component in components[build.id]:
+                build_tasks.setdefault(component.format, {})
+                build_tasks[component.format][component.package] = dict(
+                    task_id=component.task_id,
+                    state=component.state,
+                    state_reason=component.state_reason,
+                    nvr=component.nvr,
+                )
+            tasks[build.id] = build_tasks
+
+        siblings = cls._bulk_siblings(db_session, builds)
+
+        if not extended:
+            return [build._json(siblings[build.id], tasks[build.id]) for build in builds]
+
+        traces = {build_id: [] for build_id in build_ids}
+        for trace in (
+            db_session.query(ModuleBuildTrace)
+            .filter(ModuleBuildTrace.module_id.in_(build_ids))
+            .options(lazyload("module_build"))
+            .order_by(ModuleBuildTrace.state_time)
+        ):
+            traces[trace.module_id].append(trace)
+
+        cls._bulk_load_secondary(
+            db_session, builds, "buildrequires", ModuleBuild,
+            module_builds_to_module_buildrequires.c.module_id,
+            module_builds_to_module_buildrequires.c.module_buildrequire_id,
+        )
+        cls._bulk_load_secondary(
+            db_session, builds, "virtual_streams", VirtualStream,
+            module_builds_to_virtual_streams.c.module_build_id,
+            module_builds_to_virtual_streams.c.virtual_stream_id,
+        )
+        cls._bulk_load_secondary(
+            db_session, builds, "arches", ModuleArch,
+            module_builds_to_arches.c.module_build_id,
+            module_builds_to_arches.c.module_arch_id,
+            order_by=ModuleArch.name,
+        )
+
+        return [
+            build._extended_json(
+                siblings[build.id], tasks[build.id], traces[build.id],
+                show_state_url, api_version,
+            )
+            for build in builds
+        ]
+
+    @staticmethod
+    def _bulk_siblings(db_session, builds):
+        """
+        Find siblings of all ``builds`` in a single query.
+
+        :return: dict with the build id as key and the list of its siblings' ids as value.
+        """
+        nsvs = set((build.name, build.stream, build.version, build.scratch) for build in builds)
+        query = (
+            db_session.query(
+                ModuleBuild.id,
+                ModuleBuild.name,
+                ModuleBuild.stream,
+                ModuleBuild.version,
+                ModuleBuild.scratch,
+            )
+            .filter(sqlalchemy.or_(*[
+                and_(
+                    ModuleBuild.name == name,
+                    ModuleBuild.stream == stream,
+                    ModuleBuild.version == version,
+                    ModuleBuild.scratch == scratch,
+                )
+                for name, stream, version, scratch in nsvs
+            ]))
+            .order_by(ModuleBuild.id)
+        )
+        ids_by_nsv = {}
+        for row in query:
+            ids_by_nsv.setdefault((row.name, row.stream, row.version, row.scratch), []).append(
+                row.id)
+
+        return {
+            build.id: [
+                build_id
+                for build_id in ids_by_nsv.get(
+                    (build.name, build.stream, build.version, build.scratch), [])
+                if build_id != build.id
+            ]
+            for build in builds
+        }
+
+    @staticmethod
+    def _bulk_load_secondary(
+        db_session, builds, attr, target_cls, local_column, remote_column, order_by=None
+    ):
+        """
+        Populate the many-to-many relationship ``attr`` of all ``builds`` with a single query.
+        Relationships which are already loaded are left untouched.
+        """
+        unloaded = [build for build in builds if attr in sqlalchemy.inspect(build).unloaded]
+        if not unloaded:
+            return
+
+        query = (
+            db_session.query(local_column, target_cls)
+            .join(target_cls, target_cls.id == remote_column)
+            .filter(local_column.in_([build.id for build in unloaded]))
+        )
+        if order_by is not None:
+            query = query.order_by(order_by)
+
+        related = {build.id: [] for build in unloaded}
+        for build_id, item in query:
+            related[build_id].append(item)
+        for build in unloaded:
+            _set_unloaded_relationship(build, attr, related[build.id])
+
     def log_message(self, session, message):
         log.info(message)
-        log_msg = LogMessage(
-            component_build_id=None,
-            module_build_id=self.id,
-            message=message,
-            time_created=datetime.utcnow(),
-        )
-        session.add(log_msg)
-        session.commit()
+        log_message_buffer.add(session, {
+            "component_build_id": None,
+            "module_build_id": self.id,
+            "message": message,
+            "time_created": datetime.utcnow(),
+        })
 
     def tasks(self, db_session):
         """
@@ -931,7 +1141,7 @@ class ModuleBuild(MBSBase):
         :raises RuntimeError: when the xmd section isn't properly filled out by MBS
         """
         rv = []
-        xmd = self.mmd().get_xmd()
+        xmd = self.mmd(read_only=True).get_xmd()
         for bm in conf.base_module_names:
             try:
                 bm_dict = xmd["mbs"]["buildrequires"].get(bm)
@@ -1159,7 +1369,10 @@ class ComponentBuild(MBSBase):
         SQLAlchemy sessions.
         :kwarg api_version: the API version to use when building the state URL
         """
-        json = self.json(db_session)
+        return self._extended_json(
+            self.json(db_session), self.state_trace(db_session), show_state_url, api_version)
+
+    def _extended_json(self, json, state_trace, show_state_url=False, api_version=1):
         state_url = None
         if show_state_url:
             state_url = get_url_for("component_build", api_version=api_version, id=self.id)
@@ -1172,24 +1385,54 @@ class ComponentBuild(MBSBase):
                     "state_name": INVERSE_BUILD_STATES.get(record.state),
                     "reason": record.state_reason,
                 }
-                for record in self.state_trace(db_session)
+                for record in state_trace
             ],
             "state_url": state_url,
         })
 
         return json
 
+    @classmethod
+    def bulk_json(cls, db_session, builds, extended=False, show_state_url=False, api_version=1):
+        """
+        Serialize multiple component builds at once. The output is the same as
+        calling :meth:`json` or :meth:`extended_json` on each build, but the
+        state traces of all the builds are loaded in a single query.
+
+        :param db_session: SQLAlchemy session object.
+        :param list builds: the :class:`ComponentBuild` objects to serialize.
+        :kwarg bool extended: use the :meth:`extended_json` format.
+        :kwarg bool show_state_url: passed to :meth:`extended_json`.
+        :kwarg int api_version: passed to :meth:`extended_json`.
+        :return: list of dicts in the same order as ``builds``.
+        :rtype: list[dict]
+        """
+        if not extended or not builds:
+            return [build.json(db_session) for build in builds]
+
+        traces = {build.id: [] for build in builds}
+        for trace in (
+            db_session.query(ComponentBuildTrace)
+            .filter(ComponentBuildTrace.component_id.in_(list(traces.keys())))
+            .options(lazyload("component_build"))
+            .order_by(ComponentBuildTrace.state_time)
+        ):
+            traces[trace.component_id].append(trace)
+
+        return [
+            build._extended_json(
+                build.json(db_session), traces[build.id], show_state_url, api_version)
+            for build in builds
+        ]
+
     def log_message(self, session, message):
         log.info(message)
-        log_msg = LogMessage(
-            component_build_id=self.id,
-            module_build_id=self.module_id,
-            message=message,
-            time_created=datetime.utcnow(),
-        )
-
-        session.add(log_msg)
-        session.commit()
+        log_message_buffer.add(session, {
+            "component_build_id": self.id,
+            "module_build_id": self.module_id,
+            "message": message,
+            "time_created": datetime.utcnow(),
+        })
 
     def __repr__(self):
         return "<ComponentBuild %s, %r, state: %r, task_id: %r, batch: %r, state_reason: %s>" % (
@@ -1302,6 +1545,88 @@ class LogMessage(MBSBase):
         )
 
 
+class LogMessageBuffer(object):
+    """
+    Collects the log messages of module builds and component builds, so they
+    are stored in a single transaction instead of committing every message.
+
+    The messages are buffered only in the thread running :meth:`buffered`,
+    otherwise every message is stored and committed right away.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def add(self, session, row):
+        """
+        Store the log message or add it to the buffer of the current thread.
+
+        :param session: SQLAlchemy database session object.
+        :param dict row: the columns of the LogMessage.
+        """
+        rows = getattr(self._local, "rows", None)
+        if rows is not None:
+            rows.append(row)
+            return
+        session.add(LogMessage(**row))
+        session.commit()
+
+    @contextmanager
+    def buffered(self, session):
+        """
+        Buffer the log messages added in the current thread and store them
+        using ``session`` at the end, even if an exception is raised. In that
+        case, the other changes in ``session`` are rolled back first, so only
+        the log messages are committed. Nested calls store the messages when
+        the outermost call ends.
+
+        :param session: SQLAlchemy database session object.
+        """
+        if getattr(self._local, "rows", None) is not None:
+            yield
+            return
+
+        self._local.rows = []
+        try:
+            yield
+        except Exception:
+            rows = self._pop_rows()
+            try:
+                session.rollback()
+                self._store(session, rows)
+            except Exception:
+                # Do not hide the original exception.
+                log.exception("Failed to store %d log messages.", len(rows))
+            raise
+        else:
+            self._store(session, self._pop_rows())
+        finally:
+            self._local.rows = None
+
+    def _pop_rows(self):
+        rows = self._local.rows
+        self._local.rows = None
+        return rows
+
+    def _store(self, session, rows):
+        if not rows:
+            return
+        session.bulk_insert_mappings(LogMessage, rows)
+        session.commit()
+
+
+log_message_buffer = LogMessageBuffer()
+
+
+def _set_unloaded_relationship(instance, attr, value):
+    """
+    Set the relationship ``attr`` of ``instance`` to ``value`` as if it was
+    loaded from the database, unless the relationship is already loaded.
+    """
+    if attr in sqlalchemy.inspect(instance).unloaded:
+        set_committed_value(instance, attr, value)
+
+
 def session_before_commit_handlers(session):
     # new and updated items
     for item in set(session.new) | set(session.dirty):
@@ -1317,6 +1642,26 @@ def session_before_commit_handlers(session):
             item.component_builds_trace.append(cbt)
 
 
+# Replaced whenever a batch of any component build changes, which invalidates
+# the batch indexes of all the module builds. See ModuleBuild._get_batch_index.
+_batch_index_generation = object()
+
+
+@sqlalchemy.event.listens_for(ComponentBuild.batch, "set")
+def component_batch_changed_handler(target, value, oldvalue, initiator):
+    global _batch_index_generation
+    if value != oldvalue:
+        _batch_index_generation = object()
+
+
+@sqlalchemy.event.listens_for(ComponentBuild.module_build, "set")
+def component_module_build_changed_handler(target, value, oldvalue, initiator):
+    # The component was added to or removed from the component_builds of a module build
+    for module_build in (value, oldvalue):
+        if isinstance(module_build, ModuleBuild):
+            module_build._batch_index = None
+
+
 @sqlalchemy.event.listens_for(ModuleBuild, "before_insert")
 @sqlalchemy.event.listens_for(ModuleBuild, "before_update")
 def new_and_update_module_handler(mapper, db_session, target):
@@ -1334,4 +1679,6 @@ def send_message_after_module_build_state_change(db_session):
     # are sent correctly if the commit happens after more than one call of
     # ModuleBuild.transition.
     while not queue.empty():
-        notify_on_module_state_change(queue.get())
+        message_body = queue.get()
+        response_cache.invalidate(message_body["name"])
+        notify_on_module_state_change(message_body)
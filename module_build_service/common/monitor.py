@@ -75,7 +75,29 @@ db_transaction_rollback_counter = Counter(
 )
 
 # Service-specific metrics
-# XXX: TODO
+mmd_cache_hit_counter = Counter(
+    "mmd_cache_hit", "Number of parsed modulemd lookups served from the cache", registry=registry
+)
+mmd_cache_miss_counter = Counter(
+    "mmd_cache_miss", "Number of parsed modulemd lookups which had to parse the modulemd",
+    registry=registry,
+)
+
+mmd_resolver_solve_duration = Histogram(
+    "mmd_resolver_solve_duration_seconds",
+    "Time spent by resolving the buildrequires of a module during the module stream expansion",
+    registry=registry,
+)
+mmd_resolver_combinations_solved_counter = Counter(
+    "mmd_resolver_combinations_solved",
+    "Number of combinations of buildrequired modules solved by libsolv",
+    registry=registry,
+)
+mmd_resolver_combinations_pruned_counter = Counter(
+    "mmd_resolver_combinations_pruned",
+    "Number of combinations of buildrequired modules skipped without solving them",
+    registry=registry,
+)
 
 
 def db_hook_event_listeners(target=None):
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: MIT
+""" In-process cache of the responses of the read-only API endpoints."""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+import time
+
+from module_build_service.common import conf
+
+
+class ResponseCache(object):
+    """
+    Keeps the serialized responses of the read-only API endpoints, so the
+    frequently repeated requests are not computed again every time.
+
+    Every entry can be limited to the module builds of some names. The entry
+    is dropped by :meth:`invalidate` when a module build of one of these names
+    changes its state. This is done by the after_commit hook
+    :func:`module_build_service.common.models.send_message_after_module_build_state_change`,
+    so it only covers the changes committed by this process. The changes
+    committed by other processes, like the scheduler, are covered only by the
+    expiration of the entries. The least recently used entries are dropped
+    when there are more than ``response_cache_size`` of them.
+    """
+
+    def __init__(self):
+        # {key: (response, names, expires)}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached response or None if it is not cached or it has expired.
+
+        :param key: the hashable key of the response.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            response, names, expires = entry
+            if expires is not None and expires <= time.time():
+                return None
+            # Mark the entry as recently used.
+            self._entries[key] = entry
+            return response
+
+    def set(self, key, response, ttl=None, names=None):
+        """
+        Cache the response.
+
+        :param key: the hashable key of the response.
+        :param response: the response to cache.
+        :param ttl: number of seconds the response is cached for or None
+            to cache it until it is invalidated.
+        :param names: the names of the module builds the response depends on.
+            An empty set means the response does not depend on any module
+            build and None means it can depend on any module build.
+        """
+        max_size = conf.response_cache_size
+        if max_size <= 0:
+            return
+        expires = time.time() + ttl if ttl is not None else None
+        names = frozenset(names) if names is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (response, names, expires)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name):
+        """
+        Drop the responses which can depend on the module builds of the name.
+
+        :param str name: the name of the module build which has changed.
+        """
+        with self._lock:
+            for key, (_, names, _) in list(self._entries.items()):
+                if names is None or name in names:
+                    del self._entries[key]
+
+    def clear(self):
+        """Drop all the cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
@@ -3,12 +3,22 @@
 """SCM handler functions."""
 
 from __future__ import absolute_import
+from collections import OrderedDict
+import concurrent.futures
+import contextlib
 import datetime
+import errno
+import fcntl
+import hashlib
 import os
 import subprocess as sp
 import re
 import shutil
 import tempfile
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
 
 from module_build_service.common import log, conf
 from module_build_service.common.errors import (
@@ -58,6 +68,89 @@ def scm_url_schemes(terse=False):
         return list(set(scheme_list))
 
 
+class SCMRefCache(object):
+    """
+    Keeps the commit hashes resolved by :meth:`SCM.get_latest`, so the same
+    branch of the same repository, for example of a component used by many
+    modules or of a module submitted again, is not looked up in the SCM every
+    time.
+
+    The branches can move at any time, so the commit hashes are kept only for
+    ``scm_ref_cache_ttl`` seconds. The least recently used entries are dropped
+    when there are more than ``scm_ref_cache_size`` of them.
+    """
+
+    def __init__(self):
+        # {(repository, ref): (commit_hash, time_added)}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repository, ref):
+        """
+        Return the cached commit hash or None if it is not cached or it has expired.
+
+        :param str repository: the URL of the repository.
+        :param str ref: the branch name or the commit hash.
+        """
+        if conf.scm_ref_cache_size <= 0:
+            return None
+        key = (repository, ref)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            commit_hash, time_added = entry
+            if time.time() - time_added >= conf.scm_ref_cache_ttl:
+                return None
+            # Mark the entry as recently used.
+            self._entries[key] = entry
+            return commit_hash
+
+    def set(self, repository, ref, commit_hash):
+        """
+        Cache the commit hash of the ref.
+
+        :param str repository: the URL of the repository.
+        :param str ref: the branch name or the commit hash.
+        :param str commit_hash: the full commit hash the ref points to.
+        """
+        max_size = conf.scm_ref_cache_size
+        if max_size <= 0:
+            return
+        key = (repository, ref)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (commit_hash, time.time())
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all the cached commit hashes."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+scm_ref_cache = SCMRefCache()
+
+
+@contextlib.contextmanager
+def _lock_mirror(mirror_dir):
+    """
+    Lock the mirror of the repository against the other threads and processes.
+
+    :param str mirror_dir: the path to the mirror of the repository.
+    """
+    with open(mirror_dir + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 class SCM(object):
     "SCM abstraction class"
 
@@ -247,6 +340,12 @@ class SCM(object):
             ref = self.branch
 
         if self.scheme == "git":
+            commit_hash = scm_ref_cache.get(self.repository, ref)
+            if commit_hash:
+                log.debug("Using the cached commit hash %s of %s in %s",
+                          commit_hash, ref, self.repository)
+                return commit_hash
+
             log.debug("Getting/verifying commit hash for %s" % self.repository)
             try:
                 # This will fail if `ref` is not a branch name, but this works for commit hashes.
@@ -260,12 +359,14 @@ class SCM(object):
                 # The call below will either return the commit hash as is (if a full one was
                 # provided) or the full commit hash (if a short hash was provided). If ref is not
                 # a commit hash, then this will raise an exception.
-                return self.get_full_commit_hash(commit_hash=ref)
+                commit_hash = self.get_full_commit_hash(commit_hash=ref)
             else:
                 # git-ls-remote prints output like this, where the first commit
                 # hash is what to return.
                 # bf028e573e7c18533d89c7873a411de92d4d913e	refs/heads/master
-                return output.split()[0].decode("utf-8")
+                commit_hash = output.split()[0].decode("utf-8")
+            scm_ref_cache.set(self.repository, ref, commit_hash)
+            return commit_hash
         else:
             raise RuntimeError("get_latest: Unhandled SCM scheme.")
 
@@ -294,20 +395,23 @@ class SCM(object):
         if self.scheme == "git":
             log.debug(
                 "Getting the full commit hash on %s from %s", self.repository, commit_to_check)
-            td = None
-            try:
-                td = tempfile.mkdtemp()
-                SCM._run(["git", "clone", "-q", self.repository, td, "--bare"])
-                cmd = ["git", "rev-parse", commit_to_check]
-                log.debug(
-                    "Running `%s` to get the full commit hash for %s",
-                    " ".join(cmd),
-                    commit_to_check
-                )
-                output = SCM._run(cmd, chdir=td)[1]
-            finally:
-                if td and os.path.exists(td):
-                    shutil.rmtree(td)
+            if conf.scm_cache_dir:
+                output = self._rev_parse_in_mirror(commit_to_check)
+            else:
+                td = None
+                try:
+                    td = tempfile.mkdtemp()
+                    SCM._run(["git", "clone", "-q", self.repository, td, "--bare"])
+                    cmd = ["git", "rev-parse", commit_to_check]
+                    log.debug(
+                        "Running `%s` to get the full commit hash for %s",
+                        " ".join(cmd),
+                        commit_to_check
+                    )
+                    output = SCM._run(cmd, chdir=td)[1]
+                finally:
+                    if td and os.path.exists(td):
+                        shutil.rmtree(td)
 
             if output:
                 return str(output.decode("utf-8").strip("\n"))
@@ -319,6 +423,75 @@ class SCM(object):
         else:
             raise RuntimeError("get_full_commit_hash: Unhandled SCM scheme.")
 
+    def _get_mirror_dir(self):
+        """
+        Returns the path to the bare mirror of the repository in ``scm_cache_dir``.
+
+        :return: path as a string
+        """
+        # The hash keeps the mirrors of the repositories with the same name apart.
+        digest = hashlib.sha1(self.repository.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(conf.scm_cache_dir, "{0}-{1}.git".format(self.name, digest))
+
+    def _rev_parse_in_mirror(self, rev):
+        """
+        Resolves the git revision using the bare mirror of the repository in
+        ``scm_cache_dir``. The mirror is created if it does not exist yet.
+
+        Commit hashes never change, so the mirror is updated by `git fetch` only
+        when it does not contain the commit yet. Other revisions, like branches
+        or tags, can move, so the mirror is always updated before resolving them.
+
+        :param str rev: the git revision, usually a shortened commit hash.
+        :return: the output of `git rev-parse` or None if the revision is not found.
+        :rtype: bytes or None
+        """
+        try:
+            os.makedirs(conf.scm_cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        mirror_dir = self._get_mirror_dir()
+        with _lock_mirror(mirror_dir):
+            if not os.path.isdir(mirror_dir):
+                log.debug("Creating the mirror of %s in %s", self.repository, mirror_dir)
+                # Clone to a temporary directory first, so an interrupted clone does not
+                # leave a broken mirror behind.
+                td = tempfile.mkdtemp(dir=conf.scm_cache_dir)
+                try:
+                    SCM._run(["git", "clone", "-q", "--mirror", self.repository, td])
+                    os.rename(td, mirror_dir)
+                finally:
+                    if os.path.exists(td):
+                        shutil.rmtree(td)
+                fetched = True
+            elif re.match(r"^[0-9a-f]+$", rev):
+                fetched = False
+            else:
+                SCM._run(["git", "fetch", "-q", "--prune", "origin"], chdir=mirror_dir)
+                fetched = True
+
+            cmd = ["git", "rev-parse", "--verify", "-q", rev]
+            log.debug(
+                "Running `%s` in %s to get the full commit hash for %s",
+                " ".join(cmd),
+                mirror_dir,
+                rev
+            )
+            try:
+                return SCM._run_without_retry(cmd, chdir=mirror_dir)[1]
+            except UnprocessableEntity:
+                if fetched:
+                    return None
+
+            log.debug("The commit %s is not in the mirror of %s yet", rev, self.repository)
+            SCM._run(["git", "fetch", "-q", "--prune", "origin"], chdir=mirror_dir)
+            try:
+                return SCM._run_without_retry(cmd, chdir=mirror_dir)[1]
+            except UnprocessableEntity:
+                return None
+
     def get_module_yaml(self):
         """
         Get full path to the module's YAML file.
@@ -366,3 +539,86 @@ class SCM(object):
     @commit.setter
     def commit(self, s):
         self._commit = str(s) if s else None
+
+
+class SCMExecutor(object):
+    """
+    Process-wide executor of the SCM lookups which can take long, like
+    resolving the refs of all the components of a module.
+
+    Every SCM host gets its own pool of at most ``scm_max_workers_per_host``
+    threads, so the submissions of many modules at once do not overload
+    a single SCM server and a slow server does not hold the lookups in the
+    other ones. The lookups of the same ref of the same repository which are
+    in flight at the same time share a single result.
+    """
+
+    # Number of seconds between the calls of the progress callback of :meth:`wait`.
+    progress_interval = 60
+
+    def __init__(self):
+        # {host: concurrent.futures.ThreadPoolExecutor}
+        self._executors = {}
+        # {(repository, ref): concurrent.futures.Future}
+        self._in_flight = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit_get_latest(self, repository, ref):
+        """
+        Schedule the lookup of the latest commit hash of the ref using :meth:`SCM.get_latest`.
+
+        :param str repository: the URL of the repository.
+        :param str ref: the branch name or the commit hash.
+        :return: the future of the commit hash.
+        :rtype: concurrent.futures.Future
+        """
+        key = (repository, ref)
+        with self._lock:
+            # The threads of the executors do not survive the fork.
+            if self._pid != os.getpid():
+                self._executors = {}
+                self._in_flight = {}
+                self._pid = os.getpid()
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                log.debug("Waiting for the lookup of %s#%s already in flight", repository, ref)
+                return future
+
+            host = urlparse(repository).netloc
+            executor = self._executors.get(host)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=conf.scm_max_workers_per_host)
+                self._executors[host] = executor
+            future = executor.submit(lambda: SCM(repository).get_latest(ref))
+            self._in_flight[key] = future
+
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def wait(self, futures, progress_callback=None):
+        """
+        Wait for all the futures to finish.
+
+        :param list futures: the futures returned by this executor.
+        :param progress_callback: the optional function called every
+            ``progress_interval`` seconds while some futures are not finished.
+            It is called in the waiting thread with the number of finished
+            futures and the number of all the futures.
+        """
+        not_done = set(futures)
+        while not_done:
+            _, not_done = concurrent.futures.wait(not_done, timeout=self.progress_interval)
+            if not_done and progress_callback:
+                num_done = len([f for f in futures if f.done()])
+                progress_callback(num_done, len(futures))
+
+
+scm_executor = SCMExecutor()
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+from collections import OrderedDict
 from datetime import datetime
 from functools import partial
+import hashlib
 import os
+import threading
 
 from gi.repository.GLib import Error as ModuleMDError
 from six import string_types, text_type
@@ -75,6 +78,76 @@ def load_mmd(yaml, is_file=False):
 load_mmd_file = partial(load_mmd, is_file=True)
 
 
+class ModulemdCache(object):
+    """
+    Bounded LRU cache of parsed modulemd objects shared by the whole process.
+
+    The entries are keyed by an identifier (usually the module build id) and
+    a digest of the modulemd YAML, so an entry is never returned for modulemd
+    content which differs from the one it was parsed from.
+
+    The cached objects are shared, so callers must not modify them. Use
+    ``mmd.copy()`` to get an object which can be modified.
+    """
+
+    def __init__(self, max_size):
+        """
+        :param int max_size: maximum number of cached entries. 0 disables the cache.
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, yaml):
+        """
+        Return the parsed modulemd for ``yaml``, loading it with :func:`load_mmd`
+        if it is not cached yet.
+
+        :param key: hashable identifier of the modulemd, e.g. the module build id.
+        :param str yaml: the modulemd YAML.
+        :return: the shared parsed modulemd.
+        :rtype: Modulemd.ModuleStream
+        :raises UnprocessableEntity: when the modulemd cannot be parsed.
+        """
+        from module_build_service.common.monitor import (
+            mmd_cache_hit_counter, mmd_cache_miss_counter
+        )
+
+        cache_key = (key, hashlib.sha1(to_text_type(yaml).encode("utf-8")).hexdigest())
+        with self._lock:
+            mmd = self._entries.pop(cache_key, None)
+            if mmd is not None:
+                # Re-insert the entry to mark it as the most recently used one
+                self._entries[cache_key] = mmd
+                mmd_cache_hit_counter.inc()
+                return mmd
+
+        mmd_cache_miss_counter.inc()
+        mmd = load_mmd(yaml)
+        if self.max_size <= 0:
+            return mmd
+
+        with self._lock:
+            # Drop entries of an older modulemd content stored under the same key
+            for stale_key in [k for k in self._entries if k[0] == key]:
+                del self._entries[stale_key]
+            self._entries[cache_key] = mmd
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return mmd
+
+    def clear(self):
+        """Remove all the entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+mmd_cache = ModulemdCache(conf.mmd_cache_size)
+
+
 def import_mmd(db_session, mmd, check_buildrequires=True):
     """
     Imports new module build defined by `mmd` to MBS database using `session`.
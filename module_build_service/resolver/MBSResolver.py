@@ -3,7 +3,10 @@
 """MBS handler functions."""
 
 from __future__ import absolute_import
+from collections import OrderedDict
 import logging
+import threading
+import time
 
 import kobo.rpmlib
 
@@ -17,10 +20,119 @@ from module_build_service.resolver.KojiResolver import KojiResolver
 log = logging.getLogger()
 
 
+def _get_nsvc(module):
+    return "{name}:{stream}:{version}:{context}".format(**module)
+
+
+class MBSResolverCache(object):
+    """
+    Caches the module builds returned by the queries of the remote MBS, so
+    the same queries done repeatedly while resolving the dependencies of a
+    module build are sent only once.
+
+    The results of the queries are cached for ``mbs_resolver_cache_ttl``
+    seconds, because new module builds can match the same query later. The
+    module builds in the ready state do not change anymore, so they are
+    also cached by their NSVC without any expiration. The least recently
+    used entries are dropped when there are more than
+    ``mbs_resolver_cache_size`` entries of each kind.
+    """
+
+    def __init__(self):
+        # {(mbs_url, query_key): (modules, expires)}
+        self._queries = OrderedDict()
+        # {(mbs_url, nsvc): module}
+        self._ready_modules = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_query_key(mbs_url, query):
+        return mbs_url, tuple(sorted(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in query.items()
+        ))
+
+    def get_modules(self, mbs_url, query):
+        """
+        Return the cached module builds matching the query or None if the query is not cached.
+
+        :param str mbs_url: the URL of the module builds API of the remote MBS.
+        :param dict query: the query arguments.
+        :rtype: list[dict] or None
+        """
+        key = self._get_query_key(mbs_url, query)
+        with self._lock:
+            entry = self._queries.pop(key, None)
+            if entry is None or entry[1] <= time.time():
+                return None
+            # Mark the entry as recently used.
+            self._queries[key] = entry
+            return list(entry[0])
+
+    def get_ready_module(self, mbs_url, nsvc):
+        """
+        Return the cached module build in the ready state or None if it is not cached.
+
+        :param str mbs_url: the URL of the module builds API of the remote MBS.
+        :param str nsvc: the NSVC of the module build.
+        :rtype: dict or None
+        """
+        key = (mbs_url, nsvc)
+        with self._lock:
+            module = self._ready_modules.pop(key, None)
+            if module is not None:
+                self._ready_modules[key] = module
+            return module
+
+    def add_modules(self, mbs_url, query, modules):
+        """
+        Cache the module builds returned by the query.
+
+        :param str mbs_url: the URL of the module builds API of the remote MBS.
+        :param dict query: the query arguments or None to cache just the
+            module builds in the ready state.
+        :param list modules: the module builds returned by the query.
+        """
+        max_size = conf.mbs_resolver_cache_size
+        if max_size <= 0:
+            return
+        with self._lock:
+            if query is not None and conf.mbs_resolver_cache_ttl > 0:
+                self._put(
+                    self._queries,
+                    self._get_query_key(mbs_url, query),
+                    (list(modules), time.time() + conf.mbs_resolver_cache_ttl),
+                    max_size,
+                )
+            for module in modules:
+                # Only the verbose results contain all the data of the module build
+                if module.get("state_name") == "ready" and "modulemd" in module:
+                    self._put(self._ready_modules, (mbs_url, _get_nsvc(module)), module, max_size)
+
+    def clear(self):
+        """Drop all the cached module builds."""
+        with self._lock:
+            self._queries.clear()
+            self._ready_modules.clear()
+
+    @staticmethod
+    def _put(entries, key, value, max_size):
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+
+mbs_resolver_cache = MBSResolverCache()
+
+
 class MBSResolver(KojiResolver):
 
     backend = "mbs"
 
+    # The number of module builds queried from MBS at once
+    per_page = 100
+
     def __init__(self, db_session, config):
         self.db_session = db_session
         self.mbs_prod_url = config.mbs_url
@@ -66,25 +178,27 @@ class MBSResolver(KojiResolver):
         :rtype: list[dict]
         :raises UnprocessableEntity: if no modules are found and ``strict`` is True.
         """
+        if version is not None and context is not None and not kwargs and (
+            (states or ["ready"]) == ["ready"]
+        ):
+            nsvc = ":".join([name, stream, str(version), context])
+            module = mbs_resolver_cache.get_ready_module(self.mbs_prod_url, nsvc)
+            if module is not None:
+                return [module]
+
         query = self._query_from_nsvc(name, stream, version, context, states)
         query["page"] = 1
-        query["per_page"] = 10
+        query["per_page"] = self.per_page
+        # Use the cursor pagination without counting all the modules. The MBS
+        # instances not supporting it ignore these arguments and return the pages.
+        query["cursor"] = ""
+        query["count"] = False
         query.update(kwargs)
-        modules = []
-
-        while True:
-            res = requests_session.get(self.mbs_prod_url, params=query)
-            if not res.ok:
-                raise RuntimeError(self._generic_error % (query, res.status_code))
-
-            data = res.json()
-            modules_per_page = data["items"]
-            modules += modules_per_page
 
-            if not data["meta"]["next"]:
-                break
-
-            query["page"] += 1
+        modules = mbs_resolver_cache.get_modules(self.mbs_prod_url, query)
+        if modules is None:
+            modules = self._query_modules(dict(query))
+            mbs_resolver_cache.add_modules(self.mbs_prod_url, query, modules)
 
         # Error handling
         if not modules:
@@ -99,6 +213,71 @@ class MBSResolver(KojiResolver):
         else:
             return modules
 
+    def _query_modules(self, query):
+        """
+        Query the module builds from MBS, going through all the pages.
+
+        :param dict query: the query arguments. The page or cursor is updated
+            in place.
+        :return: list of the module builds.
+        :rtype: list[dict]
+        """
+        modules = []
+        while True:
+            res = requests_session.get(self.mbs_prod_url, params=query)
+            if not res.ok:
+                raise RuntimeError(self._generic_error % (query, res.status_code))
+
+            data = res.json()
+            modules += data["items"]
+
+            if not data["meta"]["next"]:
+                return modules
+
+            if data["meta"].get("next_cursor"):
+                query["cursor"] = data["meta"]["next_cursor"]
+            else:
+                query["page"] += 1
+
+    def _prefetch_ready_modules(self, nsvcs):
+        """
+        Query the module builds in the ready state defined by the NSVCs in
+        bulk and cache them, so they are not queried one by one later.
+
+        The NSVCs not found by the bulk query, for example because the remote
+        MBS supports only a single ``nsvc`` argument, are just not cached.
+
+        :param nsvcs: the N:S:V:C strings of the module builds.
+        """
+        if conf.mbs_resolver_cache_size <= 0:
+            return
+        missing = sorted(set(
+            nsvc for nsvc in nsvcs
+            if mbs_resolver_cache.get_ready_module(self.mbs_prod_url, nsvc) is None
+        ))
+        # A single module build is queried by the usual lookup
+        if len(missing) < 2:
+            return
+
+        for i in range(0, len(missing), self.per_page):
+            chunk = missing[i:i + self.per_page]
+            query = {
+                "nsvc": chunk,
+                "state": ["ready"],
+                "verbose": True,
+                "page": 1,
+                "per_page": len(chunk),
+                "cursor": "",
+                "count": False,
+            }
+            res = requests_session.get(self.mbs_prod_url, params=query)
+            if not res.ok:
+                # The modules are queried one by one later, which reports the error if it persists
+                log.warning(self._generic_error, query, res.status_code)
+                return
+            modules = [m for m in res.json()["items"] if _get_nsvc(m) in chunk]
+            mbs_resolver_cache.add_modules(self.mbs_prod_url, None, modules)
+
     def get_module(self, name, stream, version, context, states=None, strict=False):
         rv = self._get_modules(name, stream, version, context, states, strict)
         if rv:
@@ -261,6 +440,8 @@ class MBSResolver(KojiResolver):
             # In case KojiResolver is enabled for this base module, ask Koji for list of
             # Koji builds and then get the modulemd file from the MBS running in infra.
             koji_builds = self.get_buildrequired_koji_builds(name, stream, base_module_mmd)
+            self._prefetch_ready_modules(
+                ":".join([name, stream] + build["release"].split(".")) for build in koji_builds)
             ret = []
             for build in koji_builds:
                 version, context = build["release"].split(".")
@@ -290,7 +471,12 @@ class MBSResolver(KojiResolver):
         results = {}
         for key in keys:
             results[key] = set()
-        for module_name, module_info in mmd.get_xmd()["mbs"]["buildrequires"].items():
+        buildrequires = mmd.get_xmd()["mbs"]["buildrequires"]
+        self._prefetch_ready_modules(
+            ":".join([name, info["stream"], str(info["version"]), info["context"]])
+            for name, info in buildrequires.items()
+        )
+        for module_name, module_info in buildrequires.items():
             local_modules = models.ModuleBuild.local_modules(
                 self.db_session, module_name, module_info["stream"])
             if local_modules:
@@ -374,6 +560,15 @@ class MBSResolver(KojiResolver):
             )
 
         buildrequires = queried_mmd.get_xmd()["mbs"]["buildrequires"]
+        self._prefetch_ready_modules(
+            ":".join([
+                name,
+                details["stream"],
+                str(details["version"]),
+                details.get("context", models.DEFAULT_MODULE_CONTEXT),
+            ])
+            for name, details in buildrequires.items()
+        )
         # Queue up the next tier of deps that we should look at..
         for name, details in buildrequires.items():
             local_modules = models.ModuleBuild.local_modules(
@@ -415,6 +610,7 @@ class MBSResolver(KojiResolver):
         :return: a dictionary
         """
         new_requires = {}
+        self._prefetch_ready_modules(nsvc for nsvc in requires if len(nsvc.split(":")) == 4)
         for nsvc in requires:
             nsvc_splitted = nsvc.split(":")
             if len(nsvc_splitted) == 2:
@@ -2,21 +2,30 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 import concurrent.futures
+import multiprocessing
 import threading
 
+from sqlalchemy import and_, case, func, or_
+
 from module_build_service.common import conf, log, models
 from module_build_service.scheduler import events
 from module_build_service.scheduler.db_session import db_session
 from module_build_service.scheduler.reuse import get_reusable_components, reuse_component
 
 
-def at_concurrent_component_threshold(config):
+def get_free_concurrent_component_slots(config):
     """
-    Determines if the number of concurrent component builds has reached
-    the configured threshold
+    Determines how many component builds can be submitted right now without
+    exceeding the configured threshold of concurrent component builds.
+
+    The number of component builds in the BUILDING state is counted only
+    once, so callers submitting multiple components should call this once
+    and keep track of the components they submit themselves.
+
     :param config: Module Build Service configuration object
-    :return: boolean representing if there are too many concurrent builds at
-    this time
+    :return: the number of free slots for component builds, or None when
+        the number of concurrent component builds is not limited
+    :rtype: int or None
     """
 
     # We must not check it for "mock" backend.
@@ -26,9 +35,12 @@ def at_concurrent_component_threshold(config):
     # build whole module in this single continue_batch_build call to keep
     # the number of created buildroots low. The concurrent build limit
     # for mock backend is secured by setting max_workers in
-    # ThreadPoolExecutor to num_concurrent_builds.
+    # ThreadPoolExecutor to num_concurrent_local_builds.
     if conf.system == "mock":
-        return False
+        return None
+
+    if not config.num_concurrent_builds:
+        return None
 
     import koji  # Placed here to avoid py2/py3 conflicts...
 
@@ -36,13 +48,235 @@ def at_concurrent_component_threshold(config):
     # we do not submit new build for them. They are in BUILDING state
     # just internally in MBS to be handled by
     # scheduler.handlers.components.complete.
-    if config.num_concurrent_builds:
-        count = db_session.query(models.ComponentBuild).filter_by(
-            state=koji.BUILD_STATES["BUILDING"], reused_component_id=None).count()
-        if config.num_concurrent_builds <= count:
+    count = db_session.query(models.ComponentBuild).filter_by(
+        state=koji.BUILD_STATES["BUILDING"], reused_component_id=None).count()
+    return max(config.num_concurrent_builds - count, 0)
+
+
+def at_concurrent_component_threshold(config):
+    """
+    Determines if the number of concurrent component builds has reached
+    the configured threshold
+    :param config: Module Build Service configuration object
+    :return: boolean representing if there are too many concurrent builds at
+    this time
+    """
+    return get_free_concurrent_component_slots(config) == 0
+
+
+def get_building_weight(module):
+    """
+    Returns the total weight of component builds of ``module`` which are
+    in the BUILDING state and were not reused.
+
+    :param module: the ModuleBuild object.
+    :rtype: float
+    """
+    return sum(
+        c.weight or 0.0 for c in module.component_builds
+        if c.is_building and c.reused_component_id is None
+    )
+
+
+def get_remaining_critical_path_weight(module):
+    """
+    Returns the weight of the longest path through the not yet built
+    batches of ``module``. Batches are built one after another and a batch
+    is done when its heaviest component is built, so this is the sum of
+    the weights of the heaviest unfinished component of every remaining batch.
+
+    :param module: the ModuleBuild object.
+    :rtype: float
+    """
+    heaviest = {}
+    for c in module.component_builds:
+        if c.batch < module.batch or c.is_completed or c.is_failed:
+            continue
+        heaviest[c.batch] = max(heaviest.get(c.batch, 0.0), c.weight or 0.0)
+    return sum(heaviest.values())
+
+
+def get_module_build_weights(db_session, module_build_ids):
+    """
+    Returns the weights computed by :func:`get_building_weight` and
+    :func:`get_remaining_critical_path_weight` for multiple module builds
+    using a single aggregate query, without loading their component builds.
+
+    :param db_session: SQLAlchemy database session object.
+    :param list module_build_ids: the ids of the module builds.
+    :return: dict mapping the module build ids to tuples of the building
+        weight and the remaining critical path weight.
+    :rtype: dict
+    """
+    import koji  # Placed here to avoid py2/py3 conflicts...
+
+    weights = dict((module_build_id, (0.0, 0.0)) for module_build_id in module_build_ids)
+    if not module_build_ids:
+        return weights
+
+    cb = models.ComponentBuild
+    weight = func.coalesce(cb.weight, 0.0)
+    is_building = and_(
+        cb.state == koji.BUILD_STATES["BUILDING"], cb.reused_component_id.is_(None))
+    is_remaining = and_(
+        cb.batch >= models.ModuleBuild.batch,
+        or_(
+            cb.state.is_(None),
+            cb.state.notin_([koji.BUILD_STATES["COMPLETE"], koji.BUILD_STATES["FAILED"]]),
+        ),
+    )
+    # The building weight of every batch and the weight of its heaviest remaining component
+    rows = db_session.query(
+        cb.module_id,
+        func.sum(case([(is_building, weight)], else_=0.0)),
+        func.max(case([(is_remaining, weight)], else_=0.0)),
+    ).join(
+        models.ModuleBuild, cb.module_id == models.ModuleBuild.id
+    ).filter(
+        cb.module_id.in_(module_build_ids)
+    ).group_by(cb.module_id, cb.batch)
+
+    for module_build_id, building_weight, heaviest_weight in rows:
+        total_building, total_critical_path = weights[module_build_id]
+        weights[module_build_id] = (
+            total_building + float(building_weight or 0.0),
+            total_critical_path + float(heaviest_weight or 0.0),
+        )
+    return weights
+
+
+class ComponentBuildAdmission(object):
+    """
+    Decides which component builds can be submitted right now.
+
+    The number of concurrent component builds is limited by
+    ``num_concurrent_builds``. When ``num_concurrent_builds_weight`` is set,
+    the total weight of the concurrent component builds is limited too. The
+    weight budget is shared fairly between the module builds with components
+    waiting to be built, so a module build with many heavy components cannot
+    starve the others. A component heavier than the budget, or than the share
+    of its module build, is still admitted when nothing else occupies the
+    budget or the share, so it is never blocked forever.
+    """
+
+    def __init__(self, slots=None, weight_budget=None, used_weight=0.0,
+                 module_share=None, module_used_weight=0.0):
+        """
+        :param slots: the number of free slots for component builds or None
+            when not limited.
+        :param weight_budget: the maximum total weight of concurrent component
+            builds or None when not limited.
+        :param float used_weight: the weight of currently building components.
+        :param module_share: the part of the weight budget of a single module
+            build or None when not limited.
+        :param float module_used_weight: the weight of currently building
+            components of the module build.
+        """
+        self.slots = slots
+        self.weight_budget = weight_budget
+        self.used_weight = used_weight
+        self.module_share = module_share
+        self.module_used_weight = module_used_weight
+
+    @property
+    def exhausted(self):
+        """True when no new component build can be admitted."""
+        if self.slots is not None and self.slots <= 0:
             return True
+        return self.weight_budget is not None and 0 < self.weight_budget <= self.used_weight
+
+    def admit(self, component):
+        """
+        Admits the component build if it fits into the free slots and the
+        weight budget and accounts for it.
+
+        :param component: the ComponentBuild object.
+        :return: True if the component build can be submitted.
+        :rtype: bool
+        """
+        weight = component.weight or 0.0
+        if self.slots is not None and self.slots <= 0:
+            return False
+        if (
+            self.weight_budget is not None
+            and self.used_weight > 0
+            and self.used_weight + weight > self.weight_budget
+        ):
+            return False
+        if (
+            self.module_share is not None
+            and self.module_used_weight > 0
+            and self.module_used_weight + weight > self.module_share
+        ):
+            return False
+        self.account(component)
+        return True
+
+    def account(self, component):
+        """
+        Accounts for the component build submitted without :meth:`admit`.
+
+        :param component: the ComponentBuild object.
+        """
+        weight = component.weight or 0.0
+        if self.slots is not None:
+            self.slots -= 1
+        self.used_weight += weight
+        self.module_used_weight += weight
+
+
+def get_component_build_admission(config, module=None, builder=None):
+    """
+    Returns the :class:`ComponentBuildAdmission` for the component builds
+    submitted right now.
+
+    :param config: Module Build Service configuration object
+    :param module: the ModuleBuild object whose components are going to be
+        submitted. When None, the weight budget is not split between module builds.
+    :param builder: the builder used to find out the free capacity of the build
+        system when ``koji_load_aware_scheduling`` is enabled.
+    :rtype: ComponentBuildAdmission
+    """
+    slots = get_free_concurrent_component_slots(config)
+    if conf.system == "mock" or not config.num_concurrent_builds_weight:
+        return ComponentBuildAdmission(slots=slots)
+
+    import koji  # Placed here to avoid py2/py3 conflicts...
 
-    return False
+    building = koji.BUILD_STATES["BUILDING"]
+    used_weight = db_session.query(
+        func.coalesce(func.sum(models.ComponentBuild.weight), 0.0)
+    ).filter(
+        models.ComponentBuild.state == building,
+        models.ComponentBuild.reused_component_id.is_(None),
+    ).scalar()
+    used_weight = float(used_weight)
+    weight_budget = float(config.num_concurrent_builds_weight)
+
+    if builder is not None and config.koji_load_aware_scheduling:
+        free_capacity = builder.get_free_build_capacity()
+        if free_capacity is not None:
+            weight_budget = min(weight_budget, used_weight + free_capacity)
+
+    if module is None:
+        return ComponentBuildAdmission(slots, weight_budget, used_weight)
+
+    # The module builds which have components building or waiting for build in
+    # their current batch share the weight budget.
+    active_modules = db_session.query(
+        func.count(func.distinct(models.ComponentBuild.module_id))
+    ).join(
+        models.ModuleBuild, models.ComponentBuild.module_id == models.ModuleBuild.id
+    ).filter(
+        models.ModuleBuild.state == models.BUILD_STATES["build"],
+        models.ComponentBuild.batch == models.ModuleBuild.batch,
+        models.ComponentBuild.reused_component_id.is_(None),
+        (models.ComponentBuild.state.is_(None)) | (models.ComponentBuild.state == building),
+    ).scalar()
+    module_share = weight_budget / max(active_modules, 1)
+
+    return ComponentBuildAdmission(
+        slots, weight_budget, used_weight, module_share, get_building_weight(module))
 
 
 BUILD_COMPONENT_DB_SESSION_LOCK = threading.Lock()
@@ -117,25 +351,38 @@ def continue_batch_build(config, module, builder, components=None):
             continue
         builder.recover_orphaned_artifact(component)
 
+    # Find out which components can be submitted. Components marked as
+    # BUILDING by recover_orphaned_artifact above are already counted in.
+    admission = get_component_build_admission(config, module, builder)
+
     for c in unbuilt_components:
         # If a previous build of the component was found, then the state will be marked as
         # COMPLETE so we should skip this
         if c.is_completed:
             continue
-        # Check the concurrent build threshold.
-        if at_concurrent_component_threshold(config):
+        # Check the concurrent build threshold. The heaviest components are on
+        # the critical path of the batch, so the lighter ones must not overtake them.
+        if not admission.admit(c):
             log.info("Concurrent build threshold met")
             break
 
         # We set state to "BUILDING" here because at this point we are committed
-        # to build the component and at_concurrent_component_threshold() works by
-        # counting the number of components in the "BUILDING" state.
+        # to build the component and get_component_build_admission() works by
+        # counting the components in the "BUILDING" state.
         c.state = koji.BUILD_STATES["BUILDING"]
         components_to_build.append(c)
 
     # Start build of components in this batch.
-    max_workers = config.num_threads_for_build_submissions
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    if conf.system == "mock":
+        # Every thread waits for its own mock process, so the local builds can use all
+        # the CPUs. The threads are named the same way in every batch, so the mock
+        # configs, chroots and results directories named after them are reused.
+        max_workers = config.num_concurrent_local_builds or multiprocessing.cpu_count()
+    else:
+        max_workers = config.num_threads_for_build_submissions
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="mbs-build"
+    ) as executor:
         futures = {
             executor.submit(start_build_component, db_session, builder, c): c
             for c in components_to_build
@@ -28,6 +28,7 @@ import module_build_service.common.monitor as monitor
 
 from module_build_service.scheduler import events
 from module_build_service.scheduler.db_session import db_session
+from module_build_service.scheduler.routing_index import routing_index
 from module_build_service.scheduler.handlers import components, repos, modules, greenwave, tags
 
 
@@ -197,6 +198,29 @@ class MBSConsumer(fedmsg.consumers.FedmsgConsumer):
             if koji.BUILD_STATES[state] not in ON_BUILD_CHANGE_HANDLERS:
                 raise KeyError("Koji build states %r not handled." % state)
 
+    @staticmethod
+    def _get_module_build(db_session, module_build_id):
+        """
+        Return the module build from the identity map of the session, so it
+        is not queried again when it is already loaded.
+        """
+        if module_build_id is None:
+            return None
+        return db_session.query(models.ModuleBuild).get(module_build_id)
+
+    @classmethod
+    def _get_building_module_build(cls, db_session, tag_name):
+        """
+        Return the module build in the build state using the Koji tag or None.
+        The routing index can map the Koji tag to a module build which has
+        left the build state in the meantime, so its state is checked here.
+        """
+        module_build_id = routing_index.get_module_build_id_by_tag(db_session, tag_name)
+        module_build = cls._get_module_build(db_session, module_build_id)
+        if module_build is None or module_build.state != models.BUILD_STATES["build"]:
+            return None
+        return module_build
+
     def _map_message(self, db_session, event_info):
         """Map message to its corresponding event handler and module build"""
 
@@ -204,6 +228,10 @@ class MBSConsumer(fedmsg.consumers.FedmsgConsumer):
 
         if event == events.KOJI_BUILD_CHANGE:
             handler = ON_BUILD_CHANGE_HANDLERS[event_info["build_new_state"]]
+            if event_info["module_build_id"] is None:
+                module_build_id = routing_index.get_module_build_id_by_task_id(
+                    db_session, event_info["task_id"])
+                return handler, self._get_module_build(db_session, module_build_id)
             build = models.ComponentBuild.from_component_event(
                 db_session, event_info["task_id"], event_info["module_build_id"])
             if build:
@@ -213,13 +241,13 @@ class MBSConsumer(fedmsg.consumers.FedmsgConsumer):
         if event == events.KOJI_REPO_CHANGE:
             return (
                 ON_REPO_CHANGE_HANDLER,
-                models.ModuleBuild.get_by_tag(db_session, event_info["tag_name"])
+                self._get_building_module_build(db_session, event_info["tag_name"]),
             )
 
         if event == events.KOJI_TAG_CHANGE:
             return (
                 ON_TAG_CHANGE_HANDLER,
-                models.ModuleBuild.get_by_tag(db_session, event_info["tag_name"])
+                self._get_building_module_build(db_session, event_info["tag_name"]),
             )
 
         if event == events.MBS_MODULE_STATE_CHANGE:
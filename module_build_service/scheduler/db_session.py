@@ -10,6 +10,9 @@ from module_build_service.common.config import conf
 from module_build_service.common.models import (
     session_before_commit_handlers, send_message_after_module_build_state_change
 )
+from module_build_service.scheduler.routing_index import (
+    apply_routing_index_changes, discard_routing_index_changes, update_routing_index
+)
 
 __all__ = ("db_session",)
 
@@ -21,6 +24,10 @@ def _setup_event_listeners(db_session):
     event_hooks = (
         ("before_commit", session_before_commit_handlers),
         ("after_commit", send_message_after_module_build_state_change),
+        ("after_flush", update_routing_index),
+        ("after_commit", apply_routing_index_changes),
+        ("after_rollback", discard_routing_index_changes),
+        ("after_soft_rollback", discard_routing_index_changes),
     )
 
     for event, handler in event_hooks:
@@ -2,6 +2,8 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 import errno
+import hashlib
+import json
 import os
 import shutil
 import tempfile
@@ -9,6 +11,7 @@ import tempfile
 import dnf
 import kobo.rpmlib
 import koji
+import requests
 import six.moves.xmlrpc_client as xmlrpclib
 
 from module_build_service.common import conf, log, models, scm
@@ -255,27 +258,17 @@ def handle_collisions_with_base_module_rpms(mmd, arches):
     )
     koji_session = get_session(conf, login=False)
     bm_rpms = _get_rpms_from_tags(koji_session, list(bm_tags), arches)
-    # The keys are base module RPM names and the values are sets of RPM NEVRAs with that name
-    name_to_nevras = {}
-    for bm_rpm in bm_rpms:
-        rpm_name = kobo.rpmlib.parse_nvra(bm_rpm)["name"]
-        name_to_nevras.setdefault(rpm_name, set())
-        name_to_nevras[rpm_name].add(bm_rpm)
-    # Clear this out of RAM as soon as possible since this value can be huge
-    del bm_rpms
 
     log.debug(
         "Querying Koji for the latest RPMs from the other buildrequired modules from the tags: %s",
         ", ".join(non_bm_tags),
     )
+    non_bm_rpms = _get_rpms_from_tags(koji_session, list(non_bm_tags), arches)
     # This will contain any NEVRAs of RPMs in the base module tag with the same name as those in the
     # buildrequired modules
     conflicts = set()
-    non_bm_rpms = _get_rpms_from_tags(koji_session, list(non_bm_tags), arches)
-    for rpm in non_bm_rpms:
-        rpm_name = kobo.rpmlib.parse_nvra(rpm)["name"]
-        if rpm_name in name_to_nevras:
-            conflicts = conflicts | name_to_nevras[rpm_name]
+    for rpm_name in set(bm_rpms) & set(non_bm_rpms):
+        conflicts |= bm_rpms[rpm_name]
 
     # Add the conflicting NEVRAs to `ursine_rpms` so the Conflicts are later generated for them
     # in the KojiModuleBuilder.
@@ -290,8 +283,9 @@ def _get_rpms_from_tags(koji_session, tags, arches):
     :param koji.ClientSession koji_session: the Koji session to use to query
     :param list tags: the list of tags to get the RPMs from
     :param list arches: the arches to limit the external repo queries to
-    :return: the set of RPMs in NEVRA form of the input tags
-    :rtype: set
+    :return: a dictionary where the keys are RPM names and the values are sets of the RPM NEVRAs
+        with that name
+    :rtype: dict
     :raises RuntimeError: if the Koji query fails
     """
     log.debug("Get the latest RPMs from the tags: %s", ", ".join(tags))
@@ -305,12 +299,12 @@ def _get_rpms_from_tags(koji_session, tags, arches):
             .format(", ".join(tags))
         )
 
-    nevras = set()
+    name_to_nevras = {}
     for tagged_result in tagged_results:
         rpms, _ = tagged_result
         for rpm_dict in rpms:
             nevra = kobo.rpmlib.make_nvra(rpm_dict, force_epoch=True)
-            nevras.add(nevra)
+            name_to_nevras.setdefault(rpm_dict["name"], set()).add(nevra)
 
     repo_results = koji_retrying_multicall_map(koji_session, koji_session.getExternalRepoList, tags)
     if not repo_results:
@@ -323,20 +317,28 @@ def _get_rpms_from_tags(koji_session, tags, arches):
             # Use the repo ID in the cache directory name in case there is more than one external
             # repo associated with the tag
             cache_dir_name = "{}-{}".format(repo["tag_name"], repo["external_repo_id"])
-            nevras = nevras | _get_rpms_in_external_repo(repo["url"], arches, cache_dir_name)
+            repo_rpms = _get_rpms_in_external_repo(repo["url"], arches, cache_dir_name)
+            for rpm_name, nevras in repo_rpms.items():
+                name_to_nevras.setdefault(rpm_name, set()).update(nevras)
 
-    return nevras
+    return name_to_nevras
 
 
 def _get_rpms_in_external_repo(repo_url, arches, cache_dir_name):
     """
     Get the available RPMs in the external repo for the provided arches.
 
+    The RPMs of every arch are kept in an index file in the cache directory together with the
+    checksum of the repomd.xml they were read from. The repo of the arch is loaded by DNF only
+    when its repomd.xml has changed since the index was written or when the repomd.xml can't be
+    read without DNF.
+
     :param str repo_url: the URL of the external repo with the "$arch" variable included
     :param list arches: the list of arches to query the external repo for
     :param str cache_dir_name: the cache directory name under f"{conf.cache_dir}/dnf"
-    :return: a set of the RPM NEVRAs
-    :rtype: set
+    :return: a dictionary where the keys are RPM names and the values are sets of the RPM NEVRAs
+        with that name
+    :rtype: dict
     :raise RuntimeError: if the cache is not writeable or the external repo couldn't be loaded
     :raises ValueError: if there is no "$arch" variable in repo URL
     """
@@ -345,23 +347,139 @@ def _get_rpms_in_external_repo(repo_url, arches, cache_dir_name):
             "The external repo {} does not contain the $arch variable".format(repo_url)
         )
 
+    cache_location = os.path.join(conf.cache_dir, "dnf", cache_dir_name)
+    try:
+        # exist_ok=True can't be used in Python 2
+        os.makedirs(cache_location, mode=0o0770)
+    except OSError as e:
+        # Don't fail if the directories already exist
+        if e.errno != errno.EEXIST:
+            log.exception("Failed to create the cache directory %s", cache_location)
+            raise RuntimeError("The MBS cache is not writeable.")
+
+    name_to_nevras = {}
+    # The keys are the canon arches of the repos which need to be loaded by DNF and the values
+    # are tuples of the repo URL and the checksum of its repomd.xml
+    outdated_repos = {}
+    for arch in arches:
+        # Convert arch to canon_arch. This handles cases where Koji "i686" arch is mapped to
+        # "i386" when generating RPM repository.
+        canon_arch = koji.canonArch(arch)
+        repo_arch_url = repo_url.replace("$arch", canon_arch)
+        repomd_checksum = _get_repomd_checksum(repo_arch_url)
+        index_path = os.path.join(cache_location, "rpms-{}.json".format(canon_arch))
+        repo_rpms = None
+        if repomd_checksum is not None:
+            repo_rpms = _load_external_repo_index(index_path, repomd_checksum)
+        if repo_rpms is None:
+            outdated_repos[canon_arch] = (repo_arch_url, repomd_checksum)
+            continue
+        log.debug("Using the cached RPMs of the external repo %s", repo_arch_url)
+        for rpm_name, nevras in repo_rpms.items():
+            name_to_nevras.setdefault(rpm_name, set()).update(nevras)
+
+    if not outdated_repos:
+        return name_to_nevras
+
+    repo_urls = dict((arch, url) for arch, (url, _) in outdated_repos.items())
+    for canon_arch, repo_rpms in _load_external_repos(repo_urls, cache_location).items():
+        repomd_checksum = outdated_repos[canon_arch][1]
+        if repomd_checksum is not None:
+            index_path = os.path.join(cache_location, "rpms-{}.json".format(canon_arch))
+            _save_external_repo_index(index_path, repomd_checksum, repo_rpms)
+        for rpm_name, nevras in repo_rpms.items():
+            name_to_nevras.setdefault(rpm_name, set()).update(nevras)
+
+    return name_to_nevras
+
+
+def _get_repomd_checksum(repo_url):
+    """
+    Get the checksum of the repomd.xml of the repo, which changes whenever the repo is updated.
+
+    :param str repo_url: the URL of the repo
+    :return: the SHA-256 checksum of the repomd.xml or None if it couldn't be read, for example
+        because the repo is only reachable through the proxy configured for DNF
+    :rtype: str or None
+    """
+    repomd_url = repo_url.rstrip("/") + "/repodata/repomd.xml"
+    try:
+        if repomd_url.startswith("file://"):
+            with open(repomd_url[len("file://"):], "rb") as f:
+                content = f.read()
+        else:
+            response = requests.get(repomd_url, timeout=conf.dnf_timeout)
+            response.raise_for_status()
+            content = response.content
+    except (IOError, OSError, requests.exceptions.RequestException) as e:
+        log.info("Cannot get the repomd.xml of the external repo %s: %s", repo_url, e)
+        return None
+    return hashlib.sha256(content).hexdigest()
+
+
+def _load_external_repo_index(index_path, repomd_checksum):
+    """
+    Load the RPMs of the external repo from the index file.
+
+    :param str index_path: the path to the index file
+    :param str repomd_checksum: the checksum of the current repomd.xml of the repo
+    :return: a dictionary where the keys are RPM names and the values are lists of the RPM NEVRAs
+        with that name or None if there is no index of the current repomd.xml
+    :rtype: dict or None
+    """
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if index.get("repomd_checksum") != repomd_checksum:
+        return None
+    return index.get("rpms")
+
+
+def _save_external_repo_index(index_path, repomd_checksum, name_to_nevras):
+    """
+    Save the RPMs of the external repo to the index file.
+
+    The index is written to a temporary file which is renamed afterwards, so the concurrent
+    readers never see a partially written index.
+
+    :param str index_path: the path to the index file
+    :param str repomd_checksum: the checksum of the repomd.xml the RPMs were read from
+    :param dict name_to_nevras: the RPM names mapped to the sets of the RPM NEVRAs
+    """
+    index = {
+        "repomd_checksum": repomd_checksum,
+        "rpms": dict((name, sorted(nevras)) for name, nevras in name_to_nevras.items()),
+    }
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.rename(temp_path, index_path)
+    except (IOError, OSError):
+        # The index only saves loading the repo next time, so this is not fatal
+        log.exception("Failed to save the index of the external repo to %s", index_path)
+
+
+def _load_external_repos(repo_urls, cache_location):
+    """
+    Load the external repos by DNF and get their available RPMs.
+
+    :param dict repo_urls: the canon arches mapped to the URLs of the repos of these arches
+    :param str cache_location: the DNF cache directory of the repos
+    :return: a dictionary where the keys are the canon arches and the values are dictionaries
+        of the RPM names mapped to the sets of the RPM NEVRAs with that name
+    :rtype: dict
+    :raise RuntimeError: if the external repo couldn't be loaded
+    """
     base = dnf.Base()
     try:
         dnf_conf = base.conf
         # Expire the metadata right away so that when a repo is loaded, it will always check to
         # see if the external repo has been updated
         dnf_conf.metadata_expire = 0
-
-        cache_location = os.path.join(conf.cache_dir, "dnf", cache_dir_name)
-        try:
-            # exist_ok=True can't be used in Python 2
-            os.makedirs(cache_location, mode=0o0770)
-        except OSError as e:
-            # Don't fail if the directories already exist
-            if e.errno != errno.EEXIST:
-                log.exception("Failed to create the cache directory %s", cache_location)
-                raise RuntimeError("The MBS cache is not writeable.")
-
         # Tell DNF to use the cache directory
         dnf_conf.cachedir = cache_location
         # Don't skip repos that can't be synchronized
@@ -372,12 +490,10 @@ def _get_rpms_in_external_repo(repo_url, arches, cache_dir_name):
         base.reset(repos=True, goal=True, sack=True)
 
         # Add a separate repo for each architecture
-        for arch in arches:
-            # Convert arch to canon_arch. This handles cases where Koji "i686" arch is mapped to
-            # "i386" when generating RPM repository.
-            canon_arch = koji.canonArch(arch)
+        repo_arches = {}
+        for canon_arch, repo_arch_url in repo_urls.items():
             repo_name = "repo_{}".format(canon_arch)
-            repo_arch_url = repo_url.replace("$arch", canon_arch)
+            repo_arches[repo_name] = canon_arch
             base.repos.add_new_repo(
                 repo_name, dnf_conf, baseurl=[repo_arch_url], minrate=conf.dnf_minrate,
             )
@@ -400,7 +516,7 @@ def _get_rpms_in_external_repo(repo_url, arches, cache_dir_name):
         base.fill_sack(load_system_repo=False)
 
         # Return all the available RPMs
-        nevras = set()
+        rpms = dict((canon_arch, {}) for canon_arch in repo_urls)
         for rpm in base.sack.query().available():
             rpm_dict = {
                 "arch": rpm.arch,
@@ -410,8 +526,9 @@ def _get_rpms_in_external_repo(repo_url, arches, cache_dir_name):
                 "version": rpm.version,
             }
             nevra = kobo.rpmlib.make_nvra(rpm_dict, force_epoch=True)
-            nevras.add(nevra)
+            repo_rpms = rpms[repo_arches[rpm.reponame]]
+            repo_rpms.setdefault(rpm.name, set()).add(nevra)
     finally:
         base.close()
 
-    return nevras
+    return rpms
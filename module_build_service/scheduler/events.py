@@ -72,12 +72,19 @@ def mbs_event_handler(func):
     A decorator for MBS event handlers. It implements common tasks which should otherwise
     be repeated in every MBS event handler, for example:
 
+      - store the log messages of module and component builds added by the
+        handler in a single transaction.
       - at the end of handler, call events.scheduler.run().
     """
     @wraps(func)
     def wrapper(*args, **kwargs):
+        # Placed here to avoid circular imports
+        from module_build_service.common.models import log_message_buffer
+        from module_build_service.scheduler.db_session import db_session
+
         try:
-            return func(*args, **kwargs)
+            with log_message_buffer.buffered(db_session):
+                return func(*args, **kwargs)
         finally:
             scheduler.run()
     # save origin function as functools.wraps from python2 doesn't preserve the signature
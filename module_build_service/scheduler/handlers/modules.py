@@ -173,7 +173,7 @@ def init(msg_id, module_build_id, module_build_state):
         build_logs.build_logs_dir = mock_resultsdir
 
     build_logs.start(db_session, build)
-    log.info("Start to handle %s which is in init state.", build.mmd().get_nsvc())
+    log.info("Start to handle %s which is in init state.", build.mmd(read_only=True).get_nsvc())
 
     error_msg = ""
     failure_reason = "unspec"
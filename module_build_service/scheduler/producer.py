@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 from datetime import timedelta, datetime
+import logging
 import operator
 
 import koji
@@ -10,13 +11,14 @@ from sqlalchemy.orm import lazyload, load_only
 
 from module_build_service.common import conf, log, models
 from module_build_service.builder import GenericBuilder
-from module_build_service.common.koji import get_session
+from module_build_service.common.koji import get_session, koji_retrying_multicall_map
 import module_build_service.scheduler
 import module_build_service.scheduler.consumer
 from module_build_service.scheduler import celery_app
 from module_build_service.scheduler.consumer import ON_MODULE_CHANGE_HANDLERS
 from module_build_service.scheduler.batches import (
-    at_concurrent_component_threshold,
+    get_component_build_admission,
+    get_module_build_weights,
     start_next_batch_build,
 )
 from module_build_service.scheduler.db_session import db_session
@@ -24,6 +26,9 @@ from module_build_service.scheduler.greenwave import greenwave
 from module_build_service.scheduler.handlers.components import build_task_finalize
 from module_build_service.scheduler.handlers.tags import tagged
 
+# The maximum number of Koji tasks queried in a single multicall by fail_lost_builds
+FAIL_LOST_BUILDS_CHUNK_SIZE = 200
+
 
 @celery_app.on_after_finalize.connect
 def setup_periodic_tasks(sender, **kwargs):
@@ -108,16 +113,21 @@ def fail_lost_builds():
         # We don't do this on behalf of users
         koji_session = get_session(conf, login=False)
         log.info("Querying tasks for statuses:")
-        res = db_session.query(models.ComponentBuild).filter_by(
-            state=koji.BUILD_STATES["BUILDING"]
-        ).options(lazyload("module_build")).all()
+        res = db_session.query(models.ComponentBuild).filter(
+            models.ComponentBuild.state == koji.BUILD_STATES["BUILDING"],
+            # Don't check tasks which haven't been triggered yet
+            models.ComponentBuild.task_id.isnot(None),
+        ).options(
+            lazyload("module_build"),
+            load_only("id", "package", "task_id", "reused_component_id", "state"),
+        ).order_by(models.ComponentBuild.id).all()
 
         log.info("Checking status for %s tasks", len(res))
+        debug_enabled = log.isEnabledFor(logging.DEBUG)
+        component_builds = []
         for component_build in res:
-            log.debug(component_build.json(db_session))
-            # Don't check tasks which haven't been triggered yet
-            if not component_build.task_id:
-                continue
+            if debug_enabled:
+                log.debug(component_build.json(db_session))
 
             # Don't check tasks for components which have been reused,
             # they may have BUILDING state temporarily before we tag them
@@ -129,52 +139,91 @@ def fail_lost_builds():
                 )
                 continue
 
-            task_id = component_build.task_id
-
-            log.info('Checking status of task_id "%s"', task_id)
-            task_info = koji_session.getTaskInfo(task_id)
-
-            state_mapping = {
-                # Cancelled and failed builds should be marked as failed.
-                koji.TASK_STATES["CANCELED"]: koji.BUILD_STATES["FAILED"],
-                koji.TASK_STATES["FAILED"]: koji.BUILD_STATES["FAILED"],
-                # Completed tasks should be marked as complete.
-                koji.TASK_STATES["CLOSED"]: koji.BUILD_STATES["COMPLETE"],
-            }
-
-            # If it is a closed/completed task, then we can extract the NVR
-            build_version, build_release = None, None  # defaults
-            if task_info["state"] == koji.TASK_STATES["CLOSED"]:
-                builds = koji_session.listBuilds(taskID=task_id)
-                if not builds:
-                    log.warning(
-                        "Task ID %r is closed, but we found no builds in koji.", task_id)
-                elif len(builds) > 1:
-                    log.warning(
-                        "Task ID %r is closed, but more than one build is present!", task_id)
-                else:
-                    build_version = builds[0]["version"]
-                    build_release = builds[0]["release"]
-
-            log.info("  task %r is in state %r", task_id, task_info["state"])
-            if task_info["state"] in state_mapping:
-                build_task_finalize.delay(
-                    msg_id="producer::fail_lost_builds fake msg",
-                    task_id=component_build.task_id,
-                    build_new_state=state_mapping[task_info["state"]],
-                    build_name=component_build.package,
-                    build_release=build_release,
-                    build_version=build_version,
-                )
+            component_builds.append(component_build)
+
+        for i in range(0, len(component_builds), FAIL_LOST_BUILDS_CHUNK_SIZE):
+            _fail_lost_builds_chunk(
+                koji_session, component_builds[i:i + FAIL_LOST_BUILDS_CHUNK_SIZE])
 
     elif conf.system == "mock":
         pass
 
 
+def _fail_lost_builds_chunk(koji_session, component_builds):
+    """
+    Query Koji for the tasks of ``component_builds`` using multicalls and
+    finalize the component builds whose tasks are finished.
+    """
+    task_ids = [component_build.task_id for component_build in component_builds]
+    log.info("Checking status of task_ids %r", task_ids)
+    task_infos = koji_retrying_multicall_map(koji_session, koji_session.getTaskInfo, task_ids)
+    if task_infos is None:
+        log.error("Failed to query the status of task_ids %r", task_ids)
+        return
+
+    # If it is a closed/completed task, then we can extract the NVR
+    closed_task_ids = [
+        task_id for task_id, task_info in zip(task_ids, task_infos)
+        if task_info and task_info["state"] == koji.TASK_STATES["CLOSED"]
+    ]
+    builds_by_task_id = {}
+    if closed_task_ids:
+        list_of_builds = koji_retrying_multicall_map(
+            koji_session, koji_session.listBuilds,
+            list_of_kwargs=[{"taskID": task_id} for task_id in closed_task_ids],
+        )
+        if list_of_builds is None:
+            log.error("Failed to query the builds of closed task_ids %r", closed_task_ids)
+        else:
+            builds_by_task_id = dict(zip(closed_task_ids, list_of_builds))
+
+    state_mapping = {
+        # Cancelled and failed builds should be marked as failed.
+        koji.TASK_STATES["CANCELED"]: koji.BUILD_STATES["FAILED"],
+        koji.TASK_STATES["FAILED"]: koji.BUILD_STATES["FAILED"],
+        # Completed tasks should be marked as complete.
+        koji.TASK_STATES["CLOSED"]: koji.BUILD_STATES["COMPLETE"],
+    }
+
+    for component_build, task_info in zip(component_builds, task_infos):
+        task_id = component_build.task_id
+        if not task_info:
+            log.warning("Task ID %r was not found in koji.", task_id)
+            continue
+
+        build_version, build_release = None, None  # defaults
+        if task_info["state"] == koji.TASK_STATES["CLOSED"]:
+            if task_id not in builds_by_task_id:
+                # Querying the builds failed, try again next time.
+                continue
+            builds = builds_by_task_id[task_id]
+            if not builds:
+                log.warning(
+                    "Task ID %r is closed, but we found no builds in koji.", task_id)
+            elif len(builds) > 1:
+                log.warning(
+                    "Task ID %r is closed, but more than one build is present!", task_id)
+            else:
+                build_version = builds[0]["version"]
+                build_release = builds[0]["release"]
+
+        log.info("  task %r is in state %r", task_id, task_info["state"])
+        if task_info["state"] in state_mapping:
+            build_task_finalize.delay(
+                msg_id="producer::fail_lost_builds fake msg",
+                task_id=task_id,
+                build_new_state=state_mapping[task_info["state"]],
+                build_name=component_build.package,
+                build_release=build_release,
+                build_version=build_version,
+            )
+
+
 @celery_app.task
 def process_paused_module_builds():
     log.info("Looking for paused module builds in the build state")
-    if at_concurrent_component_threshold(conf):
+    admission = get_component_build_admission(conf)
+    if admission.exhausted:
         log.debug(
             "Will not attempt to start paused module builds due to "
             "the concurrent build threshold being met"
@@ -184,16 +233,18 @@ def process_paused_module_builds():
     ten_minutes = timedelta(minutes=10)
     # Check for module builds that are in the build state but don't have any active component
     # builds. Exclude module builds in batch 0. This is likely a build of a module without
-    # components.
+    # components. Only give builds a nudge if stuck for more than ten minutes.
     module_builds = db_session.query(models.ModuleBuild).filter(
         models.ModuleBuild.state == models.BUILD_STATES["build"],
         models.ModuleBuild.batch > 0,
+        models.ModuleBuild.time_modified < datetime.utcnow() - ten_minutes,
     ).all()
+    # Nudge the module builds using the least of the build capacity first, so
+    # the big module builds do not starve the small ones. Prefer the module
+    # builds with the longest remaining critical path among them.
+    weights = get_module_build_weights(db_session, [m.id for m in module_builds])
+    module_builds.sort(key=lambda m: (weights[m.id][0], -weights[m.id][1], m.id))
     for module_build in module_builds:
-        now = datetime.utcnow()
-        # Only give builds a nudge if stuck for more than ten minutes
-        if (now - module_build.time_modified) < ten_minutes:
-            continue
         # If there are no components in the build state on the module build,
         # then no possible event will start off new component builds.
         # But do not try to start new builds when we are waiting for the
@@ -205,10 +256,17 @@ def process_paused_module_builds():
 
             if has_missed_new_repo_message(module_build, builder.koji_session):
                 log.info("  Processing the paused module build %r", module_build)
+                submitted = set(
+                    c.id for c in module_build.component_builds
+                    if c.is_building and c.reused_component_id is None
+                )
                 start_next_batch_build(conf, module_build, builder)
+                for c in module_build.component_builds:
+                    if c.is_building and c.reused_component_id is None and c.id not in submitted:
+                        admission.account(c)
 
         # Check if we have met the threshold.
-        if at_concurrent_component_threshold(conf):
+        if admission.exhausted:
             break
 
 
@@ -183,8 +183,7 @@ def attempt_to_reuse_all_components(builder, module):
     if not previous_module_build:
         return False
 
-    mmd = module.mmd()
-    old_mmd = previous_module_build.mmd()
+    checker = ComponentReuseChecker(module, previous_module_build)
 
     # [(component, component_to_reuse), ...]
     component_pairs = []
@@ -194,13 +193,7 @@ def attempt_to_reuse_all_components(builder, module):
     for c in module.component_builds:
         if c.package == "module-build-macros":
             continue
-        component_to_reuse = get_reusable_component(
-            module,
-            c.package,
-            previous_module_build=previous_module_build,
-            mmd=mmd,
-            old_mmd=old_mmd,
-        )
+        component_to_reuse = checker.get_reusable_component(c.package)
         if not component_to_reuse:
             return False
 
@@ -254,17 +247,8 @@ def get_reusable_components(module, component_names, previous_module_build=None)
     if not previous_module_build:
         return [None] * len(component_names)
 
-    mmd = module.mmd()
-    old_mmd = previous_module_build.mmd()
-
-    ret = []
-    for component_name in component_names:
-        ret.append(
-            get_reusable_component(
-                module, component_name, previous_module_build, mmd, old_mmd)
-        )
-
-    return ret
+    checker = ComponentReuseChecker(module, previous_module_build)
+    return checker.get_reusable_components(component_names)
 
 
 def get_reusable_component(
@@ -315,135 +299,219 @@ def get_reusable_component(
             module.log_message(db_session, message)
             return None
 
-    if not mmd:
-        mmd = module.mmd()
-    if not old_mmd:
-        old_mmd = previous_module_build.mmd()
-
-    # If the chosen component for some reason was not found in the database,
-    # or the ref is missing, something has gone wrong and the component cannot
-    # be reused
-    new_module_build_component = models.ComponentBuild.from_component_name(
-        db_session, component_name, module.id)
-    if (
-        not new_module_build_component
-        or not new_module_build_component.batch
-        or not new_module_build_component.ref
-    ):
-        message = ("Cannot reuse the component {} because it can't be found in the "
-                   "database").format(component_name)
-        module.log_message(db_session, message)
-        return None
+    checker = ComponentReuseChecker(module, previous_module_build, mmd, old_mmd)
+    return checker.get_reusable_component(component_name)
 
-    prev_module_build_component = models.ComponentBuild.from_component_name(
-        db_session, component_name, previous_module_build.id
-    )
-    # If the component to reuse for some reason was not found in the database,
-    # or the ref is missing, something has gone wrong and the component cannot
-    # be reused
-    if (
-        not prev_module_build_component
-        or not prev_module_build_component.batch
-        or not prev_module_build_component.ref
-    ):
-        message = ("Cannot reuse the component {} because a previous build of "
-                   "it can't be found in the database").format(component_name)
-        new_module_build_component.log_message(db_session, message)
-        return None
 
-    # Make sure the ref for the component that is trying to be reused
-    # hasn't changed since the last build
-    if prev_module_build_component.ref != new_module_build_component.ref:
-        message = ("Cannot reuse the component because the commit hash changed"
-                   " since the last build")
-        new_module_build_component.log_message(db_session, message)
-        return None
+class ComponentReuseChecker(object):
+    """
+    Finds out which components of a module build can reuse the component
+    builds of a previous module build.
+
+    The components of both module builds are indexed by their name and the
+    fingerprints of their batches are computed at most once, so checking all
+    the components of a module build does not query the database for every
+    component and does not compare all the previous batches again for every
+    component.
+    """
 
-    # At this point we've determined that both module builds contain the component
-    # and the components share the same commit hash
-    if module.rebuild_strategy == "changed-and-after":
-        # Make sure the batch number for the component that is trying to be reused
-        # hasn't changed since the last build
-        if prev_module_build_component.batch != new_module_build_component.batch:
-            message = ("Cannot reuse the component because it is being built in "
-                       "a different batch than in the compatible module build")
-            new_module_build_component.log_message(db_session, message)
+    def __init__(self, module, previous_module_build, mmd=None, old_mmd=None):
+        """
+        :param module: the ModuleBuild object of module being built with a formatted
+            mmd
+        :param previous_module_build: the ModuleBuild instances of a module build
+            which contains the components to reuse.
+        :param mmd: Modulemd.ModuleStream of `module`. If not passed, it is taken from
+            module.mmd().
+        :param old_mmd: Modulemd.ModuleStream of `previous_module_build`. If not passed,
+            it is taken from previous_module_build.mmd().
+        """
+        self.module = module
+        self.previous_module_build = previous_module_build
+        self.mmd = mmd or module.mmd(read_only=True)
+        self.old_mmd = old_mmd or previous_module_build.mmd(read_only=True)
+        self._new_components = self._index_components(module)
+        self._prev_components = self._index_components(previous_module_build)
+        self._macros_match = None
+        self._new_batches = None
+        self._prev_batches = None
+        # {batch: True if the components of the batch match in both module builds}
+        self._batches_match = {}
+
+    @staticmethod
+    def _index_components(module):
+        components = {}
+        for component in module.component_builds:
+            components.setdefault(component.package, component)
+        return components
+
+    @staticmethod
+    def _group_by_batch(module):
+        batches = {}
+        for component in module.component_builds:
+            batches.setdefault(component.batch, []).append(component)
+        return batches
+
+    @staticmethod
+    def _get_batch_fingerprint(batches, mmd, batch):
+        """
+        Returns the set of "(name, ref, arches)" with the name, ref (commit),
+        and arches of every component in the `batch`.
+        """
+        return {
+            (value.package, value.ref,
+                tuple(sorted(mmd.get_rpm_component(value.package).get_arches())))
+            for value in batches.get(batch, [])
+        }
+
+    def _previous_batches_match(self, batch):
+        """
+        Returns True if every build batch *before* the `batch` except for 1,
+        which is reserved for the module-build-macros RPM, contains the components
+        with the same names, refs (commits) and arches in both module builds.
+        """
+        if self._new_batches is None:
+            self._new_batches = self._group_by_batch(self.module)
+            self._prev_batches = self._group_by_batch(self.previous_module_build)
+
+        # The first batch is skipped since it will always contain only the
+        # module-build-macros RPM and it gets built every time
+        for i in range(2, batch):
+            if i not in self._batches_match:
+                self._batches_match[i] = (
+                    self._get_batch_fingerprint(self._new_batches, self.mmd, i)
+                    == self._get_batch_fingerprint(self._prev_batches, self.old_mmd, i)
+                )
+            if not self._batches_match[i]:
+                return False
+        return True
+
+    def _rpm_macros_match(self):
+        """Returns True if the mmd.buildopts.macros.rpms are the same in both module builds"""
+        if self._macros_match is None:
+            buildopts = self.mmd.get_buildopts()
+            if buildopts:
+                modulemd_macros = buildopts.get_rpm_macros()
+            else:
+                modulemd_macros = None
+
+            old_buildopts = self.old_mmd.get_buildopts()
+            if old_buildopts:
+                old_modulemd_macros = old_buildopts.get_rpm_macros()
+            else:
+                old_modulemd_macros = None
+
+            self._macros_match = modulemd_macros == old_modulemd_macros
+        return self._macros_match
+
+    def get_reusable_components(self, component_names):
+        """
+        Returns the list of ComponentBuild instances belonging to the previous
+        module build which can be reused, in the same order as `component_names`.
+        None is used for the components which cannot be reused.
+        """
+        return [self.get_reusable_component(name) for name in component_names]
+
+    def get_reusable_component(self, component_name):
+        """
+        Returns the component (RPM) build of the previous module build that can
+        be reused instead of needing to rebuild it
+
+        :param component_name: the name of the component (RPM) that you'd like to
+            reuse a previous build of
+        :return: the component (RPM) build SQLAlchemy object, if one is not found,
+            None is returned
+        """
+        # We support component reusing only for koji and test backend.
+        if conf.system not in ["koji", "test"]:
             return None
 
-        # If the mmd.buildopts.macros.rpms changed, we cannot reuse
-        buildopts = mmd.get_buildopts()
-        if buildopts:
-            modulemd_macros = buildopts.get_rpm_macros()
-        else:
-            modulemd_macros = None
+        module = self.module
+        mmd = self.mmd
+        old_mmd = self.old_mmd
 
-        old_buildopts = old_mmd.get_buildopts()
-        if old_buildopts:
-            old_modulemd_macros = old_buildopts.get_rpm_macros()
-        else:
-            old_modulemd_macros = None
+        # If the rebuild strategy is "all", that means that nothing can be reused
+        if module.rebuild_strategy == "all":
+            message = ("Cannot reuse the component {component_name} because the module "
+                       "rebuild strategy is \"all\".").format(
+                           component_name=component_name)
+            module.log_message(db_session, message)
+            return None
 
-        if modulemd_macros != old_modulemd_macros:
-            message = ("Cannot reuse the component because the modulemd's macros are"
-                       " different than those of the compatible module build")
-            new_module_build_component.log_message(db_session, message)
+        # If the chosen component for some reason was not found in the database,
+        # or the ref is missing, something has gone wrong and the component cannot
+        # be reused
+        new_module_build_component = self._new_components.get(component_name)
+        if (
+            not new_module_build_component
+            or not new_module_build_component.batch
+            or not new_module_build_component.ref
+        ):
+            message = ("Cannot reuse the component {} because it can't be found in the "
+                       "database").format(component_name)
+            module.log_message(db_session, message)
             return None
 
-        # At this point we've determined that both module builds contain the component
-        # with the same commit hash and they are in the same batch. We've also determined
-        # that both module builds depend(ed) on the same exact module builds. Now it's time
-        # to determine if the components before it have changed.
-        #
-        # Convert the component_builds to a list and sort them by batch
-        new_component_builds = list(module.component_builds)
-        new_component_builds.sort(key=lambda x: x.batch)
-        prev_component_builds = list(previous_module_build.component_builds)
-        prev_component_builds.sort(key=lambda x: x.batch)
-
-        new_module_build_components = []
-        previous_module_build_components = []
-        # Create separate lists for the new and previous module build. These lists
-        # will have an entry for every build batch *before* the component's
-        # batch except for 1, which is reserved for the module-build-macros RPM.
-        # Each batch entry will contain a set of "(name, ref, arches)" with the name,
-        # ref (commit), and arches of the component.
-        for i in range(new_module_build_component.batch - 1):
-            # This is the first batch which we want to skip since it will always
-            # contain only the module-build-macros RPM and it gets built every time
-            if i == 0:
-                continue
+        prev_module_build_component = self._prev_components.get(component_name)
+        # If the component to reuse for some reason was not found in the database,
+        # or the ref is missing, something has gone wrong and the component cannot
+        # be reused
+        if (
+            not prev_module_build_component
+            or not prev_module_build_component.batch
+            or not prev_module_build_component.ref
+        ):
+            message = ("Cannot reuse the component {} because a previous build of "
+                       "it can't be found in the database").format(component_name)
+            new_module_build_component.log_message(db_session, message)
+            return None
 
-            new_module_build_components.append({
-                (value.package, value.ref,
-                    tuple(sorted(mmd.get_rpm_component(value.package).get_arches())))
-                for value in new_component_builds
-                if value.batch == i + 1
-            })
-
-            previous_module_build_components.append({
-                (value.package, value.ref,
-                    tuple(sorted(old_mmd.get_rpm_component(value.package).get_arches())))
-                for value in prev_component_builds
-                if value.batch == i + 1
-            })
-
-        # If the previous batches don't have the same ordering, hashes, and arches, then the
-        # component can't be reused
-        if previous_module_build_components != new_module_build_components:
-            message = ("Cannot reuse the component because a component in a previous"
-                       " batch has been added, removed, or rebuilt")
+        # Make sure the ref for the component that is trying to be reused
+        # hasn't changed since the last build
+        if prev_module_build_component.ref != new_module_build_component.ref:
+            message = ("Cannot reuse the component because the commit hash changed"
+                       " since the last build")
             new_module_build_component.log_message(db_session, message)
             return None
 
-    # check that arches have not changed
-    pkg = mmd.get_rpm_component(component_name)
-    if set(pkg.get_arches()) != set(old_mmd.get_rpm_component(component_name).get_arches()):
-        message = ("Cannot reuse the component because its architectures"
-                   " have changed since the compatible module build").format(component_name)
-        new_module_build_component.log_message(db_session, message)
-        return None
+        # At this point we've determined that both module builds contain the component
+        # and the components share the same commit hash
+        if module.rebuild_strategy == "changed-and-after":
+            # Make sure the batch number for the component that is trying to be reused
+            # hasn't changed since the last build
+            if prev_module_build_component.batch != new_module_build_component.batch:
+                message = ("Cannot reuse the component because it is being built in "
+                           "a different batch than in the compatible module build")
+                new_module_build_component.log_message(db_session, message)
+                return None
+
+            # If the mmd.buildopts.macros.rpms changed, we cannot reuse
+            if not self._rpm_macros_match():
+                message = ("Cannot reuse the component because the modulemd's macros are"
+                           " different than those of the compatible module build")
+                new_module_build_component.log_message(db_session, message)
+                return None
+
+            # At this point we've determined that both module builds contain the component
+            # with the same commit hash and they are in the same batch. We've also determined
+            # that both module builds depend(ed) on the same exact module builds. Now it's time
+            # to determine if the components before it have changed.
+            #
+            # If the previous batches don't have the same ordering, hashes, and arches, then the
+            # component can't be reused
+            if not self._previous_batches_match(new_module_build_component.batch):
+                message = ("Cannot reuse the component because a component in a previous"
+                           " batch has been added, removed, or rebuilt")
+                new_module_build_component.log_message(db_session, message)
+                return None
+
+        # check that arches have not changed
+        pkg = mmd.get_rpm_component(component_name)
+        if set(pkg.get_arches()) != set(old_mmd.get_rpm_component(component_name).get_arches()):
+            message = ("Cannot reuse the component because its architectures"
+                       " have changed since the compatible module build").format(component_name)
+            new_module_build_component.log_message(db_session, message)
+            return None
 
-    reusable_component = db_session.query(models.ComponentBuild).filter_by(
-        package=component_name, module_id=previous_module_build.id).one()
-    log.debug("Found reusable component!")
-    return reusable_component
+        log.debug("Found reusable component!")
+        return prev_module_build_component
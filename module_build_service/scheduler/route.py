@@ -5,9 +5,9 @@
 from __future__ import absolute_import
 import inspect
 
-from module_build_service.common import conf, log, models
+from module_build_service.common import conf, log
 from module_build_service.scheduler.db_session import db_session
-from module_build_service.scheduler.handlers.greenwave import get_corresponding_module_build
+from module_build_service.scheduler.routing_index import routing_index
 
 
 def route_task(name, args, kwargs, options, task=None, **kw):
@@ -49,19 +49,13 @@ def route_task(name, args, kwargs, options, task=None, **kw):
     if module_build_id is None:
         if "task_id" in handler_args:
             task_id = _get_handler_arg("task_id")
-            component_build = models.ComponentBuild.from_component_event(db_session, task_id)
-            if component_build:
-                module_build_id = component_build.module_build.id
+            module_build_id = routing_index.get_module_build_id_by_task_id(db_session, task_id)
         elif "tag_name" in handler_args:
             tag_name = _get_handler_arg("tag_name")
-            module_build = models.ModuleBuild.get_by_tag(db_session, tag_name)
-            if module_build:
-                module_build_id = module_build.id
+            module_build_id = routing_index.get_module_build_id_by_tag(db_session, tag_name)
         elif "subject_identifier" in handler_args:
             module_build_nvr = _get_handler_arg("subject_identifier")
-            module_build = get_corresponding_module_build(module_build_nvr)
-            if module_build is not None:
-                module_build_id = module_build.id
+            module_build_id = routing_index.get_module_build_id_by_nvr(module_build_nvr)
 
     if module_build_id is not None:
         queue_name = "mbs-{}".format(module_build_id % num_workers)
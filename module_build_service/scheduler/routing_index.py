@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: MIT
+""" In-process index used to find the module build a message belongs to."""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+import time
+
+from module_build_service.common import conf, models
+
+
+class RoutingIndex(object):
+    """
+    Maps Koji task ids, module build NVRs and Koji tags to the ids of the
+    module builds they belong to, so the messages can be routed without
+    querying the database or Koji every time.
+
+    The index is kept up to date by :func:`update_routing_index` and
+    :func:`apply_routing_index_changes` whenever the component builds and
+    module builds are committed to the database in this process. Changes done
+    by other processes are picked up on a miss. Task ids and NVRs always
+    belong to the same module build, but a Koji tag maps only to a module
+    build in the build state. Because other processes can move the module
+    build to another state, the Koji tags are kept only for
+    ``routing_index_ttl`` seconds and the callers must check the state of the
+    module build found by the Koji tag.
+    """
+
+    def __init__(self):
+        # {task_id: module_build_id}
+        self._task_ids = OrderedDict()
+        # {nvr: module_build_id}
+        self._nvrs = OrderedDict()
+        # {koji_tag: (module_build_id, time_added)}
+        self._tags = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_module_build_id_by_task_id(self, db_session, task_id):
+        """
+        Return the id of the module build of the component built by Koji task.
+
+        :param db_session: SQLAlchemy database session object.
+        :param int task_id: the Koji task id of the component build.
+        :return: the module build id or None if no component is built by the task.
+        :rtype: int or None
+        """
+        with self._lock:
+            module_build_id = self._get(self._task_ids, task_id)
+        if module_build_id is not None:
+            return module_build_id
+
+        component_build = models.ComponentBuild.from_component_event(db_session, task_id)
+        if component_build is None:
+            return None
+        self.add_task_id(task_id, component_build.module_id)
+        return component_build.module_id
+
+    def get_module_build_id_by_tag(self, db_session, tag_name):
+        """
+        Return the id of the module build in the build state using the Koji tag.
+
+        :param db_session: SQLAlchemy database session object.
+        :param str tag_name: the Koji tag or the build tag of the module build.
+        :return: the module build id or None if no module build is building in the tag.
+        :rtype: int or None
+        """
+        tag = tag_name[:-6] if tag_name.endswith("-build") else tag_name
+        with self._lock:
+            entry = self._get(self._tags, tag)
+            if entry is not None:
+                module_build_id, time_added = entry
+                if time.time() - time_added < conf.routing_index_ttl:
+                    return module_build_id
+                del self._tags[tag]
+
+        module_build = models.ModuleBuild.get_by_tag(db_session, tag)
+        if module_build is None:
+            return None
+        self.add_tag(tag, module_build.id)
+        return module_build.id
+
+    def get_module_build_id_by_nvr(self, nvr):
+        """
+        Return the id of the module build using the NVR of its Koji build.
+
+        :param str nvr: the NVR of the module build.
+        :return: the module build id or None if the NVR is not built by MBS.
+        :rtype: int or None
+        """
+        with self._lock:
+            module_build_id = self._get(self._nvrs, nvr)
+        if module_build_id is not None:
+            return module_build_id
+
+        # Placed here to avoid the circular import of the db_session.
+        from module_build_service.scheduler.handlers.greenwave import (
+            get_corresponding_module_build)
+
+        module_build = get_corresponding_module_build(nvr)
+        if module_build is None:
+            return None
+        self.add_nvr(nvr, module_build.id)
+        return module_build.id
+
+    def add_task_id(self, task_id, module_build_id):
+        with self._lock:
+            self._put(self._task_ids, task_id, module_build_id)
+
+    def add_nvr(self, nvr, module_build_id):
+        with self._lock:
+            self._put(self._nvrs, nvr, module_build_id)
+
+    def add_tag(self, tag, module_build_id):
+        with self._lock:
+            self._put(self._tags, tag, (module_build_id, time.time()))
+
+    def remove_tag(self, tag, module_build_id):
+        """Remove the Koji tag from the index if it maps to the module build."""
+        with self._lock:
+            entry = self._tags.get(tag)
+            if entry is not None and entry[0] == module_build_id:
+                del self._tags[tag]
+
+    def clear(self):
+        """Drop all the entries of the index."""
+        with self._lock:
+            self._task_ids.clear()
+            self._nvrs.clear()
+            self._tags.clear()
+
+    def _get(self, entries, key):
+        value = entries.pop(key, None)
+        if value is not None:
+            # Mark the entry as recently used.
+            entries[key] = value
+        return value
+
+    def _put(self, entries, key, value):
+        max_size = conf.routing_index_size
+        if max_size <= 0:
+            return
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+
+routing_index = RoutingIndex()
+
+
+def update_routing_index(db_session, flush_context):
+    """
+    Hook of SQLAlchemy ORM event after_flush to keep the routing index up to date.
+
+    The Koji tags of module builds leaving the build state are removed right
+    away. The new entries are only recorded in the session and added to the
+    index by :func:`apply_routing_index_changes` when the transaction is
+    committed, so a rolled back transaction does not leave them in the index.
+    """
+    changes = db_session.info.setdefault("routing_index_changes", [])
+    for item in set(db_session.new) | set(db_session.dirty):
+        if isinstance(item, models.ComponentBuild):
+            if item.task_id and item.module_id:
+                changes.append((routing_index.add_task_id, item.task_id, item.module_id))
+        elif isinstance(item, models.ModuleBuild) and item.koji_tag:
+            if item.state == models.BUILD_STATES["build"]:
+                changes.append((routing_index.add_tag, item.koji_tag, item.id))
+            else:
+                routing_index.remove_tag(item.koji_tag, item.id)
+
+
+def apply_routing_index_changes(db_session):
+    """Hook of SQLAlchemy ORM event after_commit to add the committed entries to the index"""
+    for add, key, module_build_id in db_session.info.pop("routing_index_changes", []):
+        add(key, module_build_id)
+
+
+def discard_routing_index_changes(db_session, *args):
+    """Hook of SQLAlchemy ORM events after_rollback and after_soft_rollback"""
+    db_session.info.pop("routing_index_changes", None)
@@ -3,7 +3,6 @@
 from __future__ import absolute_import
 from datetime import datetime
 import json
-from multiprocessing.dummy import Pool as ThreadPool
 import os
 
 import kobo.rpmlib
@@ -12,6 +11,7 @@ import module_build_service.common.scm
 from module_build_service.common import conf, log, models
 from module_build_service.common.errors import ValidationError, UnprocessableEntity, Forbidden
 from module_build_service.common.modulemd import Modulemd
+from module_build_service.common.scm import scm_executor
 from module_build_service.common.submit import fetch_mmd
 from module_build_service.common.utils import to_text_type
 from module_build_service.scheduler.db_session import db_session
@@ -205,16 +205,9 @@ def record_filtered_rpms(mmd):
     return mmd
 
 
-def _scm_get_latest(pkg):
+def _scm_get_latest(pkg, future):
     try:
-        # If the modulemd specifies that the 'f25' branch is what
-        # we want to pull from, we need to resolve that f25 branch
-        # to the specific commit available at the time of
-        # submission (now).
-        repo = pkg.get_repository()
-        ref = pkg.get_ref()
-        log.debug("Getting the commit hash for the ref %s on the repo %s", ref, repo)
-        pkgref = module_build_service.common.scm.SCM(repo).get_latest(ref)
+        pkgref = future.result()
     except Exception as e:
         log.exception(e)
         return {
@@ -307,34 +300,42 @@ def format_mmd(mmd, scmurl, module=None, db_session=None, srpm_overrides=None):
 
         # Check that SCM URL is valid and replace potential branches in pkg refs
         # by real SCM hash and store the result to our private xmd place in modulemd.
-        pool = ThreadPool(20)
-        try:
-            # Filter out the packages which we have already resolved in possible
-            # previous runs of this method (can be caused by module build resubmition)
-            # or which have custom SRPMs and shouldn't be resolved.
-            pkgs_to_resolve = []
-            for name in mmd.get_rpm_component_names():
-                if name not in xmd["mbs"]["rpms"]:
-                    if name in srpm_overrides:
-                        # If this package has a custom SRPM, store an empty
-                        # ref entry so no further verification takes place.
-                        xmd["mbs"]["rpms"][name] = {"ref": None}
-                    else:
-                        pkgs_to_resolve.append(mmd.get_rpm_component(name))
-
-            async_result = pool.map_async(_scm_get_latest, pkgs_to_resolve)
-
-            # For modules with lot of components, the _scm_get_latest can take a lot of time.
+        # Filter out the packages which we have already resolved in possible
+        # previous runs of this method (can be caused by module build resubmition)
+        # or which have custom SRPMs and shouldn't be resolved.
+        pkgs_to_resolve = []
+        for name in mmd.get_rpm_component_names():
+            if name not in xmd["mbs"]["rpms"]:
+                if name in srpm_overrides:
+                    # If this package has a custom SRPM, store an empty
+                    # ref entry so no further verification takes place.
+                    xmd["mbs"]["rpms"][name] = {"ref": None}
+                else:
+                    pkgs_to_resolve.append(mmd.get_rpm_component(name))
+
+        futures = []
+        for pkg in pkgs_to_resolve:
+            # If the modulemd specifies that the 'f25' branch is what
+            # we want to pull from, we need to resolve that f25 branch
+            # to the specific commit available at the time of
+            # submission (now).
+            log.debug("Getting the commit hash for the ref %s on the repo %s",
+                      pkg.get_ref(), pkg.get_repository())
+            futures.append(scm_executor.submit_get_latest(pkg.get_repository(), pkg.get_ref()))
+
+        def _bump_time_modified(num_done, num_total):
+            # For modules with lot of components, resolving the refs can take a lot of time.
             # We need to bump time_modified from time to time, otherwise poller could think
             # that module is stuck in "init" state and it would send fake "init" message.
-            while not async_result.ready():
-                async_result.wait(60)
-                if module and db_session:
-                    module.time_modified = datetime.utcnow()
-                    db_session.commit()
-            pkg_dicts = async_result.get()
-        finally:
-            pool.close()
+            log.info("Resolved %d of %d component refs", num_done, num_total)
+            if module and db_session:
+                module.time_modified = datetime.utcnow()
+                db_session.commit()
+
+        scm_executor.wait(futures, _bump_time_modified)
+        pkg_dicts = [
+            _scm_get_latest(pkg, future) for pkg, future in zip(pkgs_to_resolve, futures)
+        ]
 
         err_msg = ""
         for pkg_dict in pkg_dicts:
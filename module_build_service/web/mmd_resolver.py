@@ -2,11 +2,112 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 import collections
+import functools
 import itertools
+import operator
+import threading
+import time
 
 import solv
+import sqlalchemy
 
 from module_build_service.common import log, conf, models
+from module_build_service.common.errors import UnprocessableEntity
+from module_build_service.common.monitor import (
+    mmd_resolver_combinations_pruned_counter,
+    mmd_resolver_combinations_solved_counter,
+    mmd_resolver_solve_duration,
+)
+
+
+# The data needed to add an available module to the libsolv pool.
+# `provides` is a list of (name, stream, version) tuples passed to MMDResolver.solvable_provides,
+# `runtime_deps` the runtime dependencies in the [{name: [streams]}, ...] form and
+# `base_module_stream_overrides` the result of MMDResolver._get_base_module_stream_overrides.
+ModuleSolvableData = collections.namedtuple(
+    "ModuleSolvableData", ["provides", "runtime_deps", "base_module_stream_overrides"])
+
+
+class ModuleSolvableDataCache(object):
+    """
+    Keeps the data needed to add the available modules to the libsolv pool
+    between the module stream expansions, so the metadata of the same modules
+    are not examined again by every :class:`MMDResolver`.
+
+    The entries are keyed by the NSVC. The metadata used for the dependency
+    solving do not change once a module is built, but the base modules can
+    be imported again with different virtual streams. The entries of a module
+    are therefore dropped whenever the state or the modulemd of a module build
+    of the same name is changed in this process, and they expire after
+    ``mmd_resolver_cache_ttl`` seconds to cover the changes done by other
+    processes. The least recently used entries are dropped when there are
+    more than ``mmd_resolver_cache_size`` of them.
+    """
+
+    def __init__(self):
+        # {nsvc: (ModuleSolvableData, expires)}
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, nsvc):
+        """
+        Return the cached data of the module or None if they are not cached or expired.
+
+        :param str nsvc: the NSVC of the module.
+        :rtype: ModuleSolvableData or None
+        """
+        with self._lock:
+            entry = self._entries.pop(nsvc, None)
+            if entry is None or entry[1] <= time.time():
+                return None
+            # Mark the entry as recently used.
+            self._entries[nsvc] = entry
+            return entry[0]
+
+    def set(self, nsvc, data):
+        """
+        Cache the data of the module.
+
+        :param str nsvc: the NSVC of the module.
+        :param ModuleSolvableData data: the data to cache.
+        """
+        max_size = conf.mmd_resolver_cache_size
+        if max_size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(nsvc, None)
+            self._entries[nsvc] = (data, time.time() + conf.mmd_resolver_cache_ttl)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name):
+        """
+        Drop the cached data of all the modules of the name.
+
+        :param str name: the module name.
+        """
+        prefix = name + ":"
+        with self._lock:
+            for nsvc in [nsvc for nsvc in self._entries if nsvc.startswith(prefix)]:
+                del self._entries[nsvc]
+
+    def clear(self):
+        """Drop all the cached data."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+module_solvable_data_cache = ModuleSolvableDataCache()
+
+
+@sqlalchemy.event.listens_for(models.ModuleBuild.state, "set")
+@sqlalchemy.event.listens_for(models.ModuleBuild.modulemd, "set")
+def module_build_changed_handler(target, value, oldvalue, initiator):
+    if target.name is not None and value != oldvalue:
+        module_solvable_data_cache.invalidate(target.name)
 
 
 class MMDResolver(object):
@@ -201,6 +302,20 @@ class MMDResolver(object):
     def _add_base_module_provides(self, solvable, mmd):
         """
         Adds the "stream version" and the "virtual_streams" from XMD section of `mmd` to `solvable`.
+        See :meth:`_get_base_module_provides`.
+
+        :return: A boolean that is True if a provides for the stream version was added to the input
+            solvable.
+        """
+        provides, base_stream_ver = self._get_base_module_provides(mmd)
+        for provide in provides:
+            self.solvable_provides(solvable, *provide)
+        return base_stream_ver
+
+    def _get_base_module_provides(self, mmd):
+        """
+        Returns the Provides for the "stream version" and the "virtual_streams" from XMD section
+        of `mmd`.
 
         Base modules like "platform" can contain virtual streams which need to be considered
         when resolving dependencies. For example module "platform:el8.1.0" can provide virtual
@@ -209,13 +324,14 @@ class MMDResolver(object):
         - module(platform:el8.1.0) = 80100 - Modules can require specific platform stream.
         - module(platform:el8) = 80100 - Module can also require just platform:el8.
 
-        :return: A boolean that is True if a provides for the stream version was added to the input
-            solvable.
+        :return: A tuple of the list of (name, stream, version) tuples of the Provides and
+            a boolean that is True if a provides for the stream version is in the list.
         """
+        provides = []
         base_stream_ver = False
 
         if mmd.get_module_name() not in conf.base_module_names:
-            return base_stream_ver
+            return provides, base_stream_ver
 
         # When depsolving, we will need to follow specific rules to choose the right base
         # module, like sorting the base modules sharing the same virtual streams based on
@@ -227,21 +343,21 @@ class MMDResolver(object):
             mmd.get_stream_name(), right_pad=False)
         if stream_version:
             base_stream_ver = True
-            self.solvable_provides(
-                solvable, mmd.get_module_name(), mmd.get_stream_name(), str(stream_version))
+            provides.append(
+                (mmd.get_module_name(), mmd.get_stream_name(), str(stream_version)))
 
         xmd = mmd.get_xmd()
         # Return in case virtual_streams are not set for this mmd.
         if not xmd.get("mbs", {}).get("virtual_streams"):
-            return base_stream_ver
+            return provides, base_stream_ver
 
         version = stream_version or mmd.get_version()
         # For each virtual stream, add
         # "module($name:$stream) = $virtual_stream_based_version" provide.
         for stream in xmd["mbs"]["virtual_streams"]:
-            self.solvable_provides(solvable, mmd.get_module_name(), stream, str(version))
+            provides.append((mmd.get_module_name(), stream, str(version)))
 
-        return base_stream_ver
+        return provides, base_stream_ver
 
     def _get_base_module_stream_overrides(self, mmd):
         """
@@ -267,6 +383,54 @@ class MMDResolver(object):
                 overrides[base_module_name] = stream
         return overrides
 
+    @staticmethod
+    def _normdeps(mmd, dep_type):
+        """
+        Returns the dependencies of `mmd` in the [{name: [streams], ...}, ...] form.
+
+        :param Modulemd mmd: Metadata of module.
+        :param str dep_type: either "runtime" or "buildtime" depending on whether
+            the returned deps should be runtime requires or buildrequires.
+        :rtype: list
+        """
+        return [
+            {
+                name: getattr(dep, "get_{}_streams".format(dep_type))(name)
+                for name in getattr(dep, "get_{}_modules".format(dep_type))()
+            }
+            for dep in mmd.get_dependencies()
+        ]
+
+    def _get_module_solvable_data(self, mmd):
+        """
+        Returns the data needed to add the available module to the libsolv pool.
+
+        :param Modulemd mmd: Metadata of module.
+        :rtype: ModuleSolvableData
+        """
+        n, s, v = mmd.get_module_name(), mmd.get_stream_name(), mmd.get_version()
+
+        # Add "Provides: module(name)", each module provides itself.
+        # This is used for example to find the buildrequired module when
+        # no particular stream is used - for example when buildrequiring
+        # "gtk: []"
+        provides = [(n,)]
+
+        base_module_provides, base_stream_ver = self._get_base_module_provides(mmd)
+        provides += base_module_provides
+
+        # Add "Provides: module(name:stream) = version", so we can find buildrequired
+        # modules when "gtk:[1]" is used and also choose the latest version.
+        # Skipped if this is a base module with a stream version defined.
+        if not base_stream_ver:
+            provides.append((n, s, str(v)))
+
+        return ModuleSolvableData(
+            provides,
+            self._normdeps(mmd, "runtime"),
+            self._get_base_module_stream_overrides(mmd),
+        )
+
     def add_modules(self, mmd):
         """
         Adds module represented by `mmd` metadata to MMDResolver. Modules added by this
@@ -281,17 +445,6 @@ class MMDResolver(object):
         n, s, v, c = \
             mmd.get_module_name(), mmd.get_stream_name(), mmd.get_version(), mmd.get_context()
 
-        # Helper method to return the dependencies of `mmd` in the {name: [streams], ... form}.
-        # The `dep_type` is either "runtime" or "buildtime" str depending on whether
-        # the return deps should be runtime requires or buildrequires.
-        normdeps = lambda mmd, dep_type: [
-            {
-                name: getattr(dep, "get_{}_streams".format(dep_type))(name)
-                for name in getattr(dep, "get_{}_modules".format(dep_type))()
-            }
-            for dep in mmd.get_dependencies()
-        ]
-
         # Each solvable object has name, version, architecture and list of
         # provides/requires/conflicts which defines its relations with other solvables.
         # You can imagine solvable as a single RPM.
@@ -310,25 +463,18 @@ class MMDResolver(object):
             # is sufficient.
             solvable.arch = "x86_64"
 
-            # Add "Provides: module(name)", each module provides itself.
-            # This is used for example to find the buildrequired module when
-            # no particular stream is used - for example when buildrequiring
-            # "gtk: []"
-            self.solvable_provides(solvable, n)
-
-            base_stream_ver = self._add_base_module_provides(solvable, mmd)
+            data = module_solvable_data_cache.get(solvable.name)
+            if data is None:
+                data = self._get_module_solvable_data(mmd)
+                module_solvable_data_cache.set(solvable.name, data)
 
-            # Add "Provides: module(name:stream) = version", so we can find buildrequired
-            # modules when "gtk:[1]" is used and also choose the latest version.
-            # Skipped if this is a base module with a stream version defined.
-            if not base_stream_ver:
-                self.solvable_provides(solvable, n, s, str(v))
+            for provide in data.provides:
+                self.solvable_provides(solvable, *provide)
 
-            base_module_stream_overrides = self._get_base_module_stream_overrides(mmd)
             # Fill in the "Requires" of this module, so we can track its dependencies
             # on other modules.
             requires = self._deps2reqs(
-                normdeps(mmd, "runtime"), base_module_stream_overrides, False
+                data.runtime_deps, data.base_module_stream_overrides, False
             )
             log.debug("Adding module %s with requires: %r", solvable.name, requires)
             solvable.add_deparray(solv.SOLVABLE_REQUIRES, requires)
@@ -380,7 +526,7 @@ class MMDResolver(object):
             # Using this trick, libsolv will try to solve all the buildrequires/requires pairs,
             # because they are expressed as separate Solvables and we are able to distinguish
             # between them thanks to context value.
-            normalized_deps = normdeps(mmd, "buildtime")
+            normalized_deps = self._normdeps(mmd, "buildtime")
             for c, deps in enumerate(mmd.get_dependencies()):
                 # $n:$s:$c-$v.src
                 solvable = self.build_repo.add_solvable()
@@ -416,7 +562,13 @@ class MMDResolver(object):
         :type mmd: Modulemd.ModuleStream
         :return: set of frozensets of n:s:v:c of modules which satisfied the
             dependency solving.
+        :raises UnprocessableEntity: if there are more combinations of the buildrequired
+            modules to check than ``mmd_resolver_max_combinations``.
         """
+        start_time = time.time()
+        num_solved = 0
+        num_pruned = 0
+
         # Add the input module to pool and generate the "Provides" data so we can
         # use them for resolving later.
         solvables = self.add_modules(mmd)
@@ -488,8 +640,32 @@ class MMDResolver(object):
             # 2) For each dep (name:stream), get the set of all solvables in particular NSVCs,
             #    which provides that name:stream. Then use itertools.product() to actually
             #    generate all the possible combinations so we can try solving them.
-            for opt in itertools.product(*[self.pool.whatprovides(dep) for dep in deps]):
-                log.debug("Testing %s with combination: %s", src, opt)
+            providers = [self.pool.whatprovides(dep) for dep in deps]
+            num_combinations = functools.reduce(operator.mul, [len(p) for p in providers], 1)
+            max_combinations = conf.mmd_resolver_max_combinations
+            if max_combinations and num_combinations > max_combinations:
+                raise UnprocessableEntity(
+                    "Resolving the buildrequires of the module would need to check {} "
+                    "combinations of the buildrequired module builds, which is more than the "
+                    "limit of {}. Please limit the streams of the buildrequired modules.".format(
+                        num_combinations, max_combinations)
+                )
+
+            # Only the transaction with the most recent solvables is kept for each
+            # name:stream combination later, and the solvables of the combination are part
+            # of the transaction. The combinations are therefore tried from the one with
+            # the most recent solvables, so the combinations which cannot result in a better
+            # transaction than the one already found can be skipped without solving them.
+            # The ties are won by the combination generated first by itertools.product().
+            combinations = sorted(
+                (self._get_transaction_score(opt), i, opt)
+                for i, opt in enumerate(itertools.product(*providers))
+            )
+            # {key: (score of the transaction, index of the combination)}
+            best = {}
+            # {key: [(index of the combination, transaction), ...]}
+            found = collections.OrderedDict()
+            for score, i, opt in combinations:
                 # We will be trying to solve all the combinations using all the NSVCs
                 # we have in pool, but as we said earlier, we don't want to return
                 # all of them for the used resolve policy "First".
@@ -500,6 +676,12 @@ class MMDResolver(object):
                 # policy and later return just the first alternative.
                 # `key` contains tuple similar to "('gtk:1', 'foo:1')"
                 key = tuple(s2ns(s) for s in opt)
+                if key in best and (score, i) > best[key]:
+                    num_pruned += 1
+                    continue
+
+                log.debug("Testing %s with combination: %s", src, opt)
+                num_solved += 1
 
                 # Create the solving jobs.
                 # We need to say to libsolv that we want it to prefer modules from the combination
@@ -549,11 +731,18 @@ class MMDResolver(object):
                 # Remember that src_alternatives are grouped by NS or NSVC depending on
                 # MMDResolverPolicy, so there might be more of them.
                 if all_solvables_found:
-                    alternative = src_alternatives.setdefault(key, [])
-                    alternative.append(newsolvables)
+                    found.setdefault(key, []).append((i, newsolvables))
+                    transaction_score = (self._get_transaction_score(newsolvables), i)
+                    if key not in best or transaction_score < best[key]:
+                        best[key] = transaction_score
                 else:
                     log.debug("  - ^ Not all favored solvables found in the result, skipping.")
 
+            # Keep the alternatives in the order of the combinations generated by
+            # itertools.product(), which decides the ties.
+            for key, transactions in found.items():
+                src_alternatives[key] = [t for _, t in sorted(transactions, key=lambda t: t[0])]
+
         # We will check all the alternatives and keep just the "first" one.
         for transactions in alternatives.values():
             for ns, trans in transactions.items():
@@ -575,20 +764,19 @@ class MMDResolver(object):
                 # Then we simply sort the `sorted_trans` based on the sum of solvableN_index
                 # which gives us the transaction with the most recent versions. This is
                 # used as a solution.
-                sorted_trans = []
-                for i, t in enumerate(trans):
-                    idx = []
-                    for s in t:
-                        name_stream = s2ns(s)
-                        if name_stream not in self.solvables:
-                            continue
-                        index = self.solvables[name_stream].index(s)
-                        idx.append(index)
-                    sorted_trans.append([i, idx])
-                sorted_trans.sort(key=lambda i: sum(i[1]))
+                sorted_trans = [[i, self._get_transaction_score(t)] for i, t in enumerate(trans)]
+                sorted_trans.sort(key=lambda i: i[1])
                 if sorted_trans:
                     transactions[ns] = [trans[sorted_trans[0][0]]]
 
+        duration = time.time() - start_time
+        mmd_resolver_solve_duration.observe(duration)
+        mmd_resolver_combinations_solved_counter.inc(num_solved)
+        mmd_resolver_combinations_pruned_counter.inc(num_pruned)
+        log.info(
+            "Solved %d and skipped %d combinations of buildrequired modules in %.2f seconds.",
+            num_solved, num_pruned, duration)
+
         # Convert the solvables in alternatives to nsvc and return them as set of frozensets.
         return set(
             frozenset(s2nsvca(s) for s in transactions[0])
@@ -596,6 +784,22 @@ class MMDResolver(object):
             for transactions in src_alternatives.values()
         )
 
+    def _get_transaction_score(self, solvables):
+        """
+        Returns the sum of the indexes of the `solvables` in the lists of solvables of
+        their name:stream sorted by version in descending order. The lower the score is,
+        the more recent solvables are used.
+
+        :param solvables: iterable of solv.Solvable instances.
+        :rtype: int
+        """
+        score = 0
+        for s in solvables:
+            name_stream = ":".join(s.name.split(":", 2)[:2])
+            if name_stream in self.solvables:
+                score += self.solvables[name_stream].index(s)
+        return score
+
     @staticmethod
     def _detect_transitive_stream_collision(problems):
         """Return problem description if transitive stream collision happens
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+from collections import OrderedDict
+from multiprocessing.dummy import Pool as ThreadPool
+
+from sqlalchemy.orm import scoped_session
 
 from module_build_service.common import conf, log, models
 from module_build_service.common.errors import StreamAmbigous, UnprocessableEntity
@@ -54,83 +58,84 @@ def expand_mse_streams(db_session, mmd, default_streams=None, raise_if_stream_am
         mmd.add_dependencies(new_deps)
 
 
-def _get_mmds_from_requires(
-    db_session,
-    requires,
-    mmds,
-    recursive=False,
-    default_streams=None,
-    raise_if_stream_ambigous=False,
-    base_module_mmds=None,
+def _get_name_streams_from_requires(
+    requires, default_streams=None, raise_if_stream_ambigous=False
 ):
     """
     Helper method for get_mmds_required_by_module_recursively returning
-    the list of module metadata objects defined by `requires` dict.
+    the list of name:streams defined by `requires` dict.
 
-    :param db_session: SQLAlchemy database session.
     :param dict requires: requires or buildrequires in the form {module: [streams]}
-    :param mmds: Dictionary with already handled name:streams as a keys and lists
-        of resulting mmds as values.
-    :param recursive: If True, the requires are checked recursively.
     :param dict default_streams: Dict in {module_name: module_stream, ...} format defining
         the default stream to choose for module in case when there are multiple streams to
         choose from.
     :param bool raise_if_stream_ambigous: When True, raises a StreamAmbigous exception in case
         there are multiple streams for some dependency of module and the module name is not
         defined in `default_streams`, so it is not clear which stream should be used.
-    :param list base_module_mmds: List of modulemd metadata instances. When set, the
-        returned list contains MMDs build against each base module defined in
-        `base_module_mmds` list.
-    :return: Dict with name:stream as a key and list with mmds as value.
+    :return: List of name:stream strings.
     """
     default_streams = default_streams or {}
-    # To be able to call itself recursively, we need to store list of mmds
-    # we have added to global mmds list in this particular call.
-    added_mmds = {}
-    resolver = GenericResolver.create(db_session, conf)
-
+    name_streams = []
     for name, streams in requires.items():
-        # Base modules are already added to `mmds`.
+        # Base modules are already added to the resolved mmds.
         if name in conf.base_module_names:
             continue
 
-        streams_to_try = streams
-        if name in default_streams:
-            streams_to_try = [default_streams[name]]
-        elif len(streams_to_try) > 1 and raise_if_stream_ambigous:
+        if name not in default_streams and len(streams) > 1 and raise_if_stream_ambigous:
             raise StreamAmbigous(
                 "There are multiple streams %r to choose from for module %s."
-                % (streams_to_try, name)
+                % (streams, name)
             )
 
-        # For each valid stream, find the last build in a stream and also all
-        # its contexts and add mmds of these builds to `mmds` and `added_mmds`.
-        # Of course only do that if we have not done that already in some
-        # previous call of this method.
-        for stream in streams:
-            ns = "%s:%s" % (name, stream)
-            if ns not in mmds:
-                mmds[ns] = []
-            if ns not in added_mmds:
-                added_mmds[ns] = []
-
-            if base_module_mmds:
-                for base_module_mmd in base_module_mmds:
-                    mmds[ns] += resolver.get_buildrequired_modulemds(name, stream, base_module_mmd)
-            else:
-                mmds[ns] = resolver.get_module_modulemds(name, stream, strict=True)
-            added_mmds[ns] += mmds[ns]
-
-    # Get the requires recursively.
-    if recursive:
-        for mmd_list in added_mmds.values():
-            for mmd in mmd_list:
-                for deps in mmd.get_dependencies():
-                    deps_dict = deps_to_dict(deps, 'runtime')
-                    mmds = _get_mmds_from_requires(
-                        db_session, deps_dict, mmds, True, base_module_mmds=base_module_mmds)
+        name_streams += ["%s:%s" % (name, stream) for stream in streams]
+    return name_streams
 
-    return mmds
+
+def _resolve_name_streams(db_session, name_streams, base_module_mmds=None):
+    """
+    Helper method for get_mmds_required_by_module_recursively returning
+    the module metadata of the latest builds of all the name:streams.
+
+    The name:streams are resolved concurrently by up to
+    ``num_threads_for_requires_resolution`` threads. Every thread uses its
+    own resolver and its own database session, so `db_session` must be
+    a scoped_session to resolve the name:streams concurrently. Otherwise they
+    are resolved one by one.
+
+    :param db_session: SQLAlchemy database session.
+    :param list name_streams: List of name:stream strings to resolve.
+    :param list base_module_mmds: List of modulemd metadata instances. When set, the
+        returned lists contain MMDs build against each base module defined in
+        `base_module_mmds` list.
+    :return: Dict with name:stream as a key and list with mmds as value.
+    """
+    def resolve(resolver, ns):
+        name, stream = ns.split(":", 1)
+        if not base_module_mmds:
+            return resolver.get_module_modulemds(name, stream, strict=True)
+        mmds = []
+        for base_module_mmd in base_module_mmds:
+            mmds += resolver.get_buildrequired_modulemds(name, stream, base_module_mmd)
+        return mmds
+
+    num_threads = min(conf.num_threads_for_requires_resolution, len(name_streams))
+    if num_threads <= 1 or not isinstance(db_session, scoped_session):
+        resolver = GenericResolver.create(db_session, conf)
+        return dict((ns, resolve(resolver, ns)) for ns in name_streams)
+
+    def resolve_in_thread(ns):
+        try:
+            return resolve(GenericResolver.create(db_session, conf), ns)
+        finally:
+            # Close the session of this thread created by the scoped_session.
+            db_session.remove()
+
+    pool = ThreadPool(num_threads)
+    try:
+        return dict(zip(name_streams, pool.map(resolve_in_thread, name_streams)))
+    finally:
+        pool.close()
+        pool.join()
 
 
 def get_mmds_required_by_module_recursively(
@@ -188,20 +193,38 @@ def get_mmds_required_by_module_recursively(
     all_base_module_mmds = base_module_mmds["ready"] + base_module_mmds["garbage"]
 
     # Get all the buildrequires of the module of interest.
+    name_streams = []
     for deps in mmd.get_dependencies():
         deps_dict = deps_to_dict(deps, 'buildtime')
-        mmds = _get_mmds_from_requires(
-            db_session, deps_dict, mmds, False, default_streams, raise_if_stream_ambigous,
-            all_base_module_mmds)
-
-    # Now get the requires of buildrequires recursively.
-    for mmd_key in list(mmds.keys()):
-        for mmd in mmds[mmd_key]:
-            for deps in mmd.get_dependencies():
+        name_streams += _get_name_streams_from_requires(
+            deps_dict, default_streams, raise_if_stream_ambigous)
+    name_streams = list(OrderedDict.fromkeys(name_streams))
+    mmds.update(_resolve_name_streams(db_session, name_streams, all_base_module_mmds))
+
+    # Now get the requires of buildrequires recursively. The dependency graph is
+    # walked breadth-first, so all the name:streams of a level are resolved
+    # together, and every name:stream is resolved just once.
+    level_mmds = [m for mmds_list in mmds.values() for m in mmds_list]
+    # Only the requires of the buildrequires are checked for the ambiguous streams.
+    check_ambiguity = True
+    while level_mmds:
+        name_streams = []
+        for level_mmd in level_mmds:
+            for deps in level_mmd.get_dependencies():
                 deps_dict = deps_to_dict(deps, 'runtime')
-                mmds = _get_mmds_from_requires(
-                    db_session, deps_dict, mmds, True, default_streams,
-                    raise_if_stream_ambigous, all_base_module_mmds)
+                name_streams += _get_name_streams_from_requires(
+                    deps_dict,
+                    default_streams if check_ambiguity else None,
+                    raise_if_stream_ambigous and check_ambiguity,
+                )
+        check_ambiguity = False
+
+        name_streams = [ns for ns in OrderedDict.fromkeys(name_streams) if ns not in mmds]
+        resolved = _resolve_name_streams(db_session, name_streams, all_base_module_mmds)
+        level_mmds = []
+        for ns in name_streams:
+            mmds[ns] = resolved[ns]
+            level_mmds += resolved[ns]
 
     # Make single list from dict of lists.
     res = []
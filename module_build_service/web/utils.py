@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import base64
 import copy
 from datetime import datetime
 from functools import wraps
+import hashlib
+import json
 import re
 
 from flask import request, url_for, Response
@@ -14,6 +17,7 @@ from sqlalchemy.sql.sqltypes import Boolean as sqlalchemy_boolean
 from module_build_service import api_version, db
 from module_build_service.common import conf, models
 from module_build_service.common.errors import ValidationError, NotFound
+from module_build_service.common.response_cache import response_cache
 from module_build_service.common.scm import scm_url_schemes
 
 
@@ -46,11 +50,29 @@ def get_scm_url_re():
     return re.compile(regex)
 
 
+class CursorPagination(object):
+    """
+    A page of the query results paginated using a cursor instead of an offset.
+    """
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        """
+        :param list items: the items on this page.
+        :param int per_page: the maximum number of items on a page.
+        :param next_cursor: the cursor of the next page or None if this is the last page.
+        :param total: the total number of items or None if they were not counted.
+        """
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.total = total
+
+
 def pagination_metadata(p_query, api_version, request_args):
     """
     Returns a dictionary containing metadata about the paginated query.
     This must be run as part of a Flask request.
-    :param p_query: flask_sqlalchemy.Pagination object
+    :param p_query: flask_sqlalchemy.Pagination or CursorPagination object
     :param api_version: an int of the API version
     :param request_args: a dictionary of the arguments that were part of the
     Flask request
@@ -60,13 +82,31 @@ def pagination_metadata(p_query, api_version, request_args):
     # Remove pagination related args because those are handled elsewhere
     # Also, remove any args that url_for accepts in case the user entered
     # those in
-    for key in ["page", "per_page", "endpoint"]:
+    for key in ["page", "per_page", "cursor", "endpoint"]:
         if key in request_args_wo_page:
             request_args_wo_page.pop(key)
     for key in request_args:
         if key.startswith("_"):
             request_args_wo_page.pop(key)
 
+    if isinstance(p_query, CursorPagination):
+        pagination_data = {
+            "per_page": p_query.per_page,
+            "total": p_query.total,
+            "next_cursor": p_query.next_cursor,
+            "next": None,
+        }
+        if p_query.next_cursor:
+            pagination_data["next"] = url_for(
+                request.endpoint,
+                api_version=api_version,
+                cursor=p_query.next_cursor,
+                per_page=p_query.per_page,
+                _external=True,
+                **request_args_wo_page
+            )
+        return pagination_data
+
     pagination_data = {
         "page": p_query.page,
         "pages": p_query.pages,
@@ -114,14 +154,14 @@ def pagination_metadata(p_query, api_version, request_args):
     return pagination_data
 
 
-def _add_order_by_clause(flask_request, query, column_source):
+def _get_order_by_columns(flask_request, column_source):
     """
-    Orders the given SQLAlchemy query based on the GET arguments provided.
+    Returns the columns to order the query by based on the GET arguments provided.
 
     :param flask_request: a Flask request object
-    :param query: a SQLAlchemy query object
     :param column_source: a SQLAlchemy database model
-    :return: a SQLAlchemy query object
+    :return: a tuple of the list of (column name, column) and a boolean which
+        is True when the query is ordered in descending order
     """
     order_by = flask_request.args.getlist("order_by")
     order_desc_by = flask_request.args.getlist("order_desc_by")
@@ -139,7 +179,7 @@ def _add_order_by_clause(flask_request, query, column_source):
         requested_order = order_desc_by
 
     column_dict = dict(column_source.__table__.columns)
-    order_args = []
+    columns = []
     for column_name in requested_order:
         if column_name not in column_dict:
             raise ValidationError(
@@ -148,6 +188,24 @@ def _add_order_by_clause(flask_request, query, column_source):
         # If the version column is provided, cast it as an integer so the sorting is correct
         if column_name == "version":
             column = sqlalchemy.cast(column, sqlalchemy.BigInteger)
+
+        columns.append((column_name, column))
+
+    return columns, descending
+
+
+def _add_order_by_clause(flask_request, query, column_source):
+    """
+    Orders the given SQLAlchemy query based on the GET arguments provided.
+
+    :param flask_request: a Flask request object
+    :param query: a SQLAlchemy query object
+    :param column_source: a SQLAlchemy database model
+    :return: a SQLAlchemy query object
+    """
+    columns, descending = _get_order_by_columns(flask_request, column_source)
+    order_args = []
+    for _, column in columns:
         if descending:
             column = column.desc()
 
@@ -156,6 +214,116 @@ def _add_order_by_clause(flask_request, query, column_source):
     return query.order_by(*order_args)
 
 
+def _encode_cursor(item, columns):
+    """
+    Returns the cursor pointing right after the ``item`` in a query ordered by ``columns``.
+    """
+    values = []
+    for column_name, _ in columns:
+        value = getattr(item, column_name)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        values.append(value)
+    cursor = base64.urlsafe_b64encode(json.dumps(values).encode("utf-8"))
+    return cursor.decode("ascii")
+
+
+def _decode_cursor(cursor, columns):
+    """
+    Returns the values of ``columns`` encoded in the ``cursor`` by :func:`_encode_cursor`.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)).decode("utf-8"))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Unexpected number of values")
+        for i, (_, column) in enumerate(columns):
+            if values[i] is None:
+                continue
+            if isinstance(column.type, sqlalchemy.DateTime):
+                value = values[i]
+                time_format = "%Y-%m-%dT%H:%M:%S.%f" if "." in value else "%Y-%m-%dT%H:%M:%S"
+                values[i] = datetime.strptime(value, time_format)
+            elif isinstance(column.type, sqlalchemy.Integer):
+                values[i] = int(values[i])
+    except (TypeError, ValueError):
+        raise ValidationError('An invalid cursor of "{}" was supplied'.format(cursor))
+    return values
+
+
+def _after_cursor_clause(columns, values, descending):
+    """
+    Returns the filter matching the rows following the row with ``values`` of
+    ``columns`` in a query ordered by ``columns``, with NULL values last.
+    """
+    clauses = []
+    equal = []
+    for (_, column), value in zip(columns, values):
+        if value is None:
+            # Only the NULL values, which are last, can follow the NULL value.
+            after = sqlalchemy.false()
+            same = column.is_(None)
+        else:
+            after = sqlalchemy.or_(
+                column < value if descending else column > value, column.is_(None))
+            same = column == value
+        clauses.append(sqlalchemy.and_(*(equal + [after])))
+        equal.append(same)
+    return sqlalchemy.or_(*clauses)
+
+
+def _paginate(flask_request, query, column_source):
+    """
+    Orders and paginates the given SQLAlchemy query based on the GET arguments provided.
+
+    The page number based pagination is used by default. When the "cursor"
+    argument is provided, possibly empty for the first page, the keyset
+    pagination is used instead, which does not need to skip the rows of
+    the previous pages. In this mode, the total number of results is not
+    counted when the "count" argument is false.
+
+    :param flask_request: a Flask request object
+    :param query: a SQLAlchemy query object
+    :param column_source: a SQLAlchemy database model
+    :return: flask_sqlalchemy.Pagination or CursorPagination
+    """
+    per_page = flask_request.args.get("per_page", 10, type=int)
+    if "cursor" not in flask_request.args:
+        query = _add_order_by_clause(flask_request, query, column_source)
+        page = flask_request.args.get("page", 1, type=int)
+        return query.paginate(page, per_page, False)
+
+    if per_page < 1:
+        raise ValidationError("The per_page argument must be a positive number")
+
+    columns, descending = _get_order_by_columns(flask_request, column_source)
+    # The cursor must point to a single row, so make the order unique.
+    if "id" not in [column_name for column_name, _ in columns]:
+        columns.append(("id", column_source.__table__.columns["id"]))
+
+    total = None
+    if str_to_bool(flask_request.args.get("count", "true")):
+        total = query.count()
+
+    cursor = flask_request.args["cursor"]
+    if cursor:
+        values = _decode_cursor(cursor, columns)
+        query = query.filter(_after_cursor_clause(columns, values, descending))
+
+    order_args = []
+    for _, column in columns:
+        # The NULL values are ordered last regardless of the database.
+        order_args.append(column.is_(None))
+        order_args.append(column.desc() if descending else column)
+
+    items = query.order_by(*order_args).limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = _encode_cursor(items[-1], columns)
+
+    return CursorPagination(items, per_page, next_cursor, total)
+
+
 def str_to_bool(value):
     """
     Parses a string to determine its boolean value
@@ -167,9 +335,10 @@ def str_to_bool(value):
 
 def filter_component_builds(flask_request):
     """
-    Returns a flask_sqlalchemy.Pagination object based on the request parameters
+    Returns a flask_sqlalchemy.Pagination or CursorPagination object based on the
+    request parameters
     :param request: Flask request object
-    :return: flask_sqlalchemy.Pagination
+    :return: flask_sqlalchemy.Pagination or CursorPagination
     """
     search_query = dict()
     for key in request.args.keys():
@@ -211,18 +380,53 @@ def filter_component_builds(flask_request):
     if search_states:
         query = query.filter(models.ComponentBuild.state.in_(search_states))
 
-    query = _add_order_by_clause(flask_request, query, models.ComponentBuild)
-
-    page = flask_request.args.get("page", 1, type=int)
-    per_page = flask_request.args.get("per_page", 10, type=int)
-    return query.paginate(page, per_page, False)
+    return _paginate(flask_request, query, models.ComponentBuild)
 
 
 def filter_module_builds(flask_request):
     """
-    Returns a flask_sqlalchemy.Pagination object based on the request parameters
+    Returns a flask_sqlalchemy.Pagination or CursorPagination object based on the
+    request parameters
     :param request: Flask request object
-    :return: flask_sqlalchemy.Pagination
+    :return: flask_sqlalchemy.Pagination or CursorPagination
+    """
+    return _paginate(flask_request, _get_module_builds_query(flask_request), models.ModuleBuild)
+
+
+def iter_module_builds(flask_request, chunk_size):
+    """
+    Returns an iterator over all the module builds matching the request parameters.
+
+    The module builds are fetched from the database using a server-side cursor
+    and they are yielded in lists of at most ``chunk_size`` module builds, so
+    the memory usage does not grow with the number of module builds. The request
+    parameters are validated before this function returns.
+
+    :param request: Flask request object
+    :param int chunk_size: the maximum number of module builds yielded at once.
+    :return: iterator of lists of ModuleBuild objects
+    """
+    query = _get_module_builds_query(flask_request)
+    query = _add_order_by_clause(flask_request, query, models.ModuleBuild)
+    return _iter_chunks(query.yield_per(chunk_size), chunk_size)
+
+
+def _iter_chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _get_module_builds_query(flask_request):
+    """
+    Returns the query of module builds filtered based on the request parameters
+    :param request: Flask request object
+    :return: a SQLAlchemy query object
     """
     search_query = dict()
     special_columns = {
@@ -252,12 +456,19 @@ def filter_module_builds(flask_request):
             else:
                 raise ValidationError("Invalid state was supplied: %s" % state)
 
-    nsvc = flask_request.args.get("nsvc", None)
-    if nsvc:
-        nsvc_parts = nsvc.split(":")
-        query_keys = ["name", "stream", "version", "context"]
-        for key, part in zip(query_keys, nsvc_parts):
+    # Multiple NSVCs can be supplied => or-ing will take place
+    nsvcs = [nsvc for nsvc in flask_request.args.getlist("nsvc") if nsvc]
+    nsvc_clauses = []
+    query_keys = ["name", "stream", "version", "context"]
+    if len(nsvcs) == 1:
+        for key, part in zip(query_keys, nsvcs[0].split(":")):
             search_query[key] = part
+    else:
+        for nsvc in nsvcs:
+            nsvc_clauses.append(sqlalchemy.and_(*[
+                getattr(models.ModuleBuild, key) == part
+                for key, part in zip(query_keys, nsvc.split(":"))
+            ]))
 
     rpm = flask_request.args.get("rpm", None)
     koji_tags = []
@@ -277,6 +488,8 @@ def filter_module_builds(flask_request):
         query = query.filter_by(**search_query)
     if search_states:
         query = query.filter(models.ModuleBuild.state.in_(search_states))
+    if nsvc_clauses:
+        query = query.filter(sqlalchemy.or_(*nsvc_clauses))
     if koji_tags:
         query = query.filter(models.ModuleBuild.koji_tag.in_(koji_tags)).filter_by(**search_query)
 
@@ -386,11 +599,109 @@ def filter_module_builds(flask_request):
             column = getattr(module_br_alias, item)
             query = query.filter(column == request_arg)
 
-    query = _add_order_by_clause(flask_request, query, models.ModuleBuild)
+    return query
 
-    page = flask_request.args.get("page", 1, type=int)
-    per_page = flask_request.args.get("per_page", 10, type=int)
-    return query.paginate(page, per_page, False)
+
+def get_cache_validators(model, items, variant=None):
+    """
+    Returns the ETag and the Last-Modified time of the JSON representation of
+    module or component builds, without serializing them.
+
+    The ETag of module builds is derived from their state and time_modified,
+    the number of their components and the time of the last change of their
+    components. Newly submitted module builds change the siblings of other
+    module builds, so the ETag changes with the id of the newest module build
+    too. The ETag of component builds is derived from their columns and the
+    time of their last change. The ETag also depends on the requested URL,
+    because the query arguments change the representation.
+
+    :param model: the models.ModuleBuild or models.ComponentBuild class.
+    :param list items: the module or component builds being returned.
+    :param variant: additional JSON-serializable data the response depends on,
+        for example the pagination metadata.
+    :return: a tuple of the ETag and the Last-Modified datetime or None.
+    """
+    ids = [item.id for item in items]
+    last_modified_times = []
+    if model is models.ModuleBuild:
+        components = {}
+        if ids:
+            components = {
+                module_id: (count, state_time)
+                for module_id, count, state_time in db.session.query(
+                    models.ComponentBuild.module_id,
+                    sqlalchemy.func.count(sqlalchemy.distinct(models.ComponentBuild.id)),
+                    sqlalchemy.func.max(models.ComponentBuildTrace.state_time),
+                ).outerjoin(
+                    models.ComponentBuildTrace,
+                    models.ComponentBuildTrace.component_id == models.ComponentBuild.id,
+                ).filter(
+                    models.ComponentBuild.module_id.in_(ids)
+                ).group_by(models.ComponentBuild.module_id)
+            }
+        newest_id = db.session.query(sqlalchemy.func.max(models.ModuleBuild.id)).scalar()
+        parts = [newest_id]
+        for item in items:
+            count, state_time = components.get(item.id, (0, None))
+            parts.append((item.id, item.state, item.time_modified, count, state_time))
+            last_modified_times += [item.time_modified, state_time]
+    else:
+        column_attrs = sqlalchemy.inspect(model).column_attrs
+        state_times = {}
+        if ids:
+            state_times = dict(db.session.query(
+                models.ComponentBuildTrace.component_id,
+                sqlalchemy.func.max(models.ComponentBuildTrace.state_time),
+            ).filter(
+                models.ComponentBuildTrace.component_id.in_(ids)
+            ).group_by(models.ComponentBuildTrace.component_id))
+        parts = []
+        for item in items:
+            state_time = state_times.get(item.id)
+            parts.append([getattr(item, attr.key) for attr in column_attrs] + [state_time])
+            last_modified_times.append(state_time)
+
+    digest = hashlib.sha1()
+    digest.update(json.dumps(
+        [request.full_path, variant, parts], sort_keys=True, default=str).encode("utf-8"))
+    last_modified_times = [t for t in last_modified_times if t is not None]
+    return digest.hexdigest(), max(last_modified_times) if last_modified_times else None
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Returns True if the client already has the current representation based
+    on the If-None-Match or, when missing, the If-Modified-Since request headers.
+
+    :param str etag: the current ETag.
+    :param last_modified: the current Last-Modified datetime in UTC or None.
+    :rtype: bool
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if_modified_since = request.if_modified_since
+    if if_modified_since and last_modified:
+        if if_modified_since.tzinfo is not None:
+            if_modified_since = (
+                if_modified_since.replace(tzinfo=None) - if_modified_since.utcoffset())
+        # The HTTP dates have a precision of seconds
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def set_cache_validators(response, etag, last_modified):
+    """
+    Sets the ETag and Last-Modified headers of the response.
+
+    :param response: the Flask Response object.
+    :param str etag: the ETag.
+    :param last_modified: the Last-Modified datetime in UTC or None.
+    :return: the response.
+    """
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
 
 
 def cors_header(allow="*"):
@@ -420,6 +731,50 @@ def cors_header(allow="*"):
     return decorator
 
 
+def cached_response(get_cache_options):
+    """
+    A decorator that caches the successful responses of a read-only Flask route in the
+    response cache. The responses are cached by the URL path and the query arguments.
+    The cached responses honor the conditional request headers.
+
+    :param get_cache_options: a function called with the arguments of the route. It returns
+        None if the response must not be cached, otherwise a tuple of the number of seconds
+        the response is cached for and the names of the module builds the response depends
+        on, as accepted by :meth:`ResponseCache.set`.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            options = None
+            if conf.response_cache_size:
+                options = get_cache_options(*args, **kwargs)
+            if options is None:
+                return func(*args, **kwargs)
+
+            # The order of the values of the same argument matters, for example for order_by
+            args_items = sorted(request.args.items(multi=True), key=lambda item: item[0])
+            key = (request.path, tuple(args_items))
+            cached = response_cache.get(key)
+            if cached is not None:
+                data, headers = cached
+                response = Response(data, headers=headers)
+                response.make_conditional(request)
+                return response, response.status_code
+
+            rv = func(*args, **kwargs)
+            response, status_code = rv
+            if status_code == 200:
+                ttl, names = options
+                response_cache.set(
+                    key, (response.get_data(), list(response.headers)), ttl, names)
+            return rv
+
+        return wrapper
+
+    return decorator
+
+
 def validate_api_version():
     """
     A decorator that validates the requested API version on a route
@@ -9,7 +9,7 @@ from io import BytesIO
 import json
 import sqlalchemy.event
 
-from flask import request, url_for, Blueprint, Response
+from flask import request, url_for, Blueprint, Response, stream_with_context
 from flask.views import MethodView
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from six import string_types
@@ -30,11 +30,16 @@ from module_build_service.web.submit import (
     submit_module_build_from_scm, submit_module_build_from_yaml
 )
 from module_build_service.web.utils import (
+    cached_response,
     cors_header,
     filter_component_builds,
     filter_module_builds,
+    get_cache_validators,
     get_scm_url_re,
+    is_not_modified,
+    iter_module_builds,
     pagination_metadata,
+    set_cache_validators,
     str_to_bool,
     validate_api_version,
 )
@@ -53,6 +58,10 @@ api_routes = {
         "url": "/module-build-service/<int:api_version>/module-builds/<int:id>",
         "options": {"methods": ["GET", "PATCH"]},
     },
+    "export_module_builds": {
+        "url": "/module-build-service/<int:api_version>/module-builds/export/",
+        "options": {"methods": ["GET"]},
+    },
     "component_builds_list": {
         "url": "/module-build-service/<int:api_version>/component-builds/",
         "options": {"defaults": {"id": None}, "methods": ["GET"]},
@@ -84,11 +93,36 @@ api_routes = {
 }
 
 
+def module_builds_cache_options(view, api_version, id=None):
+    """
+    Only the short lists of module builds are cached, because the component
+    builds change their state without a change of the state of their module
+    build, and the other responses include the component builds.
+    """
+    if view.model is not models.ModuleBuild or id is not None or not conf.response_cache_ttl:
+        return None
+    if (
+        str_to_bool(request.args.get("verbose", "false"))
+        or not str_to_bool(request.args.get("short", "false"))
+    ):
+        return None
+    names = request.args.getlist("name")
+    names += [nsvc.split(":")[0] for nsvc in request.args.getlist("nsvc")]
+    # The lists not filtered by the name can depend on any module build
+    return conf.response_cache_ttl, names or None
+
+
+def not_modified(etag, last_modified):
+    """ Returns the 304 Not Modified response. """
+    return set_cache_validators(app.response_class(status=304), etag, last_modified)
+
+
 class AbstractQueryableBuildAPI(MethodView):
     """ An abstract class, housing some common functionality. """
 
     @cors_header()
     @validate_api_version()
+    @cached_response(module_builds_cache_options)
     def get(self, api_version, id):
         id_flag = request.args.get("id")
         if id_flag:
@@ -107,26 +141,29 @@ class AbstractQueryableBuildAPI(MethodView):
             # Lists all tracked builds
             p_query = self.query_filter(request)
             json_data = {"meta": pagination_metadata(p_query, api_version, request.args)}
+            etag, last_modified = get_cache_validators(
+                self.model, p_query.items, json_data["meta"])
+            if is_not_modified(etag, last_modified):
+                return not_modified(etag, last_modified), 304
 
             if verbose_flag == "true" or verbose_flag == "1":
-                json_func_name = "extended_json"
-                json_func_kwargs["show_state_url"] = True
-                json_func_kwargs["api_version"] = api_version
-            elif short_flag == "true" or short_flag == "1":
-                if p_query.items and hasattr(p_query.items[0], "short_json"):
-                    json_func_name = "short_json"
-            if json_func_name == "json" or json_func_name == "extended_json":
-                # Only ModuleBuild.json and ModuleBuild.extended_json has argument db_session
-                json_func_kwargs["db_session"] = db.session
-            json_data["items"] = [
-                getattr(item, json_func_name)(**json_func_kwargs) for item in p_query.items
-            ]
-
-            return jsonify(json_data), 200
+                json_data["items"] = self.model.bulk_json(
+                    db.session, p_query.items, extended=True, show_state_url=True,
+                    api_version=api_version)
+            elif (short_flag == "true" or short_flag == "1") and hasattr(self.model, "short_json"):
+                json_data["items"] = [item.short_json() for item in p_query.items]
+            else:
+                json_data["items"] = self.model.bulk_json(db.session, p_query.items)
+
+            return set_cache_validators(jsonify(json_data), etag, last_modified), 200
         else:
             # Lists details for the specified build
             instance = self.model.query.filter_by(id=id).first()
             if instance:
+                etag, last_modified = get_cache_validators(self.model, [instance])
+                if is_not_modified(etag, last_modified):
+                    return not_modified(etag, last_modified), 304
+
                 if verbose_flag == "true" or verbose_flag == "1":
                     json_func_name = "extended_json"
                     json_func_kwargs["show_state_url"] = True
@@ -137,7 +174,8 @@ class AbstractQueryableBuildAPI(MethodView):
                 if json_func_name == "json" or json_func_name == "extended_json":
                     # Only ModuleBuild.json and ModuleBuild.extended_json has argument db_session
                     json_func_kwargs["db_session"] = db.session
-                return jsonify(getattr(instance, json_func_name)(**json_func_kwargs)), 200
+                rv = jsonify(getattr(instance, json_func_name)(**json_func_kwargs))
+                return set_cache_validators(rv, etag, last_modified), 200
             else:
                 raise NotFound("No such %s found." % self.kind)
 
@@ -246,6 +284,8 @@ class ModuleBuildAPI(AbstractQueryableBuildAPI):
 class AboutAPI(MethodView):
     @cors_header()
     @validate_api_version()
+    # The response depends only on the configuration
+    @cached_response(lambda view, api_version: (None, ()))
     def get(self, api_version):
         json = {"version": version, "api_version": max_api_version}
         config_items = ["auth_method"]
@@ -261,6 +301,8 @@ class AboutAPI(MethodView):
 class RebuildStrategies(MethodView):
     @cors_header()
     @validate_api_version()
+    # The response depends only on the configuration
+    @cached_response(lambda view, api_version: (None, ()))
     def get(self, api_version):
         items = []
         # Sort the items list by name
@@ -316,6 +358,37 @@ class ImportModuleAPI(MethodView):
         return jsonify(json_data), 201
 
 
+class ModuleBuildExportAPI(MethodView):
+    # The number of module builds fetched from the database and serialized at once
+    chunk_size = 100
+
+    @cors_header()
+    @validate_api_version()
+    def get(self, api_version):
+        """
+        Streams all the module builds matching the same filters as the
+        "module-builds" resource as newline-delimited JSON.
+        """
+        verbose = str_to_bool(request.args.get("verbose", "false"))
+        short = str_to_bool(request.args.get("short", "false"))
+        chunks = iter_module_builds(request, self.chunk_size)
+
+        def generate():
+            for builds in chunks:
+                if verbose:
+                    items = models.ModuleBuild.bulk_json(
+                        db.session, builds, extended=True, show_state_url=True,
+                        api_version=api_version)
+                elif short:
+                    items = [build.short_json() for build in builds]
+                else:
+                    items = models.ModuleBuild.bulk_json(db.session, builds)
+                for item in items:
+                    yield json.dumps(item) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 class LogMessageAPI(MethodView):
 
     @validate_api_version()
@@ -558,6 +631,7 @@ def register_api():
     about_view = AboutAPI.as_view("about")
     rebuild_strategies_view = RebuildStrategies.as_view("rebuild_strategies")
     import_module = ImportModuleAPI.as_view("import_module")
+    export_module_builds = ModuleBuildExportAPI.as_view("export_module_builds")
     log_message = LogMessageAPI.as_view("log_messages")
     for key, val in api_routes.items():
         if key.startswith("component_build"):
@@ -572,6 +646,10 @@ def register_api():
             )
         elif key == "import_module":
             app.add_url_rule(val["url"], endpoint=key, view_func=import_module, **val["options"])
+        elif key == "export_module_builds":
+            app.add_url_rule(
+                val["url"], endpoint=key, view_func=export_module_builds, **val["options"]
+            )
         elif key.startswith("log_message"):
             app.add_url_rule(val["url"], endpoint=key, view_func=log_message, **val["options"])
         else:
@@ -26,8 +26,10 @@ from module_build_service.common.models import (
     VirtualStream,
 )
 from module_build_service.common.modulemd import Modulemd
+from module_build_service.common.response_cache import response_cache
 from module_build_service.common.utils import load_mmd, import_mmd, mmd_to_str, to_text_type
 from module_build_service.scheduler.db_session import db_session
+from module_build_service.scheduler.routing_index import routing_index
 
 
 base_dir = os.path.dirname(__file__)
@@ -115,6 +117,8 @@ def clean_database(add_platform_module=True, add_default_arches=True):
     # to keep any changes in the transaction made by previous test.
     db_session.remove()
     db_session.configure(bind=db.session.get_bind())
+    routing_index.clear()
+    response_cache.clear()
 
     db.drop_all()
     db.create_all()
@@ -1792,13 +1792,15 @@ class TestBuild(BaseTestBuild):
             return result
 
         with patch(
-            "module_build_service.scheduler.batches.at_concurrent_component_threshold"
-        ) as mock_acct:
+            "module_build_service.scheduler.batches.get_free_concurrent_component_slots"
+        ) as mock_gfccs:
             # Once we get to batch 2, then simulate the concurrent threshold being met
-            def _at_concurrent_component_threshold(config):
-                return models.ModuleBuild.get_by_id(db_session, module_build_id).batch == 2
+            def _get_free_concurrent_component_slots(config):
+                if models.ModuleBuild.get_by_id(db_session, module_build_id).batch == 2:
+                    return 0
+                return None
 
-            mock_acct.side_effect = _at_concurrent_component_threshold
+            mock_gfccs.side_effect = _get_free_concurrent_component_slots
             self.run_scheduler(stop_condition=_stop_condition)
 
         # Only module-build-macros should be built
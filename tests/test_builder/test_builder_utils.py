@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import hashlib
+import os
 import shutil
+import struct
 import tempfile
 
 from mock import call, MagicMock, Mock, patch, PropertyMock
@@ -19,13 +22,17 @@ from tests import init_data, read_staged_data, scheduler_init_data
 @patch("requests.get")
 @patch("koji.ClientSession")
 @patch("module_build_service.builder.utils.execute_cmd")
-def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_get):
+@patch("module_build_service.builder.utils._rpm_matches", return_value=True)
+def test_create_local_repo_from_koji_tag(
+    mock_rpm_matches, mock_exec_cmd, mock_koji_session, mock_get
+):
     session = Mock()
     rpms = [
         {
             "arch": "src",
             "build_id": 875991,
             "name": "module-build-macros",
+            "payloadhash": "00000000000000000000000000000001",
             "release": "1.module_92011fe6",
             "size": 6890,
             "version": "0.1",
@@ -34,6 +41,7 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
             "arch": "noarch",
             "build_id": 875991,
             "name": "module-build-macros",
+            "payloadhash": "00000000000000000000000000000002",
             "release": "1.module_92011fe6",
             "size": 6890,
             "version": "0.1",
@@ -42,6 +50,7 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
             "arch": "x86_64",
             "build_id": 875636,
             "name": "ed-debuginfo",
+            "payloadhash": "00000000000000000000000000000003",
             "release": "2.module_bd6e0eb1",
             "size": 81438,
             "version": "1.14.1",
@@ -50,6 +59,7 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
             "arch": "x86_64",
             "build_id": 875636,
             "name": "ed",
+            "payloadhash": "00000000000000000000000000000004",
             "release": "2.module_bd6e0eb1",
             "size": 80438,
             "version": "1.14.1",
@@ -58,6 +68,7 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
             "arch": "x86_64",
             "build_id": 875640,
             "name": "mksh-debuginfo",
+            "payloadhash": "00000000000000000000000000000005",
             "release": "2.module_bd6e0eb1",
             "size": 578774,
             "version": "54",
@@ -66,6 +77,7 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
             "arch": "x86_64",
             "build_id": 875640,
             "name": "mksh",
+            "payloadhash": "00000000000000000000000000000006",
             "release": "2.module_bd6e0eb1",
             "size": 267042,
             "version": "54",
@@ -100,10 +112,53 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
     session.opts = {"topurl": "https://kojipkgs.stg.fedoraproject.org/"}
     mock_koji_session.return_value = session
 
+    def mocked_execute_cmd(args, **kwargs):
+        os.mkdir(os.path.join(args[1], "repodata"))
+
+    mock_exec_cmd.side_effect = mocked_execute_cmd
+
     tag = "module-testmodule-master-20170405123740-build"
     temp_dir = tempfile.mkdtemp()
+    repo_dir = os.path.join(temp_dir, "repo")
     try:
-        utils.create_local_repo_from_koji_tag(conf, tag, temp_dir)
+        with patch.object(
+            type(conf), "rpm_cache_dir", new_callable=PropertyMock,
+            return_value=os.path.join(temp_dir, "rpms")
+        ):
+            utils.create_local_repo_from_koji_tag(conf, tag, repo_dir)
+            assert mock_exec_cmd.call_count == 1
+            download_calls = list(mock_get.call_args_list)
+
+            # Nothing has changed, so nothing is downloaded and the repo is not recreated
+            mock_get.reset_mock()
+            mock_exec_cmd.reset_mock()
+            utils.create_local_repo_from_koji_tag(conf, tag, repo_dir)
+            mock_get.assert_not_called()
+            mock_exec_cmd.assert_not_called()
+
+            # The RPMs are downloaded once and linked to every repository
+            other_repo_dir = os.path.join(temp_dir, "other-repo")
+            utils.create_local_repo_from_koji_tag(conf, tag, other_repo_dir)
+            mock_get.assert_not_called()
+            assert sorted(os.listdir(other_repo_dir)) == sorted(os.listdir(repo_dir))
+
+            # The RPMs not linked to the cache are not read again when their size matches
+            # and replaced by the cached ones when it does not.
+            ed_fn = os.path.join(repo_dir, "ed-1.14.1-2.module_bd6e0eb1.x86_64.rpm")
+            mksh_fn = os.path.join(repo_dir, "mksh-54-2.module_bd6e0eb1.x86_64.rpm")
+            for fn, size in ((ed_fn, 80438), (mksh_fn, 100)):
+                os.remove(fn)
+                with open(fn, "wb") as f:
+                    f.write(b"\x00" * size)
+            mock_exec_cmd.reset_mock()
+            with patch("module_build_service.builder.utils.get_rpm_sigmd5") as mock_sigmd5:
+                utils.create_local_repo_from_koji_tag(conf, tag, repo_dir)
+                mock_sigmd5.assert_not_called()
+            mock_get.assert_not_called()
+            assert mock_exec_cmd.call_count == 1
+            assert os.path.getsize(ed_fn) == 80438
+            assert os.path.samefile(mksh_fn, utils._get_rpm_cache_path(
+                conf, "00000000000000000000000000000006"))
     finally:
         shutil.rmtree(temp_dir)
 
@@ -126,8 +181,65 @@ def test_create_local_repo_from_koji_tag(mock_exec_cmd, mock_koji_session, mock_
         call(url_three, stream=True, timeout=60),
     ]
     for expected_call in expected_calls:
-        assert expected_call in mock_get.call_args_list
-    assert len(mock_get.call_args_list) == len(expected_calls)
+        assert expected_call in download_calls
+    assert len(download_calls) == len(expected_calls)
+
+
+def _make_rpm_data(payload):
+    """Returns the lead, the signature header and the payload of a fake RPM file."""
+    lead = b"\x00" * 96
+    signature_data = b"\x00" * 5
+    signature = (
+        b"\x8e\xad\xe8\x01" + b"\x00" * 4 + struct.pack("!II", 1, len(signature_data))
+        + b"\x00" * 16 + signature_data
+    )
+    # The signature header is padded to a multiple of 8 bytes.
+    signature += b"\x00" * ((8 - len(signature) % 8) % 8)
+    return lead + signature + payload
+
+
+def test_get_rpm_sigmd5():
+    payload = b"header and payload" * 100
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(_make_rpm_data(payload))
+        f.flush()
+        assert utils.get_rpm_sigmd5(f.name) == hashlib.md5(payload).hexdigest()
+
+
+@patch("requests.get")
+def test_download_rpm_to_cache_resumes(mock_get):
+    payload = b"header and payload" * 100
+    rpm_data = _make_rpm_data(payload)
+    sigmd5 = hashlib.md5(payload).hexdigest()
+    url = "https://kojipkgs.stg.fedoraproject.org/foo-1-1.noarch.rpm"
+
+    mock_get.return_value.status_code = 206
+    mock_get.return_value.iter_content.return_value = [rpm_data[500:]]
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        with patch.object(
+            type(conf), "rpm_cache_dir", new_callable=PropertyMock, return_value=temp_dir
+        ):
+            # The interrupted download
+            os.mkdir(os.path.join(temp_dir, sigmd5[:2]))
+            with open(os.path.join(temp_dir, sigmd5[:2], sigmd5 + ".rpm.part"), "wb") as f:
+                f.write(rpm_data[:500])
+
+            cached_fn = utils._download_rpm_to_cache(conf, url, sigmd5, len(rpm_data))
+
+            mock_get.assert_called_once_with(
+                url, stream=True, timeout=60, headers={"Range": "bytes=500-"})
+            with open(cached_fn, "rb") as f:
+                assert f.read() == rpm_data
+            assert os.listdir(os.path.dirname(cached_fn)) == [sigmd5 + ".rpm"]
+
+            # The corrupted download is not added to the cache
+            with pytest.raises(RuntimeError, match="does not match"):
+                utils._download_rpm_to_cache(conf, url, "0" * 32, len(rpm_data))
+            assert not os.path.exists(os.path.join(temp_dir, "00", "0" * 32 + ".rpm"))
+    finally:
+        shutil.rmtree(temp_dir)
 
 
 def test_validate_koji_tag_wrong_tag_arg_during_programming():
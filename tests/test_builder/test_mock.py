@@ -10,6 +10,7 @@ import kobo.rpmlib
 import koji
 import mock
 import pytest
+import requests
 
 from module_build_service.common.config import conf
 from module_build_service.builder.MockModuleBuilder import (
@@ -17,6 +18,7 @@ from module_build_service.builder.MockModuleBuilder import (
     import_builds_from_local_dnf_repos,
     load_local_builds,
     MockModuleBuilder,
+    MockRootCache,
 )
 from module_build_service.common import models
 from module_build_service.common.models import ModuleBuild, ComponentBuild
@@ -189,6 +191,138 @@ class TestMockModuleBuilder:
             pkglist = fd.read().strip()
             assert not pkglist
 
+    @mock.patch("module_build_service.common.conf.system", new="mock")
+    @mock.patch("module_build_service.builder.MockModuleBuilder.execute_cmd")
+    def test_createrepo_incremental(self, execute_cmd):
+        module = self._create_module_with_filters(db_session, 2, koji.BUILD_STATES["COMPLETE"])
+
+        builder = MockModuleBuilder(
+            db_session, "mcurlej", module, conf, module.koji_tag, module.component_builds
+        )
+        builder.resultsdir = self.resultdir
+
+        def mocked_execute_cmd(args):
+            repodata_path = os.path.join(self.resultdir, "repodata")
+            if not os.path.exists(repodata_path):
+                os.mkdir(repodata_path)
+            open(os.path.join(repodata_path, "repomd.xml"), "w").close()
+
+        execute_cmd.side_effect = mocked_execute_cmd
+
+        nevras = {
+            "ed-1.14.1-4.module+24957a32.x86_64.rpm": "ed 0 1.14.1 4.module+24957a32 x86_64",
+            "mksh-56b-1.module+24957a32.x86_64.rpm": "mksh 0 56b-1 module+24957a32 x86_64",
+            "module-build-macros-0.1-1.module+24957a32.noarch.rpm":
+                "module-build-macros 0 0.1 1.module+24957a32 noarch",
+        }
+
+        def mocked_check_output(args, **kwargs):
+            return "\n".join(nevras[rpm] for rpm in args[4:]) + "\n"
+
+        def add_rpm(rpm):
+            with open(os.path.join(self.resultdir, rpm), "w") as f:
+                f.write(rpm)
+
+        createrepo_cmd = [
+            "/usr/bin/createrepo_c", "--pkglist", os.path.join(self.resultdir, "pkglist")]
+        add_rpm("ed-1.14.1-4.module+24957a32.x86_64.rpm")
+        add_rpm("mksh-56b-1.module+24957a32.x86_64.rpm")
+        with mock.patch("subprocess.check_output", side_effect=mocked_check_output) as rpm_q:
+            builder._createrepo()
+            assert len(rpm_q.call_args[0][0][4:]) == 2
+            execute_cmd.assert_called_once_with(createrepo_cmd + [self.resultdir])
+
+            # Nothing has changed, so nothing is queried nor generated again
+            rpm_q.reset_mock()
+            execute_cmd.reset_mock()
+            builder._createrepo()
+            rpm_q.assert_not_called()
+            execute_cmd.assert_not_called()
+
+            # Only the new RPM is queried and the repository is updated
+            add_rpm("module-build-macros-0.1-1.module+24957a32.noarch.rpm")
+            builder._createrepo()
+            assert rpm_q.call_args[0][0][4:] == [
+                "module-build-macros-0.1-1.module+24957a32.noarch.rpm"]
+            execute_cmd.assert_called_once_with(createrepo_cmd + ["--update", self.resultdir])
+
+            # Only modules.yaml is injected into the repository
+            execute_cmd.reset_mock()
+            builder._createrepo(include_module_yaml=True)
+            execute_cmd.assert_called_once_with([
+                "/usr/bin/modifyrepo_c",
+                "--mdtype=modules",
+                os.path.join(self.resultdir, "modules.yaml"),
+                os.path.join(self.resultdir, "repodata"),
+            ])
+
+        with open(os.path.join(self.resultdir, "pkglist"), "r") as fd:
+            assert len(fd.read().strip().split("\n")) == 3
+
+    @mock.patch("module_build_service.common.conf.system", new="mock")
+    def test_enable_root_cache(self):
+        module = self._create_module_with_filters(db_session, 2, koji.BUILD_STATES["COMPLETE"])
+        builder = MockModuleBuilder(
+            db_session, "mcurlej", module, conf, module.koji_tag, module.component_builds
+        )
+        builder.groups = ["bash", "module-build-macros"]
+
+        repo_dir = os.path.join(self.resultdir, "repo")
+        os.makedirs(os.path.join(repo_dir, "repodata"))
+        repomd_path = os.path.join(repo_dir, "repodata", "repomd.xml")
+        with open(repomd_path, "w") as f:
+            f.write("<repomd>1</repomd>")
+        builder._add_repo("platform", "file://" + repo_dir)
+
+        cache_dir = os.path.join(self.resultdir, "root-cache")
+        mock_config = os.path.join(builder.configdir, "mock-MainThread.cfg")
+
+        def enable_root_cache():
+            builder._write_mock_config()
+            builder._enable_root_cache(mock_config)
+            with open(mock_config) as f:
+                return f.read()
+
+        with mock.patch.object(
+            type(conf), "mock_root_cache_dir", new_callable=mock.PropertyMock,
+            return_value=cache_dir
+        ):
+            config = enable_root_cache()
+            assert "config_opts['plugin_conf']['root_cache_enable'] = True" in config
+            assert len(os.listdir(cache_dir)) == 1
+            root_cache_dir = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            assert repr(root_cache_dir + "/") in config
+
+            # The same config and repositories reuse the same root cache
+            enable_root_cache()
+            assert os.listdir(cache_dir) == [os.path.basename(root_cache_dir)]
+
+            # The changed repository needs a new root cache
+            with open(repomd_path, "w") as f:
+                f.write("<repomd>2</repomd>")
+            enable_root_cache()
+            assert len(os.listdir(cache_dir)) == 2
+
+            # The content of the remote repository is not known
+            builder._add_repo("remote", "https://repos.example.com/remote/")
+            with mock.patch("requests.get", side_effect=requests.exceptions.ConnectionError):
+                config = enable_root_cache()
+            assert "root_cache_enable" not in config
+
+    def test_root_cache_eviction(self):
+        cache_dir = os.path.join(self.resultdir, "root-cache")
+        for i, name in enumerate(["old", "recent"]):
+            os.makedirs(os.path.join(cache_dir, name))
+            with open(os.path.join(cache_dir, name, "cache.tar.gz"), "wb") as f:
+                f.write(b"0" * 600 * 1024)
+            os.utime(os.path.join(cache_dir, name), (1000 + i, 1000 + i))
+
+        config = mock.Mock(mock_root_cache_dir=cache_dir, mock_root_cache_max_size=1)
+        path = MockRootCache().get_dir(config, "new")
+
+        assert path == os.path.join(cache_dir, "new")
+        assert sorted(os.listdir(cache_dir)) == ["new", "recent"]
+
 
 class TestMockModuleBuilderAddRepos:
     def setup_method(self, test_method):
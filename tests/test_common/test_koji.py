@@ -1,15 +1,93 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import threading
 
 import mock
+import pytest
 
-from module_build_service.common.koji import get_session
+from module_build_service.common.koji import get_session, KojiSessionPool
 
 
 @mock.patch("koji.ClientSession")
 def test_get_anonymous_session(mock_session):
-    mbs_config = mock.Mock(koji_profile="koji", koji_config="conf/koji.conf")
+    mbs_config = mock.Mock(
+        koji_profile="koji", koji_config="conf/koji.conf", koji_session_pool_size=0)
     session = get_session(mbs_config, login=False)
     assert mock_session.return_value == session
     assert mock_session.return_value.krb_login.assert_not_called
+
+
+@mock.patch("module_build_service.common.koji._create_session")
+class TestKojiSessionPool:
+
+    def setup_method(self, test_method):
+        self.config = mock.Mock(
+            koji_profile="koji",
+            koji_config="conf/koji.conf",
+            koji_session_pool_size=2,
+            koji_session_check_interval=300,
+        )
+        self.pool = KojiSessionPool()
+
+    def _new_session(self, *args, **kwargs):
+        return mock.Mock(multicall=False)
+
+    def test_session_reused(self, create_session):
+        create_session.side_effect = self._new_session
+        session = self.pool.get(self.config, login=True)
+        assert self.pool.get(self.config, login=True) is session
+        assert self.pool.get(self.config, login=False) is not session
+        assert create_session.call_count == 2
+        # The session was not checked, because the check interval did not pass yet
+        session.getLoggedInUser.assert_not_called()
+
+    def test_pool_disabled(self, create_session):
+        create_session.side_effect = self._new_session
+        self.config.koji_session_pool_size = 0
+        assert self.pool.get(self.config) is not self.pool.get(self.config)
+        assert len(self.pool) == 0
+
+    def test_session_per_thread(self, create_session):
+        create_session.side_effect = self._new_session
+        session = self.pool.get(self.config)
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.pool.get(self.config)))
+        thread.start()
+        thread.join()
+        assert sessions[0] is not session
+
+    @pytest.mark.parametrize("logged_in_user", ({"name": "mbs"}, None))
+    def test_session_relogin_when_expired(self, create_session, logged_in_user):
+        create_session.side_effect = self._new_session
+        self.config.koji_session_check_interval = 0
+        session = self.pool.get(self.config, login=True)
+        session.getLoggedInUser.return_value = logged_in_user
+
+        new_session = self.pool.get(self.config, login=True)
+        session.getLoggedInUser.assert_called_once_with()
+        if logged_in_user:
+            assert new_session is session
+        else:
+            assert new_session is not session
+
+    def test_anonymous_session_health_check(self, create_session):
+        create_session.side_effect = self._new_session
+        self.config.koji_session_check_interval = 0
+        session = self.pool.get(self.config, login=False)
+        session.getAPIVersion.side_effect = IOError("connection reset")
+        assert self.pool.get(self.config, login=False) is not session
+
+    def test_session_in_multicall_mode_replaced(self, create_session):
+        create_session.side_effect = self._new_session
+        session = self.pool.get(self.config)
+        session.multicall = True
+        assert self.pool.get(self.config) is not session
+
+    def test_pool_size_limit(self, create_session):
+        create_session.side_effect = self._new_session
+        self.pool.get(self.config, login=True)
+        self.pool.get(self.config, login=False)
+        self.config.koji_profile = "other"
+        self.pool.get(self.config, login=True)
+        assert len(self.pool) == 2
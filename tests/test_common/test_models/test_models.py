@@ -6,7 +6,9 @@ from mock import patch
 import pytest
 
 from module_build_service.common.config import conf
-from module_build_service.common.models import ComponentBuild, ComponentBuildTrace, ModuleBuild
+from module_build_service.common.models import (
+    ComponentBuild, ComponentBuildTrace, LogMessage, ModuleBuild, log_message_buffer
+)
 from module_build_service.common.utils import load_mmd, mmd_to_str
 from module_build_service.scheduler.db_session import db_session
 from tests import (
@@ -83,6 +85,85 @@ class TestModels:
 
         assert sorted(sibling_ids) == [3, 4]
 
+    @pytest.mark.parametrize("extended", (True, False))
+    def test_module_build_bulk_json(self, extended):
+        """ Tests that bulk_json returns the same data as calling (extended_)json per build """
+        init_data_contexts(2)
+        builds = db_session.query(ModuleBuild).order_by(ModuleBuild.id).all()
+        if extended:
+            expected = [build.extended_json(db_session) for build in builds]
+        else:
+            expected = [build.json(db_session) for build in builds]
+        db_session.expire_all()
+
+        builds = db_session.query(ModuleBuild).order_by(ModuleBuild.id).all()
+        assert ModuleBuild.bulk_json(db_session, builds, extended=extended) == expected
+
+    @pytest.mark.parametrize("extended", (True, False))
+    def test_component_build_bulk_json(self, extended):
+        init_data_contexts(2)
+        builds = db_session.query(ComponentBuild).order_by(ComponentBuild.id).all()
+        if extended:
+            expected = [build.extended_json(db_session) for build in builds]
+        else:
+            expected = [build.json(db_session) for build in builds]
+
+        assert ComponentBuild.bulk_json(db_session, builds, extended=extended) == expected
+
+    def test_bulk_json_empty(self):
+        assert ModuleBuild.bulk_json(db_session, [], extended=True) == []
+        assert ComponentBuild.bulk_json(db_session, [], extended=True) == []
+
+    def test_batch_index(self):
+        """ Tests that the batch methods reflect the changes of the components """
+        build = ModuleBuild(batch=2)
+        components = [
+            ComponentBuild(package=package, batch=batch, state=state, module_build=build)
+            for package, batch, state in (
+                ("a", 2, None), ("b", 1, 1), ("c", 2, 1), ("d", 3, None))
+        ]
+
+        assert build.current_batch() == [components[0], components[2]]
+        assert build.current_batch(state=1) == [components[2]]
+        assert build.up_to_current_batch() == components[:3]
+        assert build.up_to_current_batch(state=1) == components[1:3]
+        assert build.last_batch_id() == 3
+
+        components[3].batch = 2
+        components[0].state = 1
+        e = ComponentBuild(package="e", batch=4, module_build=build)
+        assert build.current_batch(state=1) == [components[0], components[2]]
+        assert build.up_to_current_batch() == components
+        assert build.last_batch_id() == 4
+
+        build.component_builds.remove(e)
+        build.batch = 1
+        assert build.current_batch() == [components[1]]
+        assert build.last_batch_id() == 2
+
+    def test_log_message_buffered(self):
+        build = ModuleBuild.get_by_id(db_session, 1)
+        with patch.object(db_session, "commit", wraps=db_session.commit) as commit:
+            with log_message_buffer.buffered(db_session):
+                build.log_message(db_session, "first")
+                with log_message_buffer.buffered(db_session):
+                    build.log_message(db_session, "second")
+                assert db_session.query(LogMessage).count() == 0
+            commit.assert_called_once()
+
+        # The buffered messages are stored even when the handler fails, but
+        # the other changes done by the handler are rolled back.
+        with pytest.raises(RuntimeError):
+            with log_message_buffer.buffered(db_session):
+                build.log_message(db_session, "third")
+                build.state_reason = "Changed by the failed handler"
+                raise RuntimeError("The handler failed")
+        assert build.state_reason != "Changed by the failed handler"
+
+        messages = db_session.query(LogMessage).order_by(LogMessage.id).all()
+        assert [m.message for m in messages] == ["first", "second", "third"]
+        assert all(m.module_build_id == 1 for m in messages)
+
     @pytest.mark.parametrize(
         "stream,right_pad,expected",
         [
@@ -14,7 +14,7 @@ import module_build_service.common.monitor
 from module_build_service.scheduler.db_session import db_session
 from tests import clean_database, init_data, make_module_in_db
 
-num_of_metrics = 18
+num_of_metrics = 20
 
 
 class TestViews:
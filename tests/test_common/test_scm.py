@@ -4,11 +4,15 @@ from __future__ import absolute_import
 import os
 import shutil
 import tempfile
+import threading
 
+import mock
 import pytest
 
+import module_build_service.common.config as mbs_config
 from module_build_service.common.errors import ValidationError, UnprocessableEntity
 import module_build_service.common.scm
+from module_build_service.common.scm import SCM, SCMExecutor
 
 base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, "scm_data"))
 repo_url = "file://" + base_dir + "/testrepo"
@@ -18,8 +22,14 @@ class TestSCMModule:
     def setup_method(self, test_method):
         self.tempdir = tempfile.mkdtemp()
         self.repodir = self.tempdir + "/testrepo"
+        self.p_scm_cache_dir = mock.patch.object(
+            mbs_config.Config, "scm_cache_dir", new_callable=mock.PropertyMock,
+            return_value=os.path.join(self.tempdir, "cache"),
+        )
+        self.p_scm_cache_dir.start()
 
     def teardown_method(self, test_method):
+        self.p_scm_cache_dir.stop()
         if os.path.exists(self.tempdir):
             shutil.rmtree(self.tempdir)
 
@@ -127,3 +137,72 @@ class TestSCMModule:
         scm = module_build_service.common.scm.SCM(repo_url)
         with pytest.raises(UnprocessableEntity):
             scm.get_latest("15481faa232d66589e660cc301179867fb00842c9")
+
+    def test_get_full_commit_hash_from_mirror(self):
+        scm = module_build_service.common.scm.SCM(repo_url)
+        target = "5481faa232d66589e660cc301179867fb00842c9"
+        assert scm.get_full_commit_hash("5481f") == target
+        mirror_dir = scm._get_mirror_dir()
+        assert os.path.isdir(mirror_dir)
+
+        # The commit is already in the mirror, so it is not cloned nor fetched again
+        with mock.patch.object(SCM, "_run") as run:
+            assert scm.get_full_commit_hash("5481f") == target
+            run.assert_not_called()
+
+        # The unknown commit is fetched before giving up
+        with mock.patch.object(SCM, "_run") as run:
+            with pytest.raises(UnprocessableEntity):
+                scm.get_full_commit_hash("15481faa232d66589e660cc301179867fb00842c9")
+            run.assert_called_once_with(
+                ["git", "fetch", "-q", "--prune", "origin"], chdir=mirror_dir)
+
+    @mock.patch.object(
+        mbs_config.Config, "scm_ref_cache_size", new_callable=mock.PropertyMock,
+        return_value=100
+    )
+    def test_get_latest_is_cached(self, scm_ref_cache_size):
+        scm = module_build_service.common.scm.SCM(repo_url)
+        target = "5481faa232d66589e660cc301179867fb00842c9"
+        assert scm.get_latest("master") == target
+
+        with mock.patch.object(SCM, "_run_without_retry") as run:
+            assert scm.get_latest("master") == target
+            run.assert_not_called()
+
+        with mock.patch.object(
+            mbs_config.Config, "scm_ref_cache_ttl", new_callable=mock.PropertyMock,
+            return_value=0
+        ):
+            with mock.patch.object(SCM, "_run_without_retry") as run:
+                run.return_value = (0, target.encode("utf-8") + b"\trefs/heads/master", b"")
+                assert scm.get_latest("master") == target
+                run.assert_called_once()
+
+
+@mock.patch("module_build_service.common.scm.SCM")
+def test_scm_executor_coalesces_lookups(mocked_scm):
+    executor = SCMExecutor()
+    release = threading.Event()
+
+    def mocked_get_latest(ref):
+        release.wait(10)
+        return ref + "-hash"
+
+    mocked_scm.return_value.get_latest.side_effect = mocked_get_latest
+
+    future = executor.submit_get_latest("https://src.example.com/rpms/foo", "master")
+    same_future = executor.submit_get_latest("https://src.example.com/rpms/foo", "master")
+    other_future = executor.submit_get_latest("https://src.example.com/rpms/foo", "f32")
+    assert same_future is future
+    assert other_future is not future
+
+    progress = []
+    threading.Timer(0.1, release.set).start()
+    with mock.patch.object(SCMExecutor, "progress_interval", new=0.01):
+        executor.wait([future, other_future], lambda *args: progress.append(args))
+
+    assert future.result() == "master-hash"
+    assert other_future.result() == "f32-hash"
+    assert mocked_scm.return_value.get_latest.call_count == 2
+    assert progress and progress[0] == (0, 2)
@@ -6,7 +6,7 @@ import pytest
 
 from module_build_service.common import models
 from module_build_service.common.errors import UnprocessableEntity
-from module_build_service.common.utils import import_mmd, load_mmd
+from module_build_service.common.utils import import_mmd, load_mmd, ModulemdCache
 from module_build_service.scheduler.db_session import db_session
 from tests import clean_database, read_staged_data
 
@@ -152,3 +152,53 @@ def test_import_mmd_dont_remove_dropped_virtual_streams_associated_with_other_mo
     # The overlapped f30 should be still there.
     db_session.refresh(another_module_build)
     assert ["f29", "f30"] == sorted(item.name for item in another_module_build.virtual_streams)
+
+
+class TestModulemdCache:
+
+    def test_get_cached(self):
+        cache = ModulemdCache(2)
+        yaml = read_staged_data("formatted_testmodule")
+        mmd = cache.get(1, yaml)
+        assert mmd.get_module_name() == "testmodule"
+        assert cache.get(1, yaml) is mmd
+        assert len(cache) == 1
+
+    def test_get_modulemd_changed(self):
+        cache = ModulemdCache(2)
+        mmd = cache.get(1, read_staged_data("formatted_testmodule"))
+        new_mmd = cache.get(1, read_staged_data("testmodule_dependencies"))
+        assert new_mmd is not mmd
+        # The entry of the old modulemd content is dropped
+        assert len(cache) == 1
+
+    def test_lru_eviction(self):
+        cache = ModulemdCache(2)
+        yaml = read_staged_data("formatted_testmodule")
+        first = cache.get(1, yaml)
+        cache.get(2, yaml)
+        # Mark the first entry as the most recently used one
+        cache.get(1, yaml)
+        cache.get(3, yaml)
+        assert len(cache) == 2
+        assert cache.get(1, yaml) is first
+
+    def test_disabled(self):
+        cache = ModulemdCache(0)
+        yaml = read_staged_data("formatted_testmodule")
+        assert cache.get(1, yaml) is not cache.get(1, yaml)
+        assert len(cache) == 0
+
+    def test_invalid_modulemd_not_cached(self):
+        cache = ModulemdCache(2)
+        with pytest.raises(UnprocessableEntity):
+            cache.get(1, read_staged_data("bad"))
+        assert len(cache) == 0
+
+    def test_module_build_mmd_returns_copy(self):
+        clean_database()
+        build = models.ModuleBuild.get_by_id(db_session, 1)
+        mmd = build.mmd()
+        mmd.set_summary("changed")
+        assert build.mmd().get_summary() != "changed"
+        assert build.mmd(read_only=True) is build.mmd(read_only=True)
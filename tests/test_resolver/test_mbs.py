@@ -6,10 +6,12 @@ from mock import patch, PropertyMock, Mock, call
 
 from module_build_service import app
 from module_build_service.builder.MockModuleBuilder import load_local_builds
+import module_build_service.common.config
 import module_build_service.common.models
 from module_build_service.common import conf
 from module_build_service.common.utils import load_mmd, mmd_to_str
 import module_build_service.resolver as mbs_resolver
+from module_build_service.resolver.MBSResolver import mbs_resolver_cache
 from module_build_service.scheduler.db_session import db_session
 import tests
 
@@ -50,7 +52,9 @@ class TestMBSModule:
             "verbose": True,
             "order_desc_by": "version",
             "page": 1,
-            "per_page": 10,
+            "per_page": 100,
+            "cursor": "",
+            "count": False,
             "state": ["ready"],
             "virtual_stream": ["f28"],
         }
@@ -103,7 +107,9 @@ class TestMBSModule:
             "verbose": True,
             "order_desc_by": "version",
             "page": 1,
-            "per_page": 10,
+            "per_page": 100,
+            "cursor": "",
+            "count": False,
             "state": ["ready"],
         }
         mock_session.get.assert_called_once_with(mbs_url, params=expected_query)
@@ -161,7 +167,9 @@ class TestMBSModule:
                 "verbose": True,
                 "order_desc_by": "version",
                 "page": 1,
-                "per_page": 10,
+                "per_page": 100,
+                "cursor": "",
+                "count": False,
                 "state": ["ready"],
             },
             {
@@ -172,7 +180,9 @@ class TestMBSModule:
                 "verbose": True,
                 "order_desc_by": "version",
                 "page": 1,
-                "per_page": 10,
+                "per_page": 100,
+                "cursor": "",
+                "count": False,
                 "state": ["ready"],
             },
         ]
@@ -234,7 +244,9 @@ class TestMBSModule:
             "verbose": True,
             "order_desc_by": "version",
             "page": 1,
-            "per_page": 10,
+            "per_page": 100,
+            "cursor": "",
+            "count": False,
             "state": ["ready"],
         }
         mock_session.get.assert_called_once_with(mbs_url, params=expected_query)
@@ -312,7 +324,9 @@ class TestMBSModule:
             "verbose": True,
             "order_desc_by": "version",
             "page": 1,
-            "per_page": 10,
+            "per_page": 100,
+            "cursor": "",
+            "count": False,
             "state": ["ready"],
         }
 
@@ -516,3 +530,81 @@ class TestMBSModule:
         assert "10" == mmd.get_stream_name()
         assert 2 == mmd.get_version()
         assert "c1" == mmd.get_context()
+
+    @patch("module_build_service.resolver.MBSResolver.requests_session")
+    @patch.object(
+        module_build_service.common.config.Config, "mbs_resolver_cache_size",
+        new_callable=PropertyMock, return_value=100
+    )
+    def test_get_module_modulemds_cached(self, cache_size, mock_session):
+        mbs_resolver_cache.clear()
+        mock_session.get.return_value = Mock(ok=True)
+        mock_session.get.return_value.json.return_value = {
+            "items": [
+                {
+                    "name": "nodejs",
+                    "stream": "10",
+                    "version": 2,
+                    "context": "c1",
+                    "state_name": "ready",
+                    "modulemd": mmd_to_str(tests.make_module("nodejs:10:2:c1")),
+                },
+            ],
+            "meta": {"next": None},
+        }
+
+        resolver = mbs_resolver.GenericResolver.create(db_session, conf, backend="mbs")
+        try:
+            for _ in range(2):
+                mmds = resolver.get_module_modulemds("nodejs", "10")
+                assert [mmd.get_nsvc() for mmd in mmds] == ["nodejs:10:2:c1"]
+            # The module build in the ready state is cached by its NSVC
+            mmds = resolver.get_module_modulemds("nodejs", "10", "2", "c1")
+            assert [mmd.get_nsvc() for mmd in mmds] == ["nodejs:10:2:c1"]
+            mock_session.get.assert_called_once()
+        finally:
+            mbs_resolver_cache.clear()
+
+    @patch("module_build_service.resolver.MBSResolver.requests_session")
+    @patch.object(
+        module_build_service.common.config.Config, "mbs_resolver_cache_size",
+        new_callable=PropertyMock, return_value=100
+    )
+    def test_prefetch_ready_modules(self, cache_size, mock_session):
+        mbs_resolver_cache.clear()
+        mock_session.get.return_value = Mock(ok=True)
+        mock_session.get.return_value.json.return_value = {
+            "items": [
+                {
+                    "name": name,
+                    "stream": "10",
+                    "version": 2,
+                    "context": "c1",
+                    "state_name": "ready",
+                    "koji_tag": "module-{}-10-2-c1".format(name),
+                    "modulemd": mmd_to_str(tests.make_module("{}:10:2:c1".format(name))),
+                }
+                for name in ["nodejs", "python"]
+            ],
+            "meta": {"next": None},
+        }
+
+        resolver = mbs_resolver.GenericResolver.create(db_session, conf, backend="mbs")
+        try:
+            resolver._prefetch_ready_modules(["python:10:2:c1", "nodejs:10:2:c1"])
+            mock_session.get.assert_called_once_with(conf.mbs_url, params={
+                "nsvc": ["nodejs:10:2:c1", "python:10:2:c1"],
+                "state": ["ready"],
+                "verbose": True,
+                "page": 1,
+                "per_page": 2,
+                "cursor": "",
+                "count": False,
+            })
+
+            for name in ["nodejs", "python"]:
+                module = resolver.get_module(name, "10", "2", "c1", strict=True)
+                assert module["koji_tag"] == "module-{}-10-2-c1".format(name)
+            mock_session.get.assert_called_once()
+        finally:
+            mbs_resolver_cache.clear()
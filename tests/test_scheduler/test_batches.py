@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import concurrent.futures
+import threading
 
 import koji
 import mock
@@ -13,7 +15,15 @@ from module_build_service.builder.KojiModuleBuilder import KojiModuleBuilder
 from module_build_service.builder.utils import validate_koji_tag
 from module_build_service.common import models
 from module_build_service.scheduler import events
-from module_build_service.scheduler.batches import start_build_component, start_next_batch_build
+from module_build_service.scheduler.batches import (
+    ComponentBuildAdmission,
+    get_building_weight,
+    get_free_concurrent_component_slots,
+    get_module_build_weights,
+    get_remaining_critical_path_weight,
+    start_build_component,
+    start_next_batch_build,
+)
 from module_build_service.scheduler.db_session import db_session
 
 
@@ -388,6 +398,130 @@ class TestBatches:
 
         assert len(events.scheduler.queue) == 0
 
+    @patch.object(conf, "num_concurrent_builds", new=1)
+    @patch("module_build_service.scheduler.batches.start_build_component")
+    def test_start_next_batch_build_concurrent_threshold(
+        self, mock_sbc, default_buildroot_groups
+    ):
+        """
+        Tests that only as many components as there are free slots for
+        concurrent component builds are submitted.
+        """
+        module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        module_build.batch = 1
+
+        builder = mock.MagicMock()
+        builder.recover_orphaned_artifact.return_value = []
+        with patch(
+            "module_build_service.scheduler.batches.get_reusable_components",
+            return_value=[None, None],
+        ):
+            start_next_batch_build(conf, module_build, builder)
+
+        assert module_build.batch == 2
+        mock_sbc.assert_called_once()
+        building = [c for c in module_build.current_batch() if c.is_building]
+        assert len(building) == 1
+        assert get_free_concurrent_component_slots(conf) == 0
+
+    @patch.object(conf, "system", new="mock")
+    @patch.object(conf, "num_concurrent_local_builds", new=3)
+    @patch("module_build_service.scheduler.batches.start_build_component")
+    def test_start_next_batch_build_local(self, mock_sbc, default_buildroot_groups):
+        """
+        Tests that the local builds start the whole batch in the threads
+        named the same way in every batch.
+        """
+        module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        module_build.batch = 1
+
+        thread_names = set()
+        mock_sbc.side_effect = lambda *args: thread_names.add(
+            threading.current_thread().name)
+
+        builder = mock.MagicMock()
+        builder.recover_orphaned_artifact.return_value = []
+        with patch(
+            "module_build_service.scheduler.batches.get_reusable_components",
+            return_value=[None, None],
+        ):
+            real_executor = concurrent.futures.ThreadPoolExecutor
+            with patch.object(
+                concurrent.futures, "ThreadPoolExecutor", wraps=real_executor
+            ) as executor:
+                start_next_batch_build(conf, module_build, builder)
+
+        assert module_build.batch == 2
+        assert mock_sbc.call_count == 2
+        executor.assert_called_once_with(max_workers=3, thread_name_prefix="mbs-build")
+        assert thread_names <= {"mbs-build_0", "mbs-build_1", "mbs-build_2"}
+
+    @pytest.mark.parametrize("num_concurrent_builds, expected", ((0, None), (5, 4)))
+    def test_get_free_concurrent_component_slots(
+        self, default_buildroot_groups, num_concurrent_builds, expected
+    ):
+        module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        module_build.component_builds[0].state = koji.BUILD_STATES["BUILDING"]
+        db_session.commit()
+
+        with patch.object(conf, "num_concurrent_builds", new=num_concurrent_builds):
+            assert get_free_concurrent_component_slots(conf) == expected
+
+    @patch.object(conf, "num_concurrent_builds_weight", new=5)
+    @patch("module_build_service.scheduler.batches.start_build_component")
+    def test_start_next_batch_build_weight_budget(self, mock_sbc, default_buildroot_groups):
+        """
+        Tests that the components are submitted heaviest first only while
+        their total weight fits into the weight budget.
+        """
+        module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        module_build.batch = 1
+        weights = {"perl-Tangerine": 4, "perl-List-Compare": 3}
+        for c in module_build.component_builds:
+            c.weight = weights.get(c.package, 1)
+        db_session.commit()
+
+        builder = mock.MagicMock()
+        builder.recover_orphaned_artifact.return_value = []
+        with patch(
+            "module_build_service.scheduler.batches.get_reusable_components",
+            return_value=[None, None],
+        ):
+            start_next_batch_build(conf, module_build, builder)
+
+        assert module_build.batch == 2
+        building = [c.package for c in module_build.current_batch() if c.is_building]
+        assert building == ["perl-Tangerine"]
+        # The weight of tangerine in batch 3 and of the heavier component in batch 2
+        assert get_remaining_critical_path_weight(module_build) == 5
+
+        weights = get_module_build_weights(db_session, [module_build.id])
+        assert weights == {module_build.id: (
+            get_building_weight(module_build), get_remaining_critical_path_weight(module_build))}
+
+    def test_component_build_admission(self):
+        components = [mock.Mock(weight=w) for w in (6, 2, 2, 1)]
+
+        # A component heavier than the whole budget is admitted when nothing is building.
+        admission = ComponentBuildAdmission(slots=3, weight_budget=5)
+        assert admission.admit(components[0])
+        assert admission.exhausted
+        assert not admission.admit(components[3])
+
+        # The module build cannot take more than its share of the budget.
+        admission = ComponentBuildAdmission(
+            slots=None, weight_budget=10, used_weight=4, module_share=3)
+        assert admission.admit(components[1])
+        assert not admission.admit(components[2])
+        assert admission.admit(components[3])
+        assert admission.used_weight == 7
+
+        # The slots are limited independently on the weight.
+        admission = ComponentBuildAdmission(slots=1)
+        assert admission.admit(components[0])
+        assert not admission.admit(components[3])
+        assert admission.exhausted
+
     def test_start_next_batch_build_repo_building(self, default_buildroot_groups):
         """
         Test that start_next_batch_build does not start new batch when
@@ -3,10 +3,12 @@
 from __future__ import absolute_import
 from collections import namedtuple
 import errno
+import hashlib
 
 import dnf
 from mock import call, Mock, patch, PropertyMock
 import pytest
+import requests
 
 from module_build_service.common.config import conf
 from module_build_service.common.errors import UnprocessableEntity
@@ -283,17 +285,23 @@ def test_handle_collisions_with_base_module_rpms(mock_grft, mock_get_session):
     mmd.set_xmd(xmd)
 
     bm_rpms = {
-        "bash-completion-1:2.7-5.el8.noarch",
-        "bash-0:4.4.19-7.el8.aarch64",
-        "python2-tools-0:2.7.16-11.el8.aarch64",
-        "python2-tools-0:2.7.16-11.el8.x86_64",
-        "python3-ldap-0:3.1.0-4.el8.aarch64",
-        "python3-ldap-0:3.1.0-4.el8.x86_64",
+        "bash-completion": {"bash-completion-1:2.7-5.el8.noarch"},
+        "bash": {"bash-0:4.4.19-7.el8.aarch64"},
+        "python2-tools": {
+            "python2-tools-0:2.7.16-11.el8.aarch64",
+            "python2-tools-0:2.7.16-11.el8.x86_64",
+        },
+        "python3-ldap": {
+            "python3-ldap-0:3.1.0-4.el8.aarch64",
+            "python3-ldap-0:3.1.0-4.el8.x86_64",
+        },
     }
     non_bm_rpms = {
-        "bash-0:4.4.20-1.el8.aarch64",
-        "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.aarch64",
-        "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.x86_64",
+        "bash": {"bash-0:4.4.20-1.el8.aarch64"},
+        "python2-tools": {
+            "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.aarch64",
+            "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.x86_64",
+        },
     }
     mock_grft.side_effect = [bm_rpms, non_bm_rpms]
 
@@ -377,8 +385,10 @@ def test_get_rpms_from_tags(mock_grier, mock_multicall_map):
         [bash_repos, python_repos],
     ]
     mock_grier.return_value = {
-        "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.aarch64",
-        "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.x86_64",
+        "python2-test": {
+            "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.aarch64",
+            "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.x86_64",
+        },
     }
 
     tags = ["module-bash", "module-python27"]
@@ -386,12 +396,18 @@ def test_get_rpms_from_tags(mock_grier, mock_multicall_map):
     rv = default_modules._get_rpms_from_tags(mock_session, tags, arches)
 
     expected = {
-        "bash-0:4.4.20-1.module+el8.1.0+123+bbd875cb.aarch64",
-        "bash-0:4.4.20-1.module+el8.1.0+123+bbd875cb.x86_64",
-        "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.aarch64",
-        "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.x86_64",
-        "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.aarch64",
-        "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.x86_64",
+        "bash": {
+            "bash-0:4.4.20-1.module+el8.1.0+123+bbd875cb.aarch64",
+            "bash-0:4.4.20-1.module+el8.1.0+123+bbd875cb.x86_64",
+        },
+        "python2-tools": {
+            "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.aarch64",
+            "python2-tools-0:2.7.18-1.module+el8.1.0+3568+bbd875cb.x86_64",
+        },
+        "python2-test": {
+            "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.aarch64",
+            "python2-test-0:2.7.16-11.module+el8.1.0+3568+bbd875cb.x86_64",
+        },
     }
     assert rv == expected
     assert mock_multicall_map.call_count == 2
@@ -433,43 +449,123 @@ def test_get_rpms_from_tags_error_getExternalRepoList(mock_multicall_map):
 
 
 @patch("dnf.Base")
-@patch("os.makedirs")
-def test_get_rpms_in_external_repo(mock_makedirs, mock_dnf_base):
+@patch("module_build_service.scheduler.default_modules._get_repomd_checksum")
+def test_get_rpms_in_external_repo(mock_get_checksum, mock_dnf_base, tmpdir):
     """
-    Test that DNF can query the external repos for the available packages.
+    Test that DNF can query the external repos for the available packages and that the repos
+    are loaded again only when their repomd.xml changes.
     """
-    RPM = namedtuple("RPM", ["arch", "epoch", "name", "release", "version"])
+    RPM = namedtuple("RPM", ["arch", "epoch", "name", "release", "version", "reponame"])
     mock_dnf_base.return_value.sack.query.return_value.available.return_value = [
-        RPM("aarch64", 0, "python", "1.el8", "2.7"),
-        RPM("aarch64", 0, "python", "1.el8", "3.7"),
-        RPM("x86_64", 0, "python", "1.el8", "2.7"),
-        RPM("x86_64", 0, "python", "1.el8", "3.7"),
-        RPM("i686", 0, "python", "1.el8", "2.7"),
-        RPM("i686", 0, "python", "1.el8", "3.7"),
+        RPM("aarch64", 0, "python", "1.el8", "2.7", "repo_aarch64"),
+        RPM("aarch64", 0, "python", "1.el8", "3.7", "repo_aarch64"),
+        RPM("x86_64", 0, "python", "1.el8", "2.7", "repo_x86_64"),
+        RPM("x86_64", 0, "python", "1.el8", "3.7", "repo_x86_64"),
+        RPM("i686", 0, "python", "1.el8", "2.7", "repo_i386"),
+        RPM("i686", 0, "python", "1.el8", "3.7", "repo_i386"),
+        RPM("noarch", 0, "python-docs", "1.el8", "3.7", "repo_x86_64"),
     ]
+    mock_get_checksum.side_effect = lambda url: "checksum-" + url
 
     external_repo_url = "http://domain.local/repo/latest/$arch/"
     arches = ["aarch64", "x86_64", "i686"]
     cache_dir_name = "module-el-build-12"
-    rv = default_modules._get_rpms_in_external_repo(external_repo_url, arches, cache_dir_name)
+    with patch.object(conf, "cache_dir", new=str(tmpdir)):
+        rv = default_modules._get_rpms_in_external_repo(external_repo_url, arches, cache_dir_name)
+
+        expected = {
+            "python": {
+                "python-0:2.7-1.el8.aarch64",
+                "python-0:3.7-1.el8.aarch64",
+                "python-0:2.7-1.el8.x86_64",
+                "python-0:3.7-1.el8.x86_64",
+                "python-0:2.7-1.el8.i686",
+                "python-0:3.7-1.el8.i686",
+            },
+            "python-docs": {"python-docs-0:3.7-1.el8.noarch"},
+        }
+        assert rv == expected
+        mock_get_checksum.assert_has_calls([
+            call("http://domain.local/repo/latest/aarch64/"),
+            call("http://domain.local/repo/latest/x86_64/"),
+            call("http://domain.local/repo/latest/i386/"),
+        ])
+
+        # Test that i686 is mapped to i386 using the koji.canonArch().
+        mock_dnf_base.return_value.repos.add_new_repo.assert_any_call(
+            "repo_i386",
+            mock_dnf_base.return_value.conf,
+            baseurl=["http://domain.local/repo/latest/i386/"],
+            minrate=conf.dnf_minrate,
+        )
 
-    expected = {
+        # The unchanged repos are not loaded again
+        mock_dnf_base.reset_mock()
+        rv = default_modules._get_rpms_in_external_repo(external_repo_url, arches, cache_dir_name)
+        assert rv == expected
+        mock_dnf_base.assert_not_called()
+
+        # Only the changed repo is loaded again
+        mock_get_checksum.side_effect = lambda url: ("new-" if "i386" in url else "") + (
+            "checksum-" + url)
+        mock_dnf_base.return_value.sack.query.return_value.available.return_value = [
+            RPM("i686", 0, "python", "2.el8", "3.7", "repo_i386"),
+        ]
+        rv = default_modules._get_rpms_in_external_repo(external_repo_url, arches, cache_dir_name)
+        mock_dnf_base.return_value.repos.add_new_repo.assert_called_once_with(
+            "repo_i386",
+            mock_dnf_base.return_value.conf,
+            baseurl=["http://domain.local/repo/latest/i386/"],
+            minrate=conf.dnf_minrate,
+        )
+
+    assert rv["python"] == {
         "python-0:2.7-1.el8.aarch64",
         "python-0:3.7-1.el8.aarch64",
         "python-0:2.7-1.el8.x86_64",
         "python-0:3.7-1.el8.x86_64",
-        "python-0:2.7-1.el8.i686",
-        "python-0:3.7-1.el8.i686",
+        "python-0:3.7-2.el8.i686",
     }
-    assert rv == expected
 
-    # Test that i686 is mapped to i386 using the koji.canonArch().
-    mock_dnf_base.return_value.repos.add_new_repo.assert_called_with(
-        "repo_i386",
-        mock_dnf_base.return_value.conf,
-        baseurl=["http://domain.local/repo/latest/i386/"],
-        minrate=conf.dnf_minrate,
-    )
+
+@patch("dnf.Base")
+@patch("module_build_service.scheduler.default_modules._get_repomd_checksum", return_value=None)
+def test_get_rpms_in_external_repo_unknown_checksum(mock_get_checksum, mock_dnf_base, tmpdir):
+    """
+    Test that the external repo is loaded by DNF every time when its repomd.xml can't be read.
+    """
+    RPM = namedtuple("RPM", ["arch", "epoch", "name", "release", "version", "reponame"])
+    mock_dnf_base.return_value.sack.query.return_value.available.return_value = [
+        RPM("x86_64", 0, "python", "1.el8", "3.7", "repo_x86_64"),
+    ]
+
+    external_repo_url = "http://domain.local/repo/latest/$arch/"
+    cache_dir_name = "module-el-build-12"
+    with patch.object(conf, "cache_dir", new=str(tmpdir)):
+        for _ in range(2):
+            rv = default_modules._get_rpms_in_external_repo(
+                external_repo_url, ["x86_64"], cache_dir_name)
+            assert rv == {"python": {"python-0:3.7-1.el8.x86_64"}}
+
+    assert mock_dnf_base.call_count == 2
+    assert not tmpdir.join("dnf", cache_dir_name, "rpms-x86_64.json").check()
+
+
+@patch("requests.get")
+def test_get_repomd_checksum(mock_get, tmpdir):
+    """
+    Test that the repomd.xml of the local repos is read from the disk and that the checksum is
+    None when the repomd.xml can't be downloaded.
+    """
+    tmpdir.join("repodata", "repomd.xml").write("<repomd/>", ensure=True)
+    expected = hashlib.sha256(b"<repomd/>").hexdigest()
+    assert default_modules._get_repomd_checksum("file://{}/".format(tmpdir)) == expected
+    mock_get.assert_not_called()
+
+    mock_get.side_effect = requests.exceptions.ConnectionError("No route to host")
+    assert default_modules._get_repomd_checksum("http://domain.local/repo/x86_64/") is None
+    mock_get.assert_called_once_with(
+        "http://domain.local/repo/x86_64/repodata/repomd.xml", timeout=conf.dnf_timeout)
 
 
 def test_get_rpms_in_external_repo_invalid_repo_url():
@@ -487,8 +583,9 @@ def test_get_rpms_in_external_repo_invalid_repo_url():
 
 
 @patch("dnf.Base")
+@patch("module_build_service.scheduler.default_modules._get_repomd_checksum")
 @patch("os.makedirs")
-def test_get_rpms_in_external_repo_failed_to_load(mock_makedirs, mock_dnf_base):
+def test_get_rpms_in_external_repo_failed_to_load(mock_makedirs, mock_get_checksum, mock_dnf_base):
     """
     Test that an exception is raised when an external repo can't be loaded.
     """
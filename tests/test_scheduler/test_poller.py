@@ -181,6 +181,47 @@ class TestPoller:
         assert not koji_session.newRepo.called
         assert module_build.new_repo_task_id == 123456
 
+    @patch.object(conf, "system", new="koji")
+    @patch("module_build_service.scheduler.producer.build_task_finalize")
+    @patch("koji.ClientSession")
+    def test_fail_lost_builds(self, ClientSession, build_task_finalize, create_builder, dbg):
+        """
+        Tests that fail_lost_builds queries Koji using multicalls and finalizes
+        the component builds of finished tasks.
+        """
+        module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        for component in module_build.component_builds:
+            if component.package == "module-build-macros":
+                continue
+            component.state = koji.BUILD_STATES["BUILDING"]
+            if component.package == "perl-Tangerine":
+                component.task_id = 1001
+            elif component.package == "perl-List-Compare":
+                component.task_id = 1002
+        db_session.commit()
+
+        koji_session = ClientSession.return_value
+        koji_session.multiCall.side_effect = [
+            # getTaskInfo of tasks 1001 and 1002
+            [[{"state": koji.TASK_STATES["CLOSED"]}], [{"state": koji.TASK_STATES["OPEN"]}]],
+            # listBuilds of the closed task 1001
+            [[[{"version": "0.23", "release": "1.module+f28"}]]],
+        ]
+
+        producer.fail_lost_builds()
+
+        assert koji_session.multiCall.call_count == 2
+        koji_session.getTaskInfo.assert_has_calls([call(1001), call(1002)])
+        koji_session.listBuilds.assert_called_once_with(taskID=1001)
+        build_task_finalize.delay.assert_called_once_with(
+            msg_id="producer::fail_lost_builds fake msg",
+            task_id=1001,
+            build_new_state=koji.BUILD_STATES["COMPLETE"],
+            build_name="perl-Tangerine",
+            build_release="1.module+f28",
+            build_version="0.23",
+        )
+
     def test_process_paused_module_builds_waiting_for_repo(self, create_builder, dbg):
         """
         Tests that process_paused_module_builds does not start new batch
@@ -10,7 +10,9 @@ from module_build_service.common import models
 from module_build_service.common.modulemd import Modulemd
 from module_build_service.common.utils import import_mmd, load_mmd, mmd_to_str
 from module_build_service.scheduler.db_session import db_session
-from module_build_service.scheduler.reuse import get_reusable_component, get_reusable_module
+from module_build_service.scheduler.reuse import (
+    get_reusable_component, get_reusable_components, get_reusable_module
+)
 from tests import clean_database, read_staged_data
 
 
@@ -58,6 +60,23 @@ class TestUtilsComponentReuse:
             assert pt_rv.package == "perl-Tangerine"
             assert tangerine_rv.package == "tangerine"
 
+    @mock.patch("module_build_service.common.models.ComponentBuild.from_component_name")
+    def test_get_reusable_components_whole_batch(self, from_component_name):
+        second_module_build = models.ModuleBuild.get_by_id(db_session, 3)
+        changed_component = [
+            c for c in second_module_build.component_builds if c.package == "perl-List-Compare"
+        ][0]
+        changed_component.ref = "00ea1da4192a2030f9ae023de3b3143ed647bbab"
+        db_session.commit()
+
+        names = ["perl-List-Compare", "perl-Tangerine", "tangerine"]
+        rv = get_reusable_components(second_module_build, names)
+
+        assert [c.package if c else None for c in rv] == [None, "perl-Tangerine", None]
+        assert rv == [get_reusable_component(second_module_build, name) for name in names]
+        # The components are taken from the already loaded module builds.
+        from_component_name.assert_not_called()
+
     def test_get_reusable_component_different_rpm_macros(self):
         second_module_build = models.ModuleBuild.get_by_id(db_session, 3)
         mmd = second_module_build.mmd()
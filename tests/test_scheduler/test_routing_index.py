@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# SPDX-License-Identifier: MIT
+from __future__ import absolute_import
+
+import mock
+
+from module_build_service.common import models
+from module_build_service.scheduler.consumer import MBSConsumer
+from module_build_service.scheduler.db_session import db_session
+from module_build_service.scheduler.routing_index import routing_index
+from tests import scheduler_init_data
+
+TAG = "module-testmodule-master-20170109091357-7c29193d"
+
+
+class TestRoutingIndex:
+    def setup_method(self, test_method):
+        scheduler_init_data()
+
+    def test_lookup_by_task_id_is_cached(self):
+        routing_index.clear()
+        assert routing_index.get_module_build_id_by_task_id(db_session, 90276228) == 2
+
+        with mock.patch.object(models.ComponentBuild, "from_component_event") as from_event:
+            assert routing_index.get_module_build_id_by_task_id(db_session, 90276228) == 2
+            from_event.assert_not_called()
+
+        assert routing_index.get_module_build_id_by_task_id(db_session, 123456) is None
+
+    def test_lookup_by_tag(self):
+        routing_index.clear()
+        assert routing_index.get_module_build_id_by_tag(db_session, TAG + "-build") == 2
+
+        with mock.patch.object(models.ModuleBuild, "get_by_tag") as get_by_tag:
+            assert routing_index.get_module_build_id_by_tag(db_session, TAG) == 2
+            get_by_tag.assert_not_called()
+
+    def test_index_updated_on_flush(self):
+        module_build = models.ModuleBuild.get_by_id(db_session, 2)
+        component_build = module_build.component_builds[0]
+        component_build.task_id = 424242
+        db_session.commit()
+
+        with mock.patch.object(models.ComponentBuild, "from_component_event") as from_event:
+            assert routing_index.get_module_build_id_by_task_id(db_session, 424242) == 2
+            from_event.assert_not_called()
+
+        module_build.state = models.BUILD_STATES["failed"]
+        db_session.commit()
+        assert routing_index.get_module_build_id_by_tag(db_session, TAG) is None
+
+    def test_index_not_updated_on_rollback(self):
+        module_build = models.ModuleBuild.get_by_id(db_session, 2)
+        module_build.component_builds[0].task_id = 515151
+        db_session.flush()
+        db_session.rollback()
+
+        with mock.patch.object(
+            models.ComponentBuild, "from_component_event", return_value=None
+        ) as from_event:
+            assert routing_index.get_module_build_id_by_task_id(db_session, 515151) is None
+            from_event.assert_called_once()
+
+    def test_tag_of_module_build_not_in_build_state_is_unrouted(self):
+        routing_index.add_tag(TAG, 2)
+        # The state is changed by another process, so the index is not updated.
+        db_session.execute(
+            models.ModuleBuild.__table__.update()
+            .where(models.ModuleBuild.id == 2)
+            .values(state=models.BUILD_STATES["done"])
+        )
+        db_session.commit()
+
+        assert routing_index.get_module_build_id_by_tag(db_session, TAG) == 2
+        assert MBSConsumer._get_building_module_build(db_session, TAG) is None
+
+    @mock.patch("koji.ClientSession")
+    def test_lookup_by_nvr_is_cached(self, ClientSession):
+        ClientSession.return_value.getBuild.return_value = {
+            "extra": {"typeinfo": {"module": {"module_build_service_id": 2}}}
+        }
+        nvr = "testmodule-master-20170109091357.7c29193d"
+        assert routing_index.get_module_build_id_by_nvr(nvr) == 2
+        assert routing_index.get_module_build_id_by_nvr(nvr) == 2
+        ClientSession.return_value.getBuild.assert_called_once_with(nvr)
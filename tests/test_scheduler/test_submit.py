@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
 from datetime import datetime
+import threading
 
 import mock
 import pytest
@@ -10,6 +11,7 @@ from module_build_service import app
 from module_build_service.common import conf, models
 from module_build_service.common.errors import UnprocessableEntity
 from module_build_service.common.modulemd import Modulemd
+from module_build_service.common.scm import SCMExecutor
 from module_build_service.common.utils import load_mmd, load_mmd_file, mmd_to_str
 from module_build_service.scheduler.db_session import db_session
 import module_build_service.scheduler.handlers.components
@@ -357,21 +359,30 @@ class TestSubmit:
                 assert set(pkg.get_arches()) == set(test_archs)
 
     @mock.patch("module_build_service.common.scm.SCM")
-    @mock.patch("module_build_service.scheduler.submit.ThreadPool")
-    def test_format_mmd_update_time_modified(self, tp, mocked_scm):
+    @mock.patch.object(SCMExecutor, "progress_interval", new=0.01)
+    def test_format_mmd_update_time_modified(self, mocked_scm):
         init_data()
         build = models.ModuleBuild.get_by_id(db_session, 2)
 
-        async_result = mock.MagicMock()
-        async_result.ready.side_effect = [False, False, False, True]
-        tp.return_value.map_async.return_value = async_result
+        progress_reported = threading.Event()
+
+        def mocked_get_latest(ref="master"):
+            # Do not finish before the progress is reported.
+            progress_reported.wait(10)
+            return "fbed359411a1baa08d4a88e0d12d426fbf8f602c"
+
+        mocked_scm.return_value.get_latest = mocked_get_latest
 
         test_datetime = datetime(2019, 2, 14, 11, 11, 45, 42968)
 
+        def mocked_utcnow():
+            progress_reported.set()
+            return test_datetime
+
         mmd = load_mmd(read_staged_data("testmodule"))
 
         with mock.patch("module_build_service.scheduler.submit.datetime") as dt:
-            dt.utcnow.return_value = test_datetime
+            dt.utcnow.side_effect = mocked_utcnow
             format_mmd(mmd, None, build, db_session)
 
         assert build.time_modified == test_datetime
@@ -3,10 +3,14 @@
 from __future__ import absolute_import
 import collections
 
+from mock import patch, PropertyMock
 import pytest
 import solv
 
-from module_build_service.web.mmd_resolver import MMDResolver
+import module_build_service.common.config as mbs_config
+from module_build_service.common.errors import UnprocessableEntity
+from module_build_service.common.models import ModuleBuild, BUILD_STATES
+from module_build_service.web.mmd_resolver import MMDResolver, module_solvable_data_cache
 from tests import make_module
 
 
@@ -426,3 +430,75 @@ class TestMMDResolver:
         ns = nsvc.rsplit(":", 2)[0]
         provides = self.mmd_resolver.solvables[ns][0].lookup_deparray(solv.SOLVABLE_PROVIDES)
         assert {str(provide) for provide in provides} == expected
+
+    @patch.object(
+        mbs_config.Config, "mmd_resolver_cache_size", new_callable=PropertyMock, return_value=100
+    )
+    def test_module_solvable_data_cached(self, cache_size):
+        module_solvable_data_cache.clear()
+        mmd = make_module("platform:f28:3:c0")
+        try:
+            self.mmd_resolver.add_modules(mmd)
+            assert len(module_solvable_data_cache) == 1
+
+            # Another resolver reuses the data of the module
+            mmd_resolver = MMDResolver()
+            with patch.object(MMDResolver, "_get_module_solvable_data") as get_data:
+                mmd_resolver.add_modules(mmd)
+                get_data.assert_not_called()
+            provides = mmd_resolver.solvables["platform:f28"][0].lookup_deparray(
+                solv.SOLVABLE_PROVIDES)
+            assert {str(provide) for provide in provides} == {
+                "module(platform)", "module(platform:f28) = 28.0"}
+
+            # A change of a module build of the same name drops the data
+            module_build = ModuleBuild(name="platform")
+            module_build.state = BUILD_STATES["garbage"]
+            assert len(module_solvable_data_cache) == 0
+        finally:
+            module_solvable_data_cache.clear()
+
+    @patch("module_build_service.web.mmd_resolver.mmd_resolver_combinations_pruned_counter")
+    @patch("module_build_service.web.mmd_resolver.mmd_resolver_combinations_solved_counter")
+    def test_solve_skips_older_combinations(self, solved_counter, pruned_counter):
+        modules = (
+            ("platform:f28:0:c0", []),
+            ("gtk:3:0:c8", [{"requires": {"platform": ["f28"]}}]),
+            ("gtk:3:1:c8", [{"requires": {"platform": ["f28"]}}]),
+            ("gtk:3:2:c8", [{"requires": {"platform": ["f28"]}}]),
+        )
+        for nsvc, deps in modules:
+            self.mmd_resolver.add_modules(make_module(nsvc, dependencies=deps))
+
+        app = make_module("app:1:0", dependencies=[
+            {"buildrequires": {"platform": ["f28"], "gtk": ["3"]}}
+        ])
+        expanded = self.mmd_resolver.solve(app)
+
+        assert expanded == {
+            frozenset(["gtk:3:2:c8:x86_64", "app:1:0:0:src", "platform:f28:0:c0:x86_64"]),
+        }
+        # The older gtk:3 builds cannot result in a better transaction
+        solved_counter.inc.assert_called_once_with(1)
+        pruned_counter.inc.assert_called_once_with(2)
+
+    @patch.object(
+        mbs_config.Config, "mmd_resolver_max_combinations",
+        new_callable=PropertyMock, return_value=3
+    )
+    def test_solve_too_many_combinations(self, max_combinations):
+        modules = (
+            ("platform:f28:0:c0", []),
+            ("gtk:3:0:c8", [{"requires": {"platform": ["f28"]}}]),
+            ("gtk:4:0:c8", [{"requires": {"platform": ["f28"]}}]),
+            ("qt:4:0:c8", [{"requires": {"platform": ["f28"]}}]),
+            ("qt:5:0:c8", [{"requires": {"platform": ["f28"]}}]),
+        )
+        for nsvc, deps in modules:
+            self.mmd_resolver.add_modules(make_module(nsvc, dependencies=deps))
+
+        app = make_module("app:1:0", dependencies=[
+            {"buildrequires": {"platform": ["f28"], "gtk": [], "qt": []}}
+        ])
+        with pytest.raises(UnprocessableEntity, match="would need to check 4 combinations"):
+            self.mmd_resolver.solve(app)
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 # SPDX-License-Identifier: MIT
 from __future__ import absolute_import
+import threading
 
+from mock import Mock, patch, PropertyMock
 import pytest
 
+from module_build_service.common import conf
+import module_build_service.common.config as mbs_config
 from module_build_service.common.errors import StreamAmbigous
+from module_build_service.common.models import ModuleBuild
+from module_build_service.resolver import GenericResolver
 from module_build_service.scheduler.db_session import db_session
 from module_build_service.web.mse import (
     expand_mse_streams, generate_expanded_mmds, get_mmds_required_by_module_recursively
@@ -424,6 +430,55 @@ class TestModuleStreamExpansion:
         nsvcs = self._get_mmds_required_by_module_recursively(module_build, db_session)
         assert set(nsvcs) == set(expected)
 
+    @patch.object(
+        mbs_config.Config, "num_threads_for_requires_resolution",
+        new_callable=PropertyMock, return_value=4
+    )
+    def test_get_required_modules_concurrently(self, num_threads):
+        module_build = make_module_in_db("app:1:0:c1", [{
+            "requires": {},
+            "buildrequires": {"platform": [], "gtk": ["1"], "foo": ["1"]},
+        }])
+        self._generate_default_modules_recursion()
+
+        # The resolvers of the worker threads must not use the database session
+        # of this thread, so the module metadata are resolved in advance.
+        resolver = GenericResolver.create(db_session, conf)
+        platform_mmd = ModuleBuild.get_build_from_nsvc(
+            db_session, "platform", "f29", "0", "c11").mmd()
+        resolved = {
+            (name, stream): resolver.get_buildrequired_modulemds(name, stream, platform_mmd)
+            for name, stream in [("gtk", "1"), ("foo", "1"), ("bar", "1"), ("lorem", "1"),
+                                 ("base", "f29")]
+        }
+        calls = []
+        threads = set()
+
+        def get_buildrequired_modulemds(name, stream, base_module_mmd):
+            calls.append((name, stream))
+            threads.add(threading.current_thread().ident)
+            return resolved[(name, stream)]
+
+        threaded_resolver = Mock()
+        threaded_resolver.get_buildrequired_modulemds.side_effect = get_buildrequired_modulemds
+        with patch("module_build_service.web.mse.GenericResolver.create",
+                   return_value=threaded_resolver):
+            nsvcs = self._get_mmds_required_by_module_recursively(module_build, db_session)
+
+        assert set(nsvcs) == {
+            "foo:1:1:c2",
+            "base:f29:0:c3",
+            "platform:f29:0:c11",
+            "bar:1:1:c2",
+            "gtk:1:1:c2",
+            "lorem:1:1:c2",
+        }
+        # Every name:stream is resolved just once, although foo:1 is both
+        # buildrequired and required by gtk:1.
+        assert sorted(calls) == sorted(resolved.keys())
+        # The levels with multiple name:streams are resolved by the worker threads
+        assert threads - {threading.current_thread().ident}
+
     def _generate_default_modules_modules_multiple_stream_versions(self):
         """
         Generates the gtk:1 module requiring foo:1 module requiring bar:1
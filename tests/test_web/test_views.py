@@ -19,6 +19,7 @@ from sqlalchemy.orm import load_only
 
 from module_build_service import app, version
 from module_build_service.builder.utils import get_rpm_release
+from module_build_service.common import conf
 import module_build_service.common.config as mbs_config
 from module_build_service.common.errors import UnprocessableEntity
 from module_build_service.common.models import ModuleBuild, BUILD_STATES, ComponentBuild
@@ -271,6 +272,131 @@ class TestViews:
         assert meta_data["pages"] == 4
         assert meta_data["page"] == 2
 
+    def _get_all_pages_by_cursor(self, url):
+        ids = []
+        metas = []
+        while url:
+            rv = self.client.get(url)
+            data = json.loads(rv.data)
+            ids.extend(item["id"] for item in data["items"])
+            metas.append(data["meta"])
+            url = data["meta"]["next"]
+        return ids, metas
+
+    def test_pagination_cursor(self):
+        ids, metas = self._get_all_pages_by_cursor(
+            "/module-build-service/1/module-builds/?per_page=2&cursor=")
+        assert ids == [7, 6, 5, 4, 3, 2, 1]
+        assert len(metas) == 4
+        assert all(meta["total"] == 7 for meta in metas)
+        assert all(meta["next_cursor"] for meta in metas[:-1])
+        assert metas[-1]["next_cursor"] is None
+        assert "cursor=" + metas[0]["next_cursor"] in metas[0]["next"]
+        assert "page" not in metas[0]
+
+    @pytest.mark.parametrize("order", ("order_by", "order_desc_by"))
+    @pytest.mark.parametrize("column", ("time_completed", "version", "name"))
+    def test_pagination_cursor_order(self, order, column):
+        url = "/module-build-service/1/module-builds/?per_page={}&{}={}&cursor=&count=false"
+        rv = self.client.get(url.format(10, order, column))
+        expected = [item["id"] for item in json.loads(rv.data)["items"]]
+
+        ids, metas = self._get_all_pages_by_cursor(url.format(3, order, column))
+        assert ids == expected
+        assert sorted(ids) == list(range(1, 8))
+        assert all(meta["total"] is None for meta in metas)
+
+    def test_pagination_cursor_component_builds(self):
+        url = "/module-build-service/1/component-builds/?order_by=package&order_by=id"
+        ids, _ = self._get_all_pages_by_cursor(url + "&per_page=5&cursor=")
+        rv = self.client.get(url + "&per_page=100")
+        assert ids == [item["id"] for item in json.loads(rv.data)["items"]]
+
+    def test_pagination_invalid_cursor(self):
+        rv = self.client.get("/module-build-service/1/module-builds/?cursor=invalid")
+        assert rv.status_code == 400
+        assert "invalid cursor" in json.loads(rv.data)["message"]
+
+    @pytest.mark.parametrize("args", ("", "verbose=true&", "short=true&", "name=nginx&"))
+    @patch("module_build_service.web.views.ModuleBuildExportAPI.chunk_size", new=2)
+    def test_export_module_builds(self, args):
+        rv = self.client.get("/module-build-service/1/module-builds/export/?" + args)
+        assert rv.status_code == 200
+        assert rv.mimetype == "application/x-ndjson"
+        exported = [json.loads(line) for line in rv.data.decode("utf-8").splitlines()]
+
+        rv = self.client.get("/module-build-service/1/module-builds/?per_page=100&" + args)
+        assert exported == json.loads(rv.data)["items"]
+        assert exported
+
+    def test_export_module_builds_invalid_filter(self):
+        rv = self.client.get("/module-build-service/1/module-builds/export/?order_by=unknown")
+        assert rv.status_code == 400
+
+    def test_query_build_conditional_get(self):
+        url = "/module-build-service/1/module-builds/2"
+        rv = self.client.get(url)
+        assert rv.status_code == 200
+        etag = rv.headers["ETag"]
+        last_modified = rv.headers["Last-Modified"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+        assert rv.data == b""
+        assert rv.headers["ETag"] == etag
+
+        rv = self.client.get(url, headers={"If-Modified-Since": last_modified})
+        assert rv.status_code == 304
+
+        # A different representation of the same module build has a different ETag
+        rv = self.client.get(url + "?verbose=true", headers={"If-None-Match": etag})
+        assert rv.status_code == 200
+        assert rv.headers["ETag"] != etag
+
+        module_build = ModuleBuild.get_by_id(db_session, 2)
+        module_build.state_reason = "Changed"
+        module_build.time_modified = datetime(2030, 1, 1)
+        db_session.commit()
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 200
+        assert json.loads(rv.data)["state_reason"] == "Changed"
+        rv = self.client.get(url, headers={"If-Modified-Since": last_modified})
+        assert rv.status_code == 200
+
+    def test_query_builds_conditional_get(self):
+        url = "/module-build-service/1/module-builds/?per_page=2"
+        rv = self.client.get(url)
+        etag = rv.headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+
+        rv = self.client.get(url + "&page=2", headers={"If-None-Match": etag})
+        assert rv.status_code == 200
+
+        component_build = db_session.query(ComponentBuild).filter_by(module_id=7).first()
+        component_build.state = koji.BUILD_STATES["FAILED"]
+        db_session.commit()
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 200
+
+    def test_query_component_build_conditional_get(self):
+        url = "/module-build-service/1/component-builds/1"
+        rv = self.client.get(url)
+        etag = rv.headers["ETag"]
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+
+        component_build = db_session.query(ComponentBuild).get(1)
+        component_build.state_reason = "Changed"
+        db_session.commit()
+
+        rv = self.client.get(url, headers={"If-None-Match": etag})
+        assert rv.status_code == 200
+
     def test_query_builds(self):
         rv = self.client.get("/module-build-service/1/module-builds/?per_page=2")
         items = json.loads(rv.data)["items"]
@@ -454,6 +580,15 @@ class TestViews:
                 for key, part in zip(nsvc_keys, nsvc_parts):
                     assert item[key] == part
 
+    def test_query_builds_with_multiple_nsvcs(self):
+        rv = self.client.get(
+            "/module-build-service/1/module-builds/?nsvc=nginx:1:2:00000000"
+            "&nsvc=testmodule:4.3.43:7&nsvc=unknown:1&order_by=id"
+        )
+        items = json.loads(rv.data)["items"]
+        assert [(item["name"], item["stream"]) for item in items] == [
+            ("nginx", "1"), ("testmodule", "4.3.43")]
+
     @pytest.mark.usefixtures("reuse_component_init_data")
     @patch("koji.ClientSession")
     def test_query_builds_with_binary_rpm(self, ClientSession):
@@ -1746,6 +1881,57 @@ class TestViews:
         assert rv.status_code == 200
         assert data == {"auth_method": "kerberos", "api_version": 2, "version": version}
 
+    @patch.object(mbs_config.Config, "response_cache_ttl", new_callable=PropertyMock)
+    @patch.object(mbs_config.Config, "response_cache_size", new_callable=PropertyMock)
+    def test_query_builds_response_cache(self, cache_size, cache_ttl):
+        cache_size.return_value = 100
+        cache_ttl.return_value = 60
+        nginx_url = "/module-build-service/1/module-builds/?name=nginx&order_by=id&short=true"
+        testmodule_url = "/module-build-service/1/module-builds/?name=testmodule&short=true"
+        query_filter = "module_build_service.web.views.ModuleBuildAPI.query_filter"
+
+        rv = self.client.get(nginx_url)
+        etag = rv.headers["ETag"]
+        assert json.loads(rv.data)["items"][0]["state_name"] == "ready"
+        testmodule_items = json.loads(self.client.get(testmodule_url).data)["items"]
+
+        # The cached response is returned, as the module build has not changed its state.
+        # The query arguments are normalized.
+        with patch(query_filter) as mock_query_filter:
+            rv = self.client.get(
+                "/module-build-service/1/module-builds/?short=true&order_by=id&name=nginx")
+            mock_query_filter.assert_not_called()
+        assert rv.status_code == 200
+        assert rv.headers["Access-Control-Allow-Origin"] == "*"
+        assert json.loads(rv.data)["items"][0]["state_name"] == "ready"
+        rv = self.client.get(nginx_url, headers={"If-None-Match": etag})
+        assert rv.status_code == 304
+
+        module_build = ModuleBuild.get_by_id(db_session, 2)
+        module_build.transition(db_session, conf, BUILD_STATES["failed"], "Failed")
+        db_session.commit()
+
+        rv = self.client.get(nginx_url)
+        assert json.loads(rv.data)["items"][0]["state_name"] == "failed"
+        with patch(query_filter) as mock_query_filter:
+            rv = self.client.get(testmodule_url)
+            mock_query_filter.assert_not_called()
+        assert json.loads(rv.data)["items"] == testmodule_items
+
+    @pytest.mark.parametrize("args", ("", "short=false&", "short=true&verbose=true&"))
+    @patch.object(mbs_config.Config, "response_cache_ttl", new=60)
+    @patch.object(mbs_config.Config, "response_cache_size", new=100)
+    def test_query_builds_response_cache_skipped(self, args):
+        url = "/module-build-service/1/module-builds/?" + args + "name=nginx"
+        self.client.get(url)
+        with patch.object(
+            module_build_service.web.views.ModuleBuildAPI, "query_filter",
+            wraps=module_build_service.web.views.ModuleBuildAPI.query_filter,
+        ) as query_filter:
+            rv = self.client.get(url)
+            query_filter.assert_called_once()
+        assert rv.status_code == 200
+
     def test_rebuild_strategy_api(self):
         rv = self.client.get("/module-build-service/1/rebuild-strategies/")
         data = json.loads(rv.data)